@@ -0,0 +1,13 @@
+from celery import shared_task
+from django.db.models import F
+
+
+@shared_task(name='apps.accounts.tasks.credit_loyalty_points')
+def credit_loyalty_points(user_id, points):
+    """افزودن امتیاز وفاداری تجمیع‌شده چند سفارش تحویل‌شده یک کاربر"""
+    from .models import UserProfile
+
+    updated = UserProfile.objects.filter(user_id=user_id).update(loyalty_points=F('loyalty_points') + points)
+    if not updated:
+        UserProfile.objects.create(user_id=user_id, loyalty_points=points)
+    return points
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
 
@@ -36,7 +37,8 @@ class ProductView(models.Model):
     session_id = models.CharField(_('شناسه نشست'), max_length=100)
     ip_address = models.GenericIPAddressField(_('آدرس IP'))
     referrer = models.URLField(_('ارجاع‌دهنده'), blank=True, null=True)
-    created_at = models.DateTimeField(_('تاریخ بازدید'), auto_now_add=True)
+    # بازدیدها با تاخیر از بافر درج می‌شوند؛ زمان واقعی بازدید باید حفظ شود
+    created_at = models.DateTimeField(_('تاریخ بازدید'), default=timezone.now, editable=False)
     
     class Meta:
         verbose_name = _('بازدید محصول')
@@ -3,6 +3,7 @@ from .models import (
     PageView, ProductView, SearchQuery, CartEvent,
     UserActivity, SalesReport, ProductPerformance
 )
+from .view_buffer import record_product_view
 
 
 class PageViewSerializer(serializers.ModelSerializer):
@@ -165,20 +166,19 @@ class TrackProductViewSerializer(serializers.Serializer):
         ip_address = self._get_client_ip(request)
         
         from apps.products.models import Product
-        try:
-            product = Product.objects.get(id=validated_data['product_id'])
-        except Product.DoesNotExist:
+        if not Product.objects.filter(id=validated_data['product_id']).exists():
             raise serializers.ValidationError('محصول مورد نظر یافت نشد')
         
-        product_view = ProductView.objects.create(
-            product=product,
-            user=user,
+        # ردیف بازدید در بافر ثبت و به صورت گروهی درج می‌شود
+        record_product_view(
+            product_id=validated_data['product_id'],
+            user_id=user.pk if user else None,
             session_id=session_id,
             ip_address=ip_address,
             referrer=validated_data.get('referrer')
         )
         
-        return product_view
+        return validated_data
     
     def _get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from .view_buffer import flush_view_buffer as _flush_view_buffer
+
+
+@shared_task(name='apps.analytics.tasks.flush_view_buffer')
+def flush_view_buffer():
+    """اعمال دوره‌ای بافر شمارنده بازدید محصولات در پایگاه داده"""
+    products, views = _flush_view_buffer()
+    return {'products': products, 'views': views}
@@ -1,3 +1,49 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.common.testing import CatalogTestMixin
+from .models import ProductView
+from .view_buffer import _local_buffer, flush_view_buffer
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    VIEW_BUFFER_FLUSH_INTERVAL=3600,
+)
+class ViewBufferTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = cls.create_product('plate', name='بشقاب', view_count=10)
+
+    def setUp(self):
+        _local_buffer.take()
+        self.client = APIClient()
+
+    def test_increments_are_buffered_and_flushed_in_bulk(self):
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post('/api/products/products/plate/increment_view/')
+            self.assertFalse(any('UPDATE' in query['sql'] for query in ctx.captured_queries))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.view_count, 10)
+        self.assertEqual(self.client.get('/api/products/products/plate/').data['view_count'], 13)
+
+        self.assertEqual(flush_view_buffer(), (1, 0))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.view_count, 13)
+        self.assertEqual(self.client.get('/api/products/products/plate/').data['view_count'], 13)
+
+    def test_tracked_views_are_bulk_inserted_with_original_time(self):
+        response = self.client.post('/api/analytics/track/product-view/', {'product_id': self.product.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(ProductView.objects.exists())
+
+        recorded_at = _local_buffer._rows[0]['created_at']
+        self.assertEqual(flush_view_buffer(), (0, 1))
+        view = ProductView.objects.get()
+        self.assertEqual(view.product_id, self.product.id)
+        self.assertEqual(view.created_at.isoformat(), recorded_at)
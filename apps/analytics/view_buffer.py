@@ -0,0 +1,241 @@
+"""
+بافر شمارنده بازدید محصولات
+
+به جای یک UPDATE روی Product.view_count و یک INSERT در ProductView به ازای هر
+بازدید، افزایش شمارنده‌ها و ردیف‌های بازدید در بافر جمع می‌شوند و flush_view_buffer
+آن‌ها را به صورت گروهی (یک UPDATE برای هر دسته از محصولات و یک bulk_create) اعمال
+می‌کند. این کار قفل ردیف محصولات پربازدید را از مسیر درخواست حذف می‌کند.
+
+اگر کش پیش‌فرض django-redis باشد، بافر در hash و list ردیس نگهداری می‌شود و تسک
+دوره‌ای Celery آن را تخلیه می‌کند؛ در غیر این صورت بافر درون‌پردازه‌ای است و هر
+پردازه پس از VIEW_BUFFER_FLUSH_INTERVAL ثانیه یا VIEW_BUFFER_MAX_PENDING مورد، بافر
+خود را در همان درخواست تخلیه می‌کند.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+class LocalViewBuffer:
+    """بافر درون‌پردازه‌ای؛ تعویض بافر با قفل انجام می‌شود تا تخلیه اتمیک باشد"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._rows = []
+        self._last_flush = time.monotonic()
+
+    def increment(self, product_id):
+        with self._lock:
+            self._counts[str(product_id)] += 1
+
+    def add_row(self, row):
+        with self._lock:
+            self._rows.append(row)
+
+    def pending(self, product_id):
+        with self._lock:
+            return self._counts.get(str(product_id), 0)
+
+    def should_flush(self):
+        interval = getattr(settings, 'VIEW_BUFFER_FLUSH_INTERVAL', 60)
+        max_pending = getattr(settings, 'VIEW_BUFFER_MAX_PENDING', 1000)
+        with self._lock:
+            size = len(self._counts) + len(self._rows)
+            return size and (
+                size >= max_pending or time.monotonic() - self._last_flush >= interval
+            )
+
+    def take(self):
+        with self._lock:
+            counts, rows = self._counts, self._rows
+            self._counts, self._rows = Counter(), []
+            self._last_flush = time.monotonic()
+        return dict(counts), rows
+
+    def restore(self, counts, rows):
+        with self._lock:
+            self._counts.update(counts)
+            self._rows.extend(rows)
+
+
+class RedisViewBuffer:
+    """بافر مشترک بین پردازه‌ها در ردیس؛ تخلیه با RENAME اتمیک کلیدها انجام می‌شود"""
+    counts_key = 'view_buffer:counts'
+    rows_key = 'view_buffer:rows'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def increment(self, product_id):
+        self.connection.hincrby(self.counts_key, str(product_id), 1)
+
+    def add_row(self, row):
+        self.connection.rpush(self.rows_key, json.dumps(row))
+
+    def pending(self, product_id):
+        return int(self.connection.hget(self.counts_key, str(product_id)) or 0)
+
+    def should_flush(self):
+        # تخلیه بر عهده تسک دوره‌ای است
+        return False
+
+    def _take_key(self, key):
+        staging = f'{key}:flushing:{uuid.uuid4().hex}'
+        try:
+            self.connection.rename(key, staging)
+        except Exception:
+            # کلید وجود ندارد؛ بافر خالی است
+            if self.connection.exists(key):
+                raise
+            return None
+        return staging
+
+    def take(self):
+        counts, rows = {}, []
+        staging = self._take_key(self.counts_key)
+        if staging:
+            counts = {
+                product_id.decode(): int(delta)
+                for product_id, delta in self.connection.hgetall(staging).items()
+            }
+            self.connection.delete(staging)
+        staging = self._take_key(self.rows_key)
+        if staging:
+            rows = [json.loads(row) for row in self.connection.lrange(staging, 0, -1)]
+            self.connection.delete(staging)
+        return counts, rows
+
+    def restore(self, counts, rows):
+        pipeline = self.connection.pipeline()
+        for product_id, delta in counts.items():
+            pipeline.hincrby(self.counts_key, product_id, delta)
+        if rows:
+            pipeline.rpush(self.rows_key, *[json.dumps(row) for row in rows])
+        pipeline.execute()
+
+
+_local_buffer = LocalViewBuffer()
+
+
+def get_view_buffer():
+    try:
+        from django_redis import get_redis_connection
+        return RedisViewBuffer(get_redis_connection('default'))
+    except (ImportError, NotImplementedError):
+        return _local_buffer
+
+
+def _buffer_write(method, *args):
+    buffer = get_view_buffer()
+    try:
+        getattr(buffer, method)(*args)
+    except Exception:
+        if buffer is _local_buffer:
+            raise
+        # در دسترس نبودن ردیس نباید بازدید را از بین ببرد؛ بافر درون‌پردازه‌ای خودش تخلیه می‌شود
+        logger.warning('Writing to the redis view buffer failed', exc_info=True)
+        buffer = _local_buffer
+        getattr(buffer, method)(*args)
+    if buffer.should_flush():
+        flush_view_buffer(buffer)
+
+
+def increment_view_count(product_id):
+    """افزایش شمارنده بازدید محصول بدون نوشتن در پایگاه داده"""
+    _buffer_write('increment', product_id)
+
+
+def record_product_view(product_id, user_id, session_id, ip_address, referrer=None):
+    """ثبت یک ردیف ProductView در بافر؛ زمان بازدید همان لحظه ثبت است"""
+    _buffer_write('add_row', {
+        'product_id': str(product_id),
+        'user_id': user_id and str(user_id),
+        'session_id': session_id,
+        'ip_address': ip_address,
+        'referrer': referrer,
+        'created_at': timezone.now().isoformat(),
+    })
+
+
+def pending_view_count(product_id):
+    """تعداد بازدیدهای ثبت‌شده‌ای که هنوز در Product.view_count اعمال نشده‌اند"""
+    pending = _local_buffer.pending(product_id)
+    buffer = get_view_buffer()
+    if buffer is not _local_buffer:
+        try:
+            pending += buffer.pending(product_id)
+        except Exception:
+            logger.warning('Reading pending view count failed', exc_info=True)
+    return pending
+
+
+def _apply_counts(counts):
+    from apps.products.models import Product
+
+    product_ids = list(counts)
+    for start in range(0, len(product_ids), FLUSH_BATCH_SIZE):
+        batch = product_ids[start:start + FLUSH_BATCH_SIZE]
+        Product.objects.filter(pk__in=batch).update(view_count=Case(
+            *[When(pk=product_id, then=F('view_count') + counts[product_id]) for product_id in batch],
+            default=F('view_count'),
+            output_field=PositiveIntegerField(),
+        ))
+
+
+def _insert_rows(rows):
+    from apps.products.models import Product
+    from .models import ProductView
+
+    existing = {
+        str(product_id) for product_id in Product.objects.filter(
+            pk__in={row['product_id'] for row in rows}
+        ).values_list('pk', flat=True)
+    }
+    ProductView.objects.bulk_create([
+        ProductView(
+            product_id=row['product_id'],
+            user_id=row['user_id'],
+            session_id=row['session_id'],
+            ip_address=row['ip_address'],
+            referrer=row['referrer'],
+            created_at=parse_datetime(row['created_at']),
+        )
+        for row in rows if row['product_id'] in existing
+    ], batch_size=FLUSH_BATCH_SIZE)
+
+
+def flush_view_buffer(buffer=None):
+    """
+    اعمال گروهی بافر در پایگاه داده
+
+    در صورت خطا، مقادیر برداشته‌شده به بافر بازگردانده می‌شوند تا در تخلیه بعدی
+    دوباره اعمال شوند. خروجی: (تعداد محصولات به‌روزشده، تعداد ردیف‌های بازدید)
+    """
+    buffer = buffer or get_view_buffer()
+    counts, rows = buffer.take()
+    if not counts and not rows:
+        return 0, 0
+    try:
+        with transaction.atomic():
+            if counts:
+                _apply_counts(counts)
+            if rows:
+                _insert_rows(rows)
+    except Exception:
+        buffer.restore(counts, rows)
+        raise
+    return len(counts), len(rows)
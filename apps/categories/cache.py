@@ -0,0 +1,164 @@
+"""
+کش درخت دسته‌بندی‌ها
+
+همه دسته‌بندی‌ها با یک کوئری به ترتیب MPTT (tree_id, lft) خوانده می‌شوند و درخت
+دسته‌های فعال در حافظه ساخته می‌شود؛ دسته‌ای که خودش یا یکی از والدهایش غیرفعال
+باشد در درخت نیست. خروجی آماده ارسال (درخت تودرتو و breadcrumbs هر دسته بر اساس
+slug) در کش ذخیره می‌شود و با هر ذخیره، جابه‌جایی یا حذف دسته‌بندی نامعتبر می‌شود.
+
+ویژگی‌های به ارث رسیده هر دسته (ویژگی‌های خودش و اجدادش) نیز جداگانه برای هر دسته
+کش می‌شوند و با تغییر ویژگی‌ها یا مقادیر یک دسته، برای آن دسته و همه نوادگانش
+نامعتبر می‌شوند.
+
+خطاهای سرور کش ثبت و نادیده گرفته می‌شوند.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.common.utils import CacheManager
+
+CATEGORY_TREE_CACHE_TIMEOUT = getattr(settings, 'CATEGORY_TREE_CACHE_TTL', 60 * 60 * 24)
+
+logger = logging.getLogger(__name__)
+
+
+def _tree_key():
+    return CacheManager.get_cache_key('category_tree')
+
+
+def build_category_tree():
+    """ساخت درخت دسته‌های فعال و breadcrumbs هر دسته با یک کوئری"""
+    from .models import Category
+
+    roots, nodes, breadcrumbs = [], {}, {}
+    for category in Category.objects.order_by('tree_id', 'lft').only(
+        'id', 'name', 'slug', 'image', 'parent_id', 'is_active', 'order', 'tree_id', 'lft', 'rght', 'level'
+    ):
+        if not category.is_active:
+            continue
+        parent = nodes.get(category.parent_id)
+        if category.parent_id is not None and parent is None:
+            # والد غیرفعال است یا خودش در درخت نیست
+            continue
+        node = {
+            'id': str(category.id),
+            'name': category.name,
+            'slug': category.slug,
+            'image': category.image.url if category.image else None,
+            'parent': str(category.parent_id) if category.parent_id else None,
+            'order': category.order,
+            'children': [],
+        }
+        nodes[category.id] = node
+        (parent['children'] if parent else roots).append(node)
+        crumb = {'id': node['id'], 'name': node['name'], 'slug': node['slug']}
+        breadcrumbs[category.slug] = (breadcrumbs[parent['slug']] if parent else []) + [crumb]
+    return {'tree': roots, 'breadcrumbs': breadcrumbs}
+
+
+def get_category_tree():
+    """{'tree': درخت تودرتو، 'breadcrumbs': {slug: مسیر از ریشه}} از کش یا پایگاه داده"""
+    try:
+        payload = cache.get(_tree_key())
+    except Exception:
+        logger.warning('Reading category tree cache failed', exc_info=True)
+        payload = None
+    if payload is not None:
+        return payload
+
+    payload = build_category_tree()
+    try:
+        cache.set(_tree_key(), payload, CATEGORY_TREE_CACHE_TIMEOUT)
+    except Exception:
+        logger.warning('Writing category tree cache failed', exc_info=True)
+    return payload
+
+
+def with_product_counts(nodes):
+    """
+    کپی گره‌های درخت همراه با شمارنده محصولات فعلی
+
+    شمارنده‌ها مرتب تغییر می‌کنند و در خود درخت کش‌شده نیستند؛ با یک کوئری روی
+    ستون‌های نگهداری‌شده خوانده می‌شوند.
+    """
+    from .models import Category
+
+    counts = {
+        str(pk): (direct, subtree) for pk, direct, subtree in Category.objects.filter(is_active=True).order_by().values_list(
+            'pk', 'product_count', 'subtree_product_count'
+        )
+    }
+
+    def copy(node):
+        direct, subtree = counts.get(node['id'], (0, 0))
+        return {
+            **node,
+            'product_count': direct,
+            'subtree_product_count': subtree,
+            'children': [copy(child) for child in node['children']],
+        }
+
+    return [copy(node) for node in nodes]
+
+
+def invalidate_category_tree():
+    try:
+        cache.delete(_tree_key())
+    except Exception:
+        logger.warning('Invalidating category tree cache failed', exc_info=True)
+
+
+def _attributes_key(category_id):
+    return CacheManager.get_cache_key('category_attributes', category_id)
+
+
+def build_inherited_attributes(category):
+    """
+    ویژگی‌های دسته و همه اجداد آن همراه با مقادیر مجاز
+
+    اجداد با بازه MPTT (lft/rght) در همان کوئری ویژگی‌ها پیدا می‌شوند و مقادیر با یک
+    prefetch خوانده می‌شوند؛ ویژگی‌های دسته نزدیک‌تر اول می‌آیند.
+    """
+    from .models import CategoryAttribute
+    from .serializers import CategoryAttributeDetailSerializer
+
+    attributes = CategoryAttribute.objects.filter(
+        category__tree_id=category.tree_id,
+        category__lft__lte=category.lft,
+        category__rght__gte=category.rght,
+    ).select_related('category').prefetch_related('values').order_by('-category__level', 'order', 'name')
+    return CategoryAttributeDetailSerializer(attributes, many=True).data
+
+
+def get_inherited_attributes(category):
+    key = _attributes_key(category.pk)
+    try:
+        data = cache.get(key)
+    except Exception:
+        logger.warning('Reading category attributes cache failed', exc_info=True)
+        data = None
+    if data is not None:
+        return data
+
+    data = build_inherited_attributes(category)
+    try:
+        cache.set(key, data, CATEGORY_TREE_CACHE_TIMEOUT)
+    except Exception:
+        logger.warning('Writing category attributes cache failed', exc_info=True)
+    return data
+
+
+def invalidate_inherited_attributes(category_id):
+    """نامعتبر کردن ویژگی‌های کش‌شده دسته و همه نوادگان آن"""
+    from .models import Category
+
+    category = Category.objects.filter(pk=category_id).first()
+    category_ids = (
+        category.get_descendants(include_self=True).values_list('pk', flat=True) if category else [category_id]
+    )
+    try:
+        cache.delete_many([_attributes_key(pk) for pk in category_ids])
+    except Exception:
+        logger.warning('Invalidating category attributes cache failed', exc_info=True)
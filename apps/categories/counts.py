@@ -0,0 +1,101 @@
+"""
+شمارنده محصولات هر دسته‌بندی
+
+Category.product_count تعداد محصولات فعال و تاییدشده خود دسته و
+Category.subtree_product_count تعداد آن‌ها در کل زیردرخت دسته است. شمارنده‌ها با
+تغییر وضعیت محصولات (ایجاد، حذف، تغییر دسته، فعال‌سازی یا تایید) به صورت افزایشی با
+UPDATE ... SET count = count + delta روی دسته و اجداد آن (بازه MPTT) به‌روز می‌شوند
+و نیازی به GROUP BY در هر درخواست نیست. recount_category_products شمارنده‌ها را از
+نو محاسبه می‌کند.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def product_states(product_ids, lock=False):
+    """
+    {شناسه محصول: (شناسه دسته، قابل نمایش بودن)} از پایگاه داده
+
+    با lock=True ردیف‌ها تا پایان تراکنش جاری قفل می‌شوند.
+    """
+    from apps.products.models import Product
+
+    queryset = Product.objects.filter(pk__in=list(product_ids))
+    if lock:
+        queryset = queryset.select_for_update()
+    return {
+        product_id: (category_id, is_active and is_approved)
+        for product_id, category_id, is_active, is_approved in queryset.values_list(
+            'pk', 'category_id', 'is_active', 'is_approved'
+        )
+    }
+
+
+def state_deltas(before, after):
+    """
+    تغییر شمارنده هر دسته بین دو وضعیت محصولات
+
+    before و after به شکل {شناسه محصول: (شناسه دسته، قابل نمایش بودن)} هستند؛ محصول
+    ناموجود در هر کدام ایجادشده یا حذف‌شده است.
+    """
+    deltas = Counter()
+    for product_id in set(before) | set(after):
+        old, new = before.get(product_id), after.get(product_id)
+        if old == new:
+            continue
+        if old and old[1]:
+            deltas[old[0]] -= 1
+        if new and new[1]:
+            deltas[new[0]] += 1
+    return {category_id: delta for category_id, delta in deltas.items() if delta}
+
+
+def apply_count_deltas(deltas):
+    """اعمال تغییرات روی شمارنده مستقیم هر دسته و شمارنده زیردرخت خودش و اجدادش"""
+    from .models import Category
+
+    if not deltas:
+        return
+    nodes = Category.objects.filter(pk__in=list(deltas)).values_list('pk', 'tree_id', 'lft', 'rght')
+    for category_id, tree_id, lft, rght in nodes:
+        delta = deltas[category_id]
+        Category.objects.filter(pk=category_id).update(product_count=F('product_count') + delta)
+        Category.objects.filter(tree_id=tree_id, lft__lte=lft, rght__gte=rght).update(
+            subtree_product_count=F('subtree_product_count') + delta
+        )
+
+
+def recount_subtree_totals(queryset=None):
+    """محاسبه شمارنده زیردرخت از روی شمارنده‌های مستقیم (مثلاً پس از جابه‌جایی دسته‌ها)"""
+    from .models import Category
+
+    totals = Category.objects.filter(
+        tree_id=OuterRef('tree_id'), lft__gte=OuterRef('lft'), rght__lte=OuterRef('rght')
+    ).order_by().values('tree_id').annotate(total=Sum('product_count')).values('total')
+    (queryset if queryset is not None else Category.objects.all()).update(
+        subtree_product_count=Coalesce(Subquery(totals), Value(0))
+    )
+
+
+def recount_ancestor_totals(*category_ids):
+    """محاسبه دوباره شمارنده زیردرخت دسته‌های داده‌شده و اجدادشان (مثلاً پس از جابه‌جایی)"""
+    from .models import Category
+
+    chains = Q(pk__in=[])
+    for tree_id, lft, rght in Category.objects.filter(pk__in=category_ids).values_list('tree_id', 'lft', 'rght'):
+        chains |= Q(tree_id=tree_id, lft__lte=lft, rght__gte=rght)
+    recount_subtree_totals(Category.objects.filter(chains))
+
+
+def recount_category_products():
+    """محاسبه کامل همه شمارنده‌ها"""
+    from .models import Category
+
+    Category.objects.update(product_count=Coalesce(Subquery(
+        Category.objects.filter(pk=OuterRef('pk')).annotate(
+            visible=Count('products', filter=Q(products__is_active=True, products__is_approved=True))
+        ).values('visible')
+    ), Value(0)))
+    recount_subtree_totals()
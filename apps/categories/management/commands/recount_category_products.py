@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.categories.counts import recount_category_products
+
+
+class Command(BaseCommand):
+    help = 'محاسبه دوباره شمارنده محصولات همه دسته‌بندی‌ها (مثلاً پس از rebuild درخت)'
+
+    def handle(self, *args, **options):
+        recount_category_products()
+        self.stdout.write(self.style.SUCCESS('شمارنده محصولات دسته‌بندی‌ها محاسبه شد'))
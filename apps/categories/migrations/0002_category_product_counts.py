@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:21
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_product_counts(apps, schema_editor):
+    Category = apps.get_model('categories', 'Category')
+    direct = dict(Category.objects.annotate(
+        visible=Count('products', filter=Q(products__is_active=True, products__is_approved=True))
+    ).values_list('pk', 'visible'))
+    nodes = list(Category.objects.order_by('tree_id', 'lft').values_list('pk', 'tree_id', 'lft', 'rght'))
+    for pk, tree_id, lft, rght in nodes:
+        subtree = sum(
+            direct[other] for other, other_tree, other_lft, other_rght in nodes
+            if other_tree == tree_id and other_lft >= lft and other_rght <= rght
+        )
+        Category.objects.filter(pk=pk).update(product_count=direct[pk], subtree_product_count=subtree)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='تعداد محصولات'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subtree_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='تعداد محصولات زیردرخت'),
+        ),
+        migrations.RunPython(backfill_product_counts, migrations.RunPython.noop),
+    ]
@@ -17,6 +17,9 @@ class Category(MPTTModel):
     created_at = models.DateTimeField(_('تاریخ ایجاد'), auto_now_add=True)
     updated_at = models.DateTimeField(_('تاریخ به‌روزرسانی'), auto_now=True)
     order = models.PositiveIntegerField(_('ترتیب نمایش'), default=0)
+    # تعداد محصولات فعال و تاییدشده؛ توسط apps.categories.counts نگهداری می‌شوند
+    product_count = models.PositiveIntegerField(_('تعداد محصولات'), default=0, editable=False)
+    subtree_product_count = models.PositiveIntegerField(_('تعداد محصولات زیردرخت'), default=0, editable=False)
     
     class MPTTMeta:
         order_insertion_by = ['order', 'name']
@@ -28,10 +31,22 @@ class Category(MPTTModel):
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # والد ذخیره‌شده؛ برای به‌روزرسانی شمارنده اجداد قبلی پس از جابه‌جایی
+        if 'parent_id' in instance.__dict__:
+            instance._saved_parent_id = instance.parent_id
+        return instance
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        # سیگنال node_moved در جابه‌جایی با save یا move_to پس از این خط فرستاده می‌شود
+        if hasattr(self, '_saved_parent_id'):
+            self.parent_before_move = self._saved_parent_id
         super().save(*args, **kwargs)
+        self._saved_parent_id = self.parent_id
 
 
 class CategoryAttribute(models.Model):
@@ -1,4 +1,6 @@
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+from .cache import get_category_tree
 from .models import Category, CategoryAttribute, CategoryAttributeValue
 
 
@@ -16,6 +18,30 @@ class CategoryAttributeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug', 'is_required', 'is_filter', 'is_color', 'is_size', 'order', 'values')
 
 
+def _children_map(descendants):
+    """{شناسه والد: [فرزندان]} از یک کوئری نوادگان همراه با والد و ویژگی‌ها"""
+    children_map = {}
+    for node in descendants.select_related('parent').prefetch_related('attributes__values'):
+        children_map.setdefault(node.parent_id, []).append(node)
+    return children_map
+
+
+class CategoryTreeListSerializer(serializers.ListSerializer):
+    """
+    نوادگان همه دسته‌های فهرست با یک کوئری MPTT خوانده و در context به همه زیرشاخه‌ها
+    داده می‌شوند؛ والد و ویژگی‌های خود دسته‌ها نیز یک‌جا prefetch می‌شوند
+    """
+
+    def to_representation(self, data):
+        nodes = list(data.all() if hasattr(data, 'all') else data)
+        if nodes and 'category_children' not in self.context:
+            prefetch_related_objects(nodes, 'parent', 'attributes__values')
+            self.context['category_children'] = _children_map(Category.objects.get_queryset_descendants(
+                Category.objects.filter(pk__in=[node.pk for node in nodes])
+            ))
+        return super().to_representation(nodes)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
     attributes = CategoryAttributeSerializer(many=True, read_only=True)
@@ -25,9 +51,19 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ('id', 'name', 'slug', 'description', 'parent', 'parent_name', 'image', 
                  'is_active', 'created_at', 'updated_at', 'order', 'children', 'attributes')
+        list_serializer_class = CategoryTreeListSerializer
+    
+    def _get_children_map(self, obj):
+        # همه نوادگان با یک کوئری MPTT (و prefetch ویژگی‌ها) خوانده و بر اساس والد گروه‌بندی می‌شوند
+        children_map = self.context.get('category_children')
+        if children_map is None:
+            children_map = _children_map(obj.get_descendants())
+        return children_map
     
     def get_children(self, obj):
-        return CategorySerializer(obj.get_children(), many=True).data
+        children_map = self._get_children_map(obj)
+        context = {**self.context, 'category_children': children_map}
+        return CategorySerializer(children_map.get(obj.pk, []), many=True, context=context).data
     
     def get_parent_name(self, obj):
         if obj.parent:
@@ -35,12 +71,19 @@ class CategorySerializer(serializers.ModelSerializer):
         return None
 
 
-class CategoryListSerializer(serializers.ModelSerializer):
+class CategorySummarySerializer(serializers.ModelSerializer):
+    """دسته‌بندی بدون شمارنده‌ها برای جاسازی در خروجی‌های کش‌شده (مثل جزئیات محصول)"""
     class Meta:
         model = Category
         fields = ('id', 'name', 'slug', 'image', 'parent')
 
 
+class CategoryListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'slug', 'image', 'parent', 'product_count', 'subtree_product_count')
+
+
 class CategoryDetailSerializer(serializers.ModelSerializer):
     children = CategoryListSerializer(many=True, read_only=True)
     attributes = CategoryAttributeSerializer(many=True, read_only=True)
@@ -49,16 +92,18 @@ class CategoryDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name', 'slug', 'description', 'parent', 'image', 
-                 'is_active', 'created_at', 'updated_at', 'order', 
-                 'children', 'attributes', 'breadcrumbs')
+                 'is_active', 'created_at', 'updated_at', 'order', 'product_count',
+                 'subtree_product_count', 'children', 'attributes', 'breadcrumbs')
     
     def get_breadcrumbs(self, obj):
-        result = []
-        node = obj
-        while node:
-            result.insert(0, {'id': node.id, 'name': node.name, 'slug': node.slug})
-            node = node.parent
-        return result
+        breadcrumbs = get_category_tree()['breadcrumbs'].get(obj.slug)
+        if breadcrumbs is not None:
+            return breadcrumbs
+        # دسته‌های غیرفعال در درخت کش‌شده نیستند؛ مسیر با یک کوئری اجداد ساخته می‌شود
+        return [
+            {'id': str(node.id), 'name': node.name, 'slug': node.slug}
+            for node in obj.get_ancestors(include_self=True)
+        ]
 
 
 class CategoryAttributeValueDetailSerializer(serializers.ModelSerializer):
@@ -0,0 +1,48 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from .cache import invalidate_category_tree, invalidate_inherited_attributes
+from .counts import recount_ancestor_totals, recount_subtree_totals
+from .models import Category, CategoryAttribute, CategoryAttributeValue
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidate_category_tree_on_change(sender, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver(post_save, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidate_inherited_attributes_on_category_change(sender, instance, **kwargs):
+    # نام دسته در خروجی ویژگی‌ها و اجداد دسته پس از جابه‌جایی تغییر می‌کنند
+    invalidate_inherited_attributes(instance.pk)
+
+
+@receiver(node_moved, sender=Category)
+def recount_subtree_totals_on_move(sender, instance, **kwargs):
+    # زیردرخت جابه‌جاشده از شمارنده اجداد قبلی کم و به اجداد جدید اضافه می‌شود؛ اگر والد
+    # قبلی معلوم نباشد (نمونه بدون والد بارگذاری‌شده) همه شمارنده‌ها محاسبه می‌شوند
+    if hasattr(instance, 'parent_before_move'):
+        recount_ancestor_totals(instance.pk, instance.parent_before_move)
+    else:
+        recount_subtree_totals()
+
+
+@receiver(post_save, sender=CategoryAttribute)
+@receiver(post_delete, sender=CategoryAttribute)
+def invalidate_inherited_attributes_on_attribute_change(sender, instance, **kwargs):
+    invalidate_inherited_attributes(instance.category_id)
+
+
+@receiver(post_save, sender=CategoryAttributeValue)
+@receiver(post_delete, sender=CategoryAttributeValue)
+def invalidate_inherited_attributes_on_value_change(sender, instance, **kwargs):
+    # در حذف آبشاری ممکن است ویژگی پیش‌تر حذف شده باشد؛ در آن صورت خودش نامعتبرسازی را انجام داده است
+    try:
+        invalidate_inherited_attributes(instance.attribute.category_id)
+    except ObjectDoesNotExist:
+        pass
@@ -1,3 +1,185 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import Category, CategoryAttribute
+from .serializers import CategorySerializer
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CategoryTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.crafts = Category.objects.create(name='صنایع دستی', slug='crafts')
+        cls.pottery = Category.objects.create(name='سفال', slug='pottery', parent=cls.crafts)
+        cls.bowls = Category.objects.create(name='کاسه', slug='bowls', parent=cls.pottery)
+        cls.hidden = Category.objects.create(name='پنهان', slug='hidden', parent=cls.crafts, is_active=False)
+        Category.objects.create(name='زیر پنهان', slug='under-hidden', parent=cls.hidden)
+        Category.objects.create(name='فرش', slug='rugs')
+        CategoryAttribute.objects.create(category=cls.bowls, name='جنس', slug='material')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_tree_is_built_with_one_query_and_cached(self):
+        # ساخت درخت و خواندن شمارنده‌ها
+        with self.assertNumQueries(2):
+            tree = self.client.get('/api/categories/categories/tree/').data
+        self.assertEqual([node['slug'] for node in tree], ['crafts', 'rugs'])
+        # دسته غیرفعال و زیرشاخه آن در درخت نیستند
+        self.assertEqual([node['slug'] for node in tree[0]['children']], ['pottery'])
+        self.assertEqual(tree[0]['children'][0]['children'][0]['slug'], 'bowls')
+
+        with self.assertNumQueries(1):
+            roots = self.client.get('/api/categories/categories/root_categories/').data
+        self.assertEqual([root['slug'] for root in roots], ['crafts', 'rugs'])
+
+    def test_breadcrumbs_and_invalidation(self):
+        data = self.client.get('/api/categories/categories/bowls/').data
+        self.assertEqual([crumb['slug'] for crumb in data['breadcrumbs']], ['crafts', 'pottery', 'bowls'])
+
+        bowls = Category.objects.get(slug='bowls')
+        bowls.move_to(Category.objects.get(slug='rugs'))
+        data = self.client.get('/api/categories/categories/bowls/').data
+        self.assertEqual([crumb['slug'] for crumb in data['breadcrumbs']], ['rugs', 'bowls'])
+
+        Category.objects.filter(slug='rugs').get().delete()
+        tree = self.client.get('/api/categories/categories/tree/').data
+        self.assertEqual([node['slug'] for node in tree], ['crafts'])
+
+    def test_nested_serializer_does_not_query_per_node(self):
+        # دسته ریشه، نوادگان (با JOIN والد)، prefetch ویژگی‌ها و مقادیر نوادگان، ویژگی‌های ریشه
+        with self.assertNumQueries(5):
+            data = CategorySerializer(Category.objects.get(slug='crafts')).data
+        pottery = next(child for child in data['children'] if child['slug'] == 'pottery')
+        self.assertEqual(pottery['children'][0]['attributes'][0]['slug'], 'material')
+
+    def test_many_roots_share_one_descendants_query(self):
+        Category.objects.create(name='چوب', slug='wood')
+        # ریشه‌ها، ویژگی‌ها و مقادیر ریشه‌ها، نوادگان و ویژگی‌ها و مقادیر نوادگان؛ مستقل از تعداد ریشه‌ها
+        with self.assertNumQueries(6):
+            data = CategorySerializer(Category.objects.filter(parent=None), many=True).data
+        self.assertEqual(sorted(node['slug'] for node in data), ['crafts', 'rugs', 'wood'])
+        crafts = next(node for node in data if node['slug'] == 'crafts')
+        pottery = next(child for child in crafts['children'] if child['slug'] == 'pottery')
+        self.assertEqual(pottery['children'][0]['attributes'][0]['slug'], 'material')
+
+    def test_inherited_attributes_are_resolved_in_two_queries_and_cached(self):
+        from apps.common.testing import create_user
+        from .models import CategoryAttributeValue
+
+        material = CategoryAttribute.objects.create(category=self.crafts, name='رنگ', slug='color')
+        CategoryAttributeValue.objects.create(attribute=material, value='قرمز')
+        url = '/api/categories/categories/bowls/attributes/'
+        # این endpoint فقط برای مدیران است
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_authenticate(create_user(is_staff=True))
+
+        # دسته، ویژگی‌های اجداد، prefetch مقادیر و ثبت فعالیت کاربر
+        with self.assertNumQueries(4):
+            data = self.client.get(url).data
+        self.assertEqual([attribute['slug'] for attribute in data], ['material', 'color'])
+        self.assertEqual(data[1]['values'][0]['value'], 'قرمز')
+
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        # تغییر ویژگی‌های یک جد کش همه نوادگان را نامعتبر می‌کند
+        CategoryAttribute.objects.create(category=self.pottery, name='لعاب', slug='glaze')
+        data = self.client.get(url).data
+        self.assertEqual([attribute['slug'] for attribute in data], ['material', 'glaze', 'color'])
+
+
+class CategoryProductCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.common.testing import create_seller
+
+        cls.seller = create_seller()
+        cls.crafts = Category.objects.create(name='صنایع دستی', slug='crafts')
+        cls.pottery = Category.objects.create(name='سفال', slug='pottery', parent=cls.crafts)
+        cls.bowls = Category.objects.create(name='کاسه', slug='bowls', parent=cls.pottery)
+        cls.rugs = Category.objects.create(name='فرش', slug='rugs')
+
+    def _create_product(self, slug, category, **kwargs):
+        from apps.common.testing import create_product
+
+        return create_product(self.seller, category, slug, **kwargs)
+
+    def _counts(self):
+        return {
+            slug: (direct, subtree) for slug, direct, subtree in Category.objects.values_list(
+                'slug', 'product_count', 'subtree_product_count'
+            )
+        }
+
+    def test_counts_follow_create_move_approve_and_delete(self):
+        from apps.products.models import Product
+        from apps.products.sync import update_products
+
+        bowl = self._create_product('bowl', self.bowls)
+        self._create_product('vase', self.pottery)
+        pending = self._create_product('jar', self.bowls, is_approved=False)
+        self.assertEqual(self._counts(), {
+            'crafts': (0, 2), 'pottery': (1, 2), 'bowls': (1, 1), 'rugs': (0, 0),
+        })
+
+        update_products(Product.objects.filter(pk=pending.pk), is_approved=True)
+        bowl = Product.objects.get(pk=bowl.pk)
+        bowl.category = self.rugs
+        bowl.save()
+        # ذخیره دوباره بدون تغییر وضعیت نباید دوباره شمرده شود
+        bowl.save()
+        self.assertEqual(self._counts(), {
+            'crafts': (0, 2), 'pottery': (1, 2), 'bowls': (1, 1), 'rugs': (1, 1),
+        })
+
+        Product.objects.get(slug='vase').delete()
+        Category.objects.get(slug='bowls').move_to(Category.objects.get(slug='rugs'))
+        self.assertEqual(self._counts(), {
+            'crafts': (0, 0), 'pottery': (0, 0), 'bowls': (1, 1), 'rugs': (1, 2),
+        })
+
+        Category.objects.update(product_count=0, subtree_product_count=0)
+        from .counts import recount_category_products
+        recount_category_products()
+        self.assertEqual(self._counts()['rugs'], (1, 2))
+
+    def test_stale_instances_do_not_apply_the_same_delta_twice(self):
+        from apps.products.models import Product
+
+        bowl = self._create_product('bowl', self.bowls)
+        first, second = Product.objects.get(pk=bowl.pk), Product.objects.get(pk=bowl.pk)
+        first.is_active = False
+        first.save()
+        # نمونه دوم هنوز وضعیت فعال را از زمان بارگذاری دارد
+        second.is_active = False
+        second.category = self.rugs
+        second.save()
+        self.assertEqual(self._counts(), {
+            'crafts': (0, 0), 'pottery': (0, 0), 'bowls': (0, 0), 'rugs': (0, 0),
+        })
+
+    def test_move_recounts_only_old_and_new_ancestors(self):
+        self._create_product('bowl', self.bowls)
+        self._create_product('rug', self.rugs)
+        unrelated = Category.objects.create(name='چوب', slug='wood')
+        Category.objects.filter(pk=unrelated.pk).update(subtree_product_count=9)
+
+        pottery = Category.objects.get(slug='pottery')
+        pottery.parent = Category.objects.get(slug='rugs')
+        pottery.save()
+        counts = self._counts()
+        self.assertEqual((counts['crafts'], counts['rugs'], counts['pottery']), ((0, 0), (1, 2), (0, 1)))
+        self.assertEqual(counts['wood'], (0, 9))
+
+    def test_subtree_listing_by_category_slug(self):
+        self._create_product('bowl', self.bowls)
+        self._create_product('vase', self.pottery)
+        self._create_product('rug', self.rugs)
+
+        client = APIClient()
+        data = client.get('/api/products/products/', {'category_slug': 'crafts'}).data
+        self.assertEqual(sorted(product['slug'] for product in data['results']), ['bowl', 'vase'])
+        self.assertEqual(client.get('/api/products/products/', {'category_slug': 'missing'}).data['count'], 0)
@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Q
+from .cache import get_category_tree, get_inherited_attributes, with_product_counts
 from .models import Category, CategoryAttribute, CategoryAttributeValue
 from .serializers import (
     CategorySerializer, CategoryListSerializer, CategoryDetailSerializer,
@@ -17,7 +18,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAdminUser]
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'root_categories', 'by_parent']:
+        if self.action in ['list', 'retrieve', 'tree', 'root_categories', 'by_parent']:
             return [permissions.AllowAny()]
         return super().get_permissions()
     
@@ -34,11 +35,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(is_active=True)
         return queryset
     
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """درخت کامل دسته‌های فعال از کش همراه با شمارنده محصولات"""
+        return Response(with_product_counts(get_category_tree()['tree']))
+    
     @action(detail=False, methods=['get'])
     def root_categories(self, request):
-        categories = Category.objects.filter(parent=None, is_active=True)
-        serializer = CategoryListSerializer(categories, many=True)
-        return Response(serializer.data)
+        fields = CategoryListSerializer.Meta.fields
+        roots = [{**node, 'children': []} for node in get_category_tree()['tree']]
+        return Response([
+            {field: node[field] for field in fields} for node in with_product_counts(roots)
+        ])
     
     @action(detail=False, methods=['get'])
     def by_parent(self, request):
@@ -56,18 +64,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def attributes(self, request, slug=None):
-        category = self.get_object()
-        # دریافت ویژگی‌های این دسته و تمام دسته‌های والد
-        attributes = []
-        current = category
-        while current:
-            attrs = CategoryAttribute.objects.filter(category=current)
-            for attr in attrs:
-                attributes.append(attr)
-            current = current.parent
-        
-        serializer = CategoryAttributeDetailSerializer(attributes, many=True)
-        return Response(serializer.data)
+        # ویژگی‌های این دسته و تمام دسته‌های والد (کش‌شده برای هر دسته)
+        return Response(get_inherited_attributes(self.get_object()))
 
 
 class CategoryAttributeViewSet(viewsets.ModelViewSet):
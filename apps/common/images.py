@@ -0,0 +1,163 @@
+"""
+تولید نسخه‌های کوچک‌شده (derivative) تصاویر آپلودشده
+
+برای هر تصویر، نسخه‌هایی با عرض‌های DERIVATIVE_WIDTHS در دو قالب WebP و JPEG در
+کنار فایل اصلی در همان storage ذخیره می‌شوند و مشخصات آن‌ها (ابعاد تصویر اصلی و
+مسیر و ابعاد هر نسخه) در فیلد derivatives مدل ثبت می‌شود. پردازش پس از ذخیره تصویر
+در تسک Celery انجام می‌شود تا آپلود منتظر Pillow نماند.
+
+مدل‌های تحت پوشش و فیلد تصویر آن‌ها در IMAGE_DERIVATIVE_MODELS تعریف می‌شوند.
+"""
+import io
+import logging
+import os
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# برچسب مدل -> نام فیلد تصویر
+IMAGE_DERIVATIVE_MODELS = {
+    'products.ProductImage': 'image',
+    'products.ProductVariant': 'image',
+    'products.ProductReviewImage': 'image',
+    'orders.OrderReturnImage': 'image',
+}
+
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def get_image_field(model_label):
+    return IMAGE_DERIVATIVE_MODELS[model_label]
+
+
+def needs_derivatives(instance, field_name):
+    """تصویر وجود دارد و نسخه‌های آن برای همین فایل ساخته نشده‌اند"""
+    image = getattr(instance, field_name)
+    return bool(image) and (instance.derivatives or {}).get('source') != image.name
+
+
+def _encode(image, extension):
+    options = dict(DERIVATIVE_FORMATS[extension])
+    if options['format'] == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def build_derivatives(field_file, widths=DERIVATIVE_WIDTHS):
+    """
+    ساخت و ذخیره نسخه‌های یک تصویر
+
+    تصویر بزرگ‌نمایی نمی‌شود؛ اگر عرض اصلی از کوچک‌ترین عرض کمتر باشد فقط یک نسخه با
+    همان ابعاد ساخته می‌شود. خروجی برای ذخیره در فیلد derivatives است.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    width, height = image.size
+
+    base, _ = os.path.splitext(field_file.name)
+    variants = []
+    for target in sorted({w for w in widths if w < width} or {width}):
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.LANCZOS
+        )
+        for extension in DERIVATIVE_FORMATS:
+            name = storage.save(f'{base}_{target}w.{extension}', ContentFile(_encode(resized, extension)))
+            variants.append({
+                'name': name,
+                'format': extension,
+                'width': resized.width,
+                'height': resized.height,
+            })
+    return {'source': field_file.name, 'width': width, 'height': height, 'variants': variants}
+
+
+def delete_derivatives(storage, derivatives):
+    for variant in (derivatives or {}).get('variants', ()):
+        try:
+            storage.delete(variant['name'])
+        except Exception:
+            logger.warning('Deleting image derivative %s failed', variant['name'], exc_info=True)
+
+
+def process_image(model_label, pk):
+    """
+    ساخت نسخه‌های تصویر یک ردیف و ثبت آن‌ها
+
+    نسخه‌های قبلی همان ردیف پس از ثبت نسخه‌های جدید حذف می‌شوند. خروجی: True در صورت
+    پردازش
+    """
+    model = apps.get_model(model_label)
+    field_name = get_image_field(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_derivatives(instance, field_name):
+        return False
+    field_file = getattr(instance, field_name)
+    previous = instance.derivatives
+    instance.derivatives = build_derivatives(field_file)
+    # save با update_fields تا سیگنال‌های نامعتبرسازی کش اجرا شوند اما پردازش دوباره صف نشود
+    instance.save(update_fields=['derivatives'])
+    delete_derivatives(field_file.storage, previous)
+    return True
+
+
+def process_images(model_label, pks):
+    """پردازش یک دسته از تصاویر؛ خطای یک تصویر مانع پردازش بقیه نمی‌شود"""
+    processed = failed = 0
+    for pk in pks:
+        try:
+            processed += process_image(model_label, pk)
+        except Exception:
+            failed += 1
+            logger.exception('Building derivatives for %s %s failed', model_label, pk)
+    return {'processed': processed, 'failed': failed}
+
+
+def enqueue_image_derivatives(model_label, pk):
+    from .tasks import generate_image_derivatives
+
+    try:
+        generate_image_derivatives.delay(model_label, str(pk))
+    except Exception:
+        # در دسترس نبودن broker نباید ذخیره تصویر را خراب کند؛ backfill بعداً آن را پردازش می‌کند
+        logger.warning('Queueing image derivatives for %s %s failed', model_label, pk, exc_info=True)
+
+
+def srcset(field_file, derivatives, extension='webp'):
+    """رشته srcset نسخه‌های یک قالب، مثلاً «url 320w, url 640w»"""
+    variants = [
+        variant for variant in (derivatives or {}).get('variants', ())
+        if variant['format'] == extension
+    ]
+    if not field_file or not variants or derivatives.get('source') != field_file.name:
+        return None
+    storage = field_file.storage
+    return ', '.join(f"{storage.url(variant['name'])} {variant['width']}w" for variant in variants)
+
+
+def derivative_url(field_file, derivatives, max_width, extension='jpg'):
+    """
+    آدرس بزرگ‌ترین نسخه با عرض حداکثر max_width؛ در نبود نسخه‌ها آدرس فایل اصلی
+    """
+    if not field_file:
+        return None
+    if (derivatives or {}).get('source') == field_file.name:
+        fitting = [
+            variant for variant in derivatives.get('variants', ())
+            if variant['format'] == extension and variant['width'] <= max_width
+        ]
+        if fitting:
+            return field_file.storage.url(max(fitting, key=lambda variant: variant['width'])['name'])
+    return field_file.url
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import group
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.common.images import IMAGE_DERIVATIVE_MODELS, process_images
+from apps.common.tasks import generate_image_derivatives_batch
+
+
+def _process_batch(model_label, pks):
+    try:
+        return process_images(model_label, pks)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'ساخت نسخه‌های کوچک‌شده تصاویر موجود در دسته‌های موازی'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models', choices=sorted(IMAGE_DERIVATIVE_MODELS),
+                            help='برچسب مدل (پیش‌فرض: همه مدل‌ها)')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sync', action='store_true',
+                            help='پردازش در همین پردازه به جای ارسال به صف Celery')
+        parser.add_argument('--workers', type=int, default=4, help='تعداد نخ‌های پردازش در حالت --sync')
+
+    def pending_batches(self, model_label, batch_size):
+        model = apps.get_model(model_label)
+        field_name = IMAGE_DERIVATIVE_MODELS[model_label]
+        queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+
+        batch = []
+        for pk, name, derivatives in queryset.values_list('pk', field_name, 'derivatives').order_by('pk').iterator(
+            chunk_size=batch_size * 10
+        ):
+            if (derivatives or {}).get('source') == name:
+                continue
+            batch.append(str(pk))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size باید مثبت باشد')
+        batches = [
+            (model_label, pks)
+            for model_label in options['models'] or IMAGE_DERIVATIVE_MODELS
+            for pks in self.pending_batches(model_label, options['batch_size'])
+        ]
+        images = sum(len(pks) for _, pks in batches)
+        if not batches:
+            self.stdout.write(self.style.SUCCESS('همه تصاویر نسخه‌های به‌روز دارند'))
+            return
+
+        if not options['sync']:
+            group(generate_image_derivatives_batch.s(model_label, pks) for model_label, pks in batches).apply_async()
+            self.stdout.write(self.style.SUCCESS(f'{images} تصویر در {len(batches)} دسته به صف ارسال شد'))
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            results = list(executor.map(lambda batch: _process_batch(*batch), batches))
+        processed = sum(result['processed'] for result in results)
+        failed = sum(result['failed'] for result in results)
+        self.stdout.write(self.style.SUCCESS(f'{processed} تصویر پردازش شد، {failed} خطا'))
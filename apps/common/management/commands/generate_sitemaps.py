@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.common.sitemaps import SITEMAP_MAX_URLS, generate_sitemaps, sitemap_index_url
+
+
+class Command(BaseCommand):
+    help = 'تولید یا به‌روزرسانی فایل‌های نقشه سایت محصولات، دسته‌بندی‌ها و فروشگاه‌ها'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='بازنویسی همه تکه‌ها حتی بدون تغییر')
+        parser.add_argument('--max-urls', type=int, default=SITEMAP_MAX_URLS)
+
+    def handle(self, *args, **options):
+        result = generate_sitemaps(full=options['full'], max_urls=options['max_urls'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['written']} فایل نوشته شد، {result['unchanged']} بدون تغییر، {result['deleted']} حذف شد: "
+            f"{sitemap_index_url()}"
+        ))
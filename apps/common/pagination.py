@@ -1,5 +1,15 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -16,4 +26,217 @@ class StandardResultsSetPagination(PageNumberPagination):
             'total_pages': self.page.paginator.num_pages,
             'current_page': self.page.number,
             'results': data
-        })
\ No newline at end of file
+        })
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """برخلاف DjangoJSONEncoder دقت میکروثانیه زمان‌ها را حفظ می‌کند"""
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    صفحه‌بندی مبتنی بر کرسر (keyset) برای فیدهای پرحجم
+
+    به جای COUNT و OFFSET، مقادیر ستون‌های مرتب‌سازی آخرین ردیف صفحه در کرسر قرار
+    می‌گیرد و صفحه بعد با یک شرط WHERE روی همان ستون‌ها خوانده می‌شود؛ بنابراین هزینه
+    صفحه N با صفحه اول برابر است. کلید اصلی همیشه به‌عنوان ستون آخر مرتب‌سازی اضافه
+    می‌شود تا ترتیب ردیف‌های با مقدار برابر پایدار بماند.
+
+    پاسخ فقط next، previous، page_size و results دارد (بدون count و total_pages) و
+    پارامتر page پشتیبانی نمی‌شود. مرتب‌سازی فقط با نام ستون‌های غیرتهی مجاز است؛ ستون
+    تهی‌پذیر، annotation یا عبارت (مثلاً از پارامتر ordering) با خطای 400 رد می‌شود،
+    چون شرط WHERE کرسر ردیف‌های NULL را جا می‌اندازد.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # در صورت نبود ordering روی view یا queryset استفاده می‌شود
+    ordering = '-created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self._reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('page_size', self.page_size),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset, view):
+        """
+        ترتیب صفحه‌بندی: ordering اعمال‌شده روی queryset (مثلاً توسط OrderingFilter)،
+        سپس ordering تعریف‌شده روی view و در نهایت مقدار پیش‌فرض کلاس
+        """
+        ordering = list(queryset.query.order_by)
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+            ordering = [ordering] if isinstance(ordering, str) else list(ordering)
+
+        pk_name = queryset.model._meta.pk.name
+        for term in ordering:
+            if not isinstance(term, str) or self._nullable(queryset.model, term.lstrip('-')):
+                raise ValidationError({'ordering': f'مرتب‌سازی بر اساس «{term}» در این فهرست پشتیبانی نمی‌شود'})
+        ordering = [term for term in ordering if term.lstrip('-') not in ('pk', pk_name)]
+        descending = ordering[0].startswith('-') if ordering else True
+        ordering.append(('-' if descending else '') + pk_name)
+        return ordering
+
+    @staticmethod
+    def _nullable(model, path):
+        """آیا مقدار ستون (با دنبال کردن رابطه‌ها) می‌تواند NULL باشد؛ نام ناشناخته تهی‌پذیر است"""
+        opts = model._meta
+        for part in path.split('__'):
+            try:
+                field = opts.pk if part == 'pk' else opts.get_field(part)
+            except FieldDoesNotExist:
+                return True
+            if field.null or field.one_to_many or field.many_to_many:
+                return True
+            if field.is_relation:
+                opts = field.related_model._meta
+        return False
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._link(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound('کرسر صفحه‌بندی نامعتبر است')
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound('کرسر صفحه‌بندی نامعتبر است')
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, cls=CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def _link(self, instance, reverse):
+        position = [self._value(instance, term.lstrip('-')) for term in self.ordering]
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(position, reverse)
+        )
+
+    @staticmethod
+    def _value(instance, field):
+        value = instance
+        for part in field.split('__'):
+            value = getattr(value, part)
+        return getattr(value, 'pk', value)
+
+    @staticmethod
+    def _reversed(ordering):
+        return [term[1:] if term.startswith('-') else '-' + term for term in ordering]
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        شرط «بعد از موقعیت کرسر» برای مرتب‌سازی چندستونی:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for term, value in zip(ordering, position):
+            field = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+
+class CursorOptInPagination(KeysetPagination):
+    """
+    صفحه‌بندی endpointهایی که کلاینت‌های فعلی به صفحه‌بندی شماره‌دار وابسته‌اند
+
+    بدون پارامتر cursor همان پاسخ StandardResultsSetPagination (count، total_pages،
+    current_page و ?page=) برگردانده می‌شود؛ کلاینتی که cursor (برای صفحه اول خالی:
+    ?cursor=) بفرستد صفحه‌بندی کرسری KeysetPagination را می‌گیرد.
+    """
+    page_pagination_class = StandardResultsSetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.page_pagination = None
+            return super().paginate_queryset(queryset, request, view)
+        self.page_pagination = self.page_pagination_class()
+        return self.page_pagination.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_pagination is not None:
+            return self.page_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_previous_link(self):
+        # صفحه اول حالت کرسری با cursor خالی مشخص می‌شود تا به صفحه‌بندی شماره‌دار برنگردد
+        if self.has_previous and not self.page:
+            return replace_query_param(self.base_url, self.cursor_query_param, '')
+        return super().get_previous_link()
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_pagination_class().get_paginated_response_schema(schema)
@@ -1,10 +1,83 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import (
     ActivityLog, Setting, ContactMessage, FAQ, 
     Province, City, Banner, Newsletter
 )
 
 
+def _parse_field_list(request, param):
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_sparse_fieldset(request):
+    """
+    فیلدهای درخواستی (?fields=) و حذف‌شده (?omit=) در درخواست‌های خواندنی
+
+    هر مقدار None (بدون محدودیت) یا مجموعه‌ای از نام فیلدهای سطح اول است.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    return (
+        _parse_field_list(request, SparseFieldsetMixin.fields_query_param),
+        _parse_field_list(request, SparseFieldsetMixin.omit_query_param),
+    )
+
+
+def is_field_requested(request, name):
+    """آیا فیلد name در خروجی این درخواست حضور دارد"""
+    fields, omit = get_sparse_fieldset(request)
+    return (fields is None or name in fields) and (omit is None or name not in omit)
+
+
+def prefetch_requested(queryset, request, prefetches):
+    """
+    اعمال select_related/prefetch_related فقط برای فیلدهای درخواستی
+
+    prefetches نام فیلد سریالایزر را به فهرست lookupهای prefetch_related نگاشت می‌کند؛
+    lookupهایی که با «select:» شروع شوند با select_related اعمال می‌شوند.
+    """
+    select, prefetch = [], []
+    for field, lookups in prefetches.items():
+        if not is_field_requested(request, field):
+            continue
+        for lookup in lookups:
+            if isinstance(lookup, str) and lookup.startswith('select:'):
+                select.append(lookup[len('select:'):])
+            else:
+                prefetch.append(lookup)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class SparseFieldsetMixin:
+    """
+    پشتیبانی از ?fields=a,b و ?omit=c برای سریالایزرهای سطح اول
+
+    فیلدهای انتخاب‌نشده پیش از سریال‌سازی حذف می‌شوند تا SerializerMethodFieldها و
+    سریالایزرهای تودرتوی آن‌ها اجرا نشوند. سریالایزرهای تودرتو به request دسترسی
+    ندارند و همیشه کامل سریال می‌شوند. برای حذف prefetchهای متناظر در viewset از
+    prefetch_requested استفاده کنید.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        for name in list(self.fields):
+            if not is_field_requested(request, name):
+                self.fields.pop(name)
+
+
 class ActivityLogSerializer(serializers.ModelSerializer):
     user_phone = serializers.CharField(source='user.phone', read_only=True)
     action_display = serializers.CharField(source='get_action_display', read_only=True)
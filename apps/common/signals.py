@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .images import IMAGE_DERIVATIVE_MODELS, delete_derivatives, enqueue_image_derivatives, needs_derivatives
+
+
+def _queue_derivatives(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'derivatives'}:
+        return
+    label = sender._meta.label
+    if needs_derivatives(instance, IMAGE_DERIVATIVE_MODELS[label]):
+        transaction.on_commit(lambda: enqueue_image_derivatives(label, instance.pk))
+
+
+def _delete_derivatives(sender, instance, **kwargs):
+    field_file = getattr(instance, IMAGE_DERIVATIVE_MODELS[sender._meta.label])
+    derivatives = instance.derivatives
+    if derivatives:
+        transaction.on_commit(lambda: delete_derivatives(field_file.storage, derivatives))
+
+
+def connect_image_derivative_signals():
+    for label in IMAGE_DERIVATIVE_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(_queue_derivatives, sender=model, dispatch_uid=f'image_derivatives_{label}')
+        post_delete.connect(_delete_derivatives, sender=model, dispatch_uid=f'image_derivatives_delete_{label}')
@@ -0,0 +1,246 @@
+"""
+تولید نقشه سایت (sitemap) کاتالوگ به صورت فایل‌های ایستا
+
+اسلاگ محصولات، دسته‌بندی‌ها و فروشگاه‌ها با values_list().iterator() به ترتیب
+(created_at, pk) خوانده می‌شوند و در فایل‌های حداکثر SITEMAP_MAX_URLS آدرسی
+نوشته می‌شوند؛ فایل sitemap.xml فهرست (index) همه فایل‌هاست. همه فایل‌ها در storage
+پیش‌فرض زیر SITEMAP_STORAGE_PATH ذخیره می‌شوند تا خزنده‌ها مستقیماً فایل ایستا را
+بخوانند و درخواستی به برنامه نرسد.
+
+مرز هر تکه (اولین کلید آن) و اثرانگشت ردیف‌هایش (slug و updated_at) در manifest.json
+ذخیره می‌شود. در اجرای بعدی ردیف‌ها با همان مرزها تقسیم می‌شوند و فقط تکه‌هایی که
+اثرانگشتشان تغییر کرده (تغییر updated_at، افزودن یا حذف ردیف) دوباره نوشته می‌شوند؛
+تکه‌ای که از حد مجاز بزرگ‌تر شود از همان نقطه شکسته می‌شود و تکه خالی حذف می‌شود.
+
+زمان هر اجرا هم در manifest ثبت می‌شود. اجرای بعدی فقط کلید ردیف‌هایی را می‌خواند که
+updated_at آن‌ها پس از اجرای قبلی (با SITEMAP_CHANGE_OVERLAP برای تراکنش‌هایی که دیرتر
+commit شده‌اند) است و فقط ردیف‌های تکه‌هایی را که این کلیدها در آن‌ها می‌افتند دوباره
+می‌خواند. ردیفی که بدون تغییر updated_at حذف یا پنهان شود (حذف یا UPDATE گروهی) با
+مقایسه تعداد ردیف‌های نمایش‌دادنی بخش با جمع تعداد تکه‌ها پیدا می‌شود و در این صورت
+آن بخش یک بار کامل پیمایش می‌شود.
+"""
+import bisect
+import hashlib
+import json
+from datetime import timedelta
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+SITEMAP_MAX_URLS = 50000
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+SITEMAP_CHANGE_OVERLAP = timedelta(minutes=10)
+
+# بخش -> (مدل، فیلتر نمایش عمومی، الگوی مسیر در سایت)
+SITEMAP_SECTIONS = {
+    'products': ('products.Product', {'is_active': True, 'is_approved': True}, '/products/{slug}/'),
+    'categories': ('categories.Category', {'is_active': True}, '/categories/{slug}/'),
+    'sellers': ('sellers.Seller', {'status': 'approved'}, '/shops/{slug}/'),
+}
+
+
+def _storage_path(name):
+    return f"{getattr(settings, 'SITEMAP_STORAGE_PATH', 'sitemaps').rstrip('/')}/{name}"
+
+
+def _site_url(path):
+    return f"{getattr(settings, 'SITE_URL', '').rstrip('/')}{path}"
+
+
+def _serialize_key(key):
+    return [key[0].isoformat(), key[1]]
+
+
+def _parse_key(boundary):
+    return parse_datetime(boundary[0]), boundary[1]
+
+
+class SitemapGenerator:
+    def __init__(self, storage=None, max_urls=SITEMAP_MAX_URLS, full=False):
+        self.storage = storage or default_storage
+        self.max_urls = max_urls
+        self.full = full
+        self.written = self.unchanged = self.deleted = 0
+
+    def load_manifest(self):
+        if not self.storage.exists(_storage_path('manifest.json')):
+            return {'next_id': 1, 'sections': {}}
+        with self.storage.open(_storage_path('manifest.json'), 'rb') as manifest:
+            return json.loads(manifest.read().decode('utf-8'))
+
+    def write(self, name, content):
+        path = _storage_path(name)
+        # AWS_S3_FILE_OVERWRITE=False است؛ بدون حذف، storage نام جدیدی می‌سازد
+        if self.storage.exists(path):
+            self.storage.delete(path)
+        self.storage.save(path, ContentFile(content.encode('utf-8')))
+
+    def queryset(self, section):
+        model_label, filters, _ = SITEMAP_SECTIONS[section]
+        return apps.get_model(model_label).objects.filter(**filters)
+
+    def rows(self, section, start=None, end=None):
+        """ردیف‌های بخش، در صورت تعیین فقط با کلید در بازه [start, end)"""
+        queryset = self.queryset(section)
+        if start is not None:
+            created_at, pk = _parse_key(start)
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gte=pk))
+        if end is not None:
+            created_at, pk = _parse_key(end)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        return queryset.order_by('created_at', 'pk').values_list(
+            'created_at', 'pk', 'slug', 'updated_at'
+        ).iterator(chunk_size=2000)
+
+    def dirty_chunks(self, section, previous_chunks, since):
+        """شماره تکه‌هایی که ردیفی با updated_at پس از since در بازه آن‌ها هست"""
+        model_label = SITEMAP_SECTIONS[section][0]
+        # ردیف‌های پنهان‌شده هم خوانده می‌شوند تا از تکه خود حذف شوند
+        changed = apps.get_model(model_label).objects.filter(updated_at__gte=since).values_list(
+            'created_at', 'pk'
+        ).iterator(chunk_size=2000)
+        boundaries = [_parse_key(chunk['start']) for chunk in previous_chunks[1:]]
+        return {bisect.bisect_right(boundaries, (created_at, str(pk))) for created_at, pk in changed}
+
+    def split(self, section, previous_chunks):
+        """
+        تقسیم ردیف‌های بخش به تکه‌ها با حفظ مرزهای قبلی
+
+        هر تکه فقط ردیف‌های خودش را در حافظه نگه می‌دارد.
+        """
+        boundaries = [(_parse_key(chunk['start']), chunk['start']) for chunk in previous_chunks[1:]]
+        chunk_index, current = 0, {'start': None, 'rows': []}
+        for created_at, pk, slug, updated_at in self.rows(section):
+            key = (created_at, str(pk))
+            while chunk_index < len(boundaries) and key >= boundaries[chunk_index][0]:
+                yield current
+                current = {'start': boundaries[chunk_index][1], 'rows': []}
+                chunk_index += 1
+            if len(current['rows']) >= self.max_urls:
+                yield current
+                current = {'start': _serialize_key(key), 'rows': [], 'split': True}
+            current['rows'].append((slug, updated_at))
+        yield current
+
+    def split_range(self, section, start, end):
+        """تقسیم ردیف‌های بازه [start, end) به تکه‌هایی با حداکثر max_urls ردیف"""
+        current = {'start': start, 'rows': []}
+        for created_at, pk, slug, updated_at in self.rows(section, start, end):
+            if len(current['rows']) >= self.max_urls:
+                yield current
+                current = {'start': _serialize_key((created_at, str(pk))), 'rows': [], 'split': True}
+            current['rows'].append((slug, updated_at))
+        yield current
+
+    def split_changed(self, section, previous_chunks, since):
+        """
+        تکه‌های بخش با پیمایش فقط تکه‌هایی که پس از since تغییر کرده‌اند
+
+        تکه‌های دست‌نخورده با کلید unchanged و همان رکورد manifest برگردانده می‌شوند.
+        """
+        dirty = self.dirty_chunks(section, previous_chunks, since)
+        for index, chunk in enumerate(previous_chunks):
+            if index not in dirty:
+                yield {'start': chunk['start'], 'unchanged': chunk}
+                continue
+            end = previous_chunks[index + 1]['start'] if index + 1 < len(previous_chunks) else None
+            yield from self.split_range(section, chunk['start'], end)
+
+    def render(self, section, rows):
+        pattern = SITEMAP_SECTIONS[section][2]
+        lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NAMESPACE}">']
+        for slug, updated_at in rows:
+            location = escape(_site_url(pattern.format(slug=quote(slug))))
+            lines.append(f'<url><loc>{location}</loc><lastmod>{updated_at.date().isoformat()}</lastmod></url>')
+        lines.append('</urlset>\n')
+        return '\n'.join(lines)
+
+    def generate_section(self, section, manifest, since=None):
+        """
+        به‌روزرسانی تکه‌های بخش؛ با since فقط تکه‌های تغییرکرده پس از آن پیمایش می‌شوند
+        """
+        previous = manifest['sections'].get(section, [])
+        incremental = since is not None and bool(previous) and not self.full
+        by_start = {json.dumps(chunk['start']): chunk for chunk in previous}
+        chunks = []
+        unchanged = self.unchanged
+        for current in (self.split_changed(section, previous, since) if incremental else self.split(section, previous)):
+            if 'unchanged' in current:
+                by_start.pop(json.dumps(current['start']), None)
+                chunks.append(current['unchanged'])
+                self.unchanged += 1
+                continue
+            rows = current['rows']
+            old = None if current.get('split') else by_start.pop(json.dumps(current['start']), None)
+            if not rows:
+                continue
+            fingerprint = hashlib.sha1(
+                '\n'.join(f'{slug}|{updated_at.isoformat()}' for slug, updated_at in rows).encode('utf-8')
+            ).hexdigest()
+            if old is not None and not self.full and old['fingerprint'] == fingerprint:
+                chunks.append(old)
+                self.unchanged += 1
+                continue
+            name = old['name'] if old else f"{section}-{manifest['next_id']}.xml"
+            if old is None:
+                manifest['next_id'] += 1
+            self.write(name, self.render(section, rows))
+            self.written += 1
+            chunks.append({
+                'name': name,
+                'start': current['start'],
+                'fingerprint': fingerprint,
+                'count': len(rows),
+                'lastmod': max(updated_at for _, updated_at in rows).isoformat(),
+            })
+        if chunks:
+            # تکه اول همیشه از ابتدای بخش شروع می‌شود
+            chunks[0]['start'] = None
+        # تکه‌هایی که دیگر ردیفی ندارند
+        kept = {chunk['name'] for chunk in chunks}
+        for chunk in previous:
+            if chunk['name'] not in kept and self.storage.exists(_storage_path(chunk['name'])):
+                self.storage.delete(_storage_path(chunk['name']))
+                self.deleted += 1
+        manifest['sections'][section] = chunks
+        if incremental and sum(chunk['count'] for chunk in chunks) != self.queryset(section).count():
+            # ردیفی بدون تغییر updated_at حذف یا پنهان شده است
+            self.unchanged = unchanged
+            self.generate_section(section, manifest)
+
+    def render_index(self, manifest):
+        lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NAMESPACE}">']
+        for section in SITEMAP_SECTIONS:
+            for chunk in manifest['sections'].get(section, []):
+                location = escape(self.storage.url(_storage_path(chunk['name'])))
+                lines.append(f"<sitemap><loc>{location}</loc><lastmod>{chunk['lastmod']}</lastmod></sitemap>")
+        lines.append('</sitemapindex>\n')
+        return '\n'.join(lines)
+
+    def generate(self):
+        manifest = self.load_manifest()
+        started_at = timezone.now()
+        since = manifest.get('generated_at') and parse_datetime(manifest['generated_at']) - SITEMAP_CHANGE_OVERLAP
+        for section in SITEMAP_SECTIONS:
+            self.generate_section(section, manifest, since)
+        manifest['generated_at'] = started_at.isoformat()
+        if self.written or self.deleted or not self.storage.exists(_storage_path('sitemap.xml')):
+            self.write('sitemap.xml', self.render_index(manifest))
+        self.write('manifest.json', json.dumps(manifest, ensure_ascii=False))
+        return {'written': self.written, 'unchanged': self.unchanged, 'deleted': self.deleted}
+
+
+def generate_sitemaps(full=False, max_urls=SITEMAP_MAX_URLS):
+    """به‌روزرسانی فایل‌های نقشه سایت؛ با full=True همه تکه‌ها از نو ساخته می‌شوند"""
+    return SitemapGenerator(max_urls=max_urls, full=full).generate()
+
+
+def sitemap_index_url():
+    return default_storage.url(_storage_path('sitemap.xml'))
@@ -0,0 +1,22 @@
+from celery import shared_task
+
+from .images import process_image, process_images
+
+
+@shared_task(name='apps.common.tasks.generate_image_derivatives')
+def generate_image_derivatives(model_label, pk):
+    """ساخت نسخه‌های کوچک‌شده یک تصویر آپلودشده"""
+    return process_image(model_label, pk)
+
+
+@shared_task(name='apps.common.tasks.generate_image_derivatives_batch')
+def generate_image_derivatives_batch(model_label, pks):
+    """ساخت نسخه‌های یک دسته از تصاویر موجود (backfill)"""
+    return process_images(model_label, pks)
+
+
+@shared_task(name='apps.common.tasks.generate_sitemaps')
+def generate_sitemaps(full=False):
+    """به‌روزرسانی دوره‌ای فایل‌های نقشه سایت"""
+    from .sitemaps import generate_sitemaps as _generate
+    return _generate(full=full)
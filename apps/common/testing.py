@@ -0,0 +1,77 @@
+"""
+داده‌های مشترک تست‌ها
+
+سازنده‌های کاربر، فروشنده، دسته‌بندی، محصول، آدرس و روش ارسال با مقادیر پیش‌فرض
+معمول تست‌ها. شماره موبایل و slugها از یک شمارنده ساخته می‌شوند تا کلاس‌های تست
+آن‌ها را دستی شماره‌گذاری نکنند. CatalogTestMixin برای هر کلاس تست یک فروشنده
+(با کاربر آن) و یک دسته‌بندی می‌سازد.
+"""
+import itertools
+
+_sequence = itertools.count(1)
+
+
+def create_user(password='pass', **kwargs):
+    from apps.accounts.models import User
+
+    kwargs.setdefault('phone_number', f'0915{next(_sequence):07}')
+    return User.objects.create_user(password=password, **kwargs)
+
+
+def create_seller(user=None, **kwargs):
+    from apps.sellers.models import Seller
+
+    kwargs.setdefault('shop_name', 'فروشگاه')
+    kwargs.setdefault('slug', f'shop-{next(_sequence)}')
+    return Seller.objects.create(user=user or create_user(), **kwargs)
+
+
+def create_category(slug=None, **kwargs):
+    from apps.categories.models import Category
+
+    kwargs.setdefault('name', 'دسته')
+    return Category.objects.create(slug=slug or f'category-{next(_sequence)}', **kwargs)
+
+
+def create_product(seller, category, slug=None, **kwargs):
+    """محصول فعال و تاییدشده؛ نام پیش‌فرض همان slug است"""
+    from apps.products.models import Product
+
+    slug = slug or f'product-{next(_sequence)}'
+    fields = {
+        'name': slug, 'description': '-', 'price': 1000, 'is_active': True, 'is_approved': True, **kwargs
+    }
+    return Product.objects.create(seller=seller, category=category, slug=slug, **fields)
+
+
+def create_address(user, **kwargs):
+    from apps.accounts.models import Address
+
+    fields = {
+        'title': 'خانه', 'province': 'تهران', 'city': 'تهران', 'postal_code': '1234567890',
+        'address': '-', 'receiver_name': '-', 'receiver_phone': user.phone_number, **kwargs
+    }
+    return Address.objects.create(user=user, **fields)
+
+
+def create_shipping_method(**kwargs):
+    from apps.shipping.models import ShippingMethod
+
+    fields = {'name': 'پست', 'cost': 200, **kwargs}
+    return ShippingMethod.objects.create(**fields)
+
+
+class CatalogTestMixin:
+    """cls.seller، cls.user (کاربر فروشنده) و cls.category برای کلاس تست"""
+    category_slug = None
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.seller = create_seller()
+        cls.user = cls.seller.user
+        cls.category = create_category(cls.category_slug)
+
+    @classmethod
+    def create_product(cls, slug=None, **kwargs):
+        return create_product(cls.seller, cls.category, slug, **kwargs)
@@ -1,3 +1,149 @@
-from django.test import TestCase
+import shutil
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.products.models import Product
+from .sitemaps import SitemapGenerator
+from .testing import CatalogTestMixin, create_address, create_shipping_method, create_user
+
+
+@override_settings(SITE_URL='https://shop.example')
+class SitemapTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(5):
+            cls.create_product(f'product-{i}')
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = FileSystemStorage(location=location, base_url='/static-sitemaps/')
+
+    def _generate(self):
+        return SitemapGenerator(storage=self.storage, max_urls=2).generate()
+
+    def _read(self, name):
+        with self.storage.open(f'sitemaps/{name}') as sitemap:
+            return sitemap.read().decode('utf-8')
+
+    def test_chunks_are_rewritten_only_when_their_rows_change(self):
+        # سه تکه محصول و یک تکه دسته‌بندی؛ فروشگاه تاییدنشده در نقشه نیست
+        self.assertEqual(self._generate(), {'written': 4, 'unchanged': 0, 'deleted': 0})
+        index = self._read('sitemap.xml')
+        self.assertEqual(index.count('<sitemap>'), 4)
+        self.assertIn('/static-sitemaps/sitemaps/products-1.xml', index)
+        self.assertIn('<loc>https://shop.example/products/product-0/</loc>', self._read('products-1.xml'))
+
+        self.assertEqual(self._generate(), {'written': 0, 'unchanged': 4, 'deleted': 0})
+
+        Product.objects.get(slug='product-3').save()
+        self.assertEqual(self._generate(), {'written': 1, 'unchanged': 3, 'deleted': 0})
+
+        # تکه آخر پر می‌شود و از همان نقطه شکسته می‌شود؛ تکه‌های قبلی دست نمی‌خورند
+        self.create_product('product-5')
+        self.create_product('product-6')
+        self.assertEqual(self._generate(), {'written': 2, 'unchanged': 3, 'deleted': 0})
+
+        Product.objects.filter(slug__in=['product-0', 'product-1']).delete()
+        self.assertEqual(self._generate(), {'written': 0, 'unchanged': 4, 'deleted': 1})
+        self.assertEqual(self._read('sitemap.xml').count('<sitemap>'), 4)
+        self.assertFalse(self.storage.exists('sitemaps/products-1.xml'))
+
+    def test_only_chunks_with_recent_updates_are_scanned(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.categories.models import Category
+
+        yesterday = timezone.now() - timedelta(days=1)
+        Product.objects.update(updated_at=yesterday)
+        Category.objects.update(updated_at=yesterday)
+        self._generate()
+        # تغییر بدون updated_at در تکه اول دیده نمی‌شود چون ردیف‌های آن دوباره خوانده نمی‌شوند
+        Product.objects.filter(slug='product-0').update(slug='renamed-0')
+        Product.objects.get(slug='product-3').save()
+        self.assertEqual(self._generate(), {'written': 1, 'unchanged': 3, 'deleted': 0})
+        self.assertIn('/products/product-0/', self._read('products-1.xml'))
+
+        result = SitemapGenerator(storage=self.storage, max_urls=2, full=True).generate()
+        self.assertEqual(result, {'written': 4, 'unchanged': 0, 'deleted': 0})
+        self.assertIn('/products/renamed-0/', self._read('products-1.xml'))
+
+
+class CursorOptInPaginationTests(TestCase):
+    """
+    endpointهای موجود بدون cursor همان صفحه‌بندی شماره‌دار را دارند و با ?cursor= کرسری می‌شوند
+    """
+    @classmethod
+    def setUpTestData(cls):
+        from apps.notifications.models import Notification
+        from apps.orders.models import Order
+        from apps.wallet.models import Wallet, WalletTransaction
+        from .models import ActivityLog
+
+        cls.user = create_user(is_staff=True)
+        wallet = Wallet.objects.create(user=cls.user)
+        address, method = create_address(cls.user), create_shipping_method()
+        for number in range(5):
+            Notification.objects.create(user=cls.user, type='system', title=f'اعلان {number}', message='-')
+            ActivityLog.objects.create(user=cls.user, action='login')
+            WalletTransaction.objects.create(wallet=wallet, amount=1000, transaction_type='deposit')
+            Order.objects.create(
+                user=cls.user, order_number=f'ORD-{number}', total_price=0, final_price=0,
+                shipping_address=address, shipping_method=method,
+            )
+        cls.endpoints = {
+            '/api/commonactivities/': ActivityLog.objects.all(),
+            '/api/notifications/': Notification.objects.all(),
+            '/api/wallet/wallet/transactions/': WalletTransaction.objects.all(),
+            '/api/wallet/admin/transactions/': WalletTransaction.objects.all(),
+            '/api/orders/orders/': Order.objects.all(),
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_page_numbers_stay_the_default(self):
+        for url, queryset in self.endpoints.items():
+            response = self.client.get(url, {'page_size': 2})
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual((response.data['count'], response.data['total_pages']), (5, 3), url)
+            response = self.client.get(url, {'page_size': 2, 'page': 3})
+            self.assertEqual(response.data['current_page'], 3, url)
+
+    def test_cursor_parameter_opts_in(self):
+        for url, queryset in self.endpoints.items():
+            expected = [str(pk) for pk in queryset.order_by('-created_at', '-pk').values_list('pk', flat=True)]
+            pages, response = [], self.client.get(url, {'page_size': 2, 'cursor': ''})
+            self.assertNotIn('count', response.data, url)
+            while True:
+                pages.append([str(row['id']) for row in response.data['results']])
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+            self.assertEqual(sum(pages, []), expected[:5], url)
+
+            # بازگشت به صفحه اول در حالت کرسری می‌ماند
+            previous = self.client.get(self.client.get(response.data['previous']).data['previous'])
+            self.assertEqual([str(row['id']) for row in previous.data['results']], pages[0], url)
+            self.assertNotIn('count', previous.data, url)
+
+    def test_nullable_and_expression_orderings_are_rejected(self):
+        from django.db.models import F
+        from rest_framework.exceptions import ValidationError
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from apps.notifications.models import Notification
+        from .pagination import KeysetPagination
+
+        request = Request(APIRequestFactory().get('/', {'cursor': ''}))
+        for ordering in ('-read_at', 'content_type__model', F('created_at').desc()):
+            with self.assertRaises(ValidationError):
+                KeysetPagination().paginate_queryset(Notification.objects.order_by(ordering), request)
+        page = KeysetPagination().paginate_queryset(Notification.objects.order_by('user__phone_number'), request)
+        self.assertEqual(len(page), 5)
 
-# Create your tests here.
@@ -15,7 +15,7 @@ from .serializers import (
     CitySerializer, BannerSerializer, NewsletterSerializer,
     NewsletterSubscribeSerializer
 )
-from .pagination import StandardResultsSetPagination
+from .pagination import StandardResultsSetPagination, CursorOptInPagination
 
 
 class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
@@ -23,7 +23,7 @@ class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ActivityLog.objects.all()
     serializer_class = ActivityLogSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CursorOptInPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['action', 'user']
     search_fields = ['description', 'user__phone']
@@ -103,10 +103,9 @@ class ApplyDiscountSerializer(serializers.Serializer):
             raise serializers.ValidationError('کد تخفیف هنوز فعال نشده است')
         
         # بررسی سبد خرید
-        from apps.orders.models import Cart, CartStatus
-        try:
-            cart = Cart.objects.get(id=cart_id, status=CartStatus.OPEN)
-        except Cart.DoesNotExist:
+        from apps.orders.cart_store import get_cart_store
+        cart = get_cart_store().get(cart_id)
+        if cart is None:
             raise serializers.ValidationError('سبد خرید نامعتبر است')
         
         # بررسی کاربر
@@ -128,7 +127,8 @@ class ApplyDiscountSerializer(serializers.Serializer):
                 raise serializers.ValidationError('شما قبلاً از این کد تخفیف استفاده کرده‌اید')
         
         # بررسی حداقل خرید
-        cart_total = sum(item.total_price for item in cart.items.all())
+        pricing = cart.pricing
+        cart_total = pricing['subtotal']
         if cart_total < discount.min_purchase:
             raise serializers.ValidationError(f'حداقل مبلغ خرید برای استفاده از این کد تخفیف {discount.min_purchase} تومان است')
         
@@ -139,11 +139,12 @@ class ApplyDiscountSerializer(serializers.Serializer):
             allowed_categories = list(discount.specific_categories.values_list('id', flat=True))
             
             # بررسی محصولات سبد خرید
-            valid_items = False
-            for item in cart.items.all():
-                if item.product.id in allowed_products or item.product.category.id in allowed_categories:
-                    valid_items = True
-                    break
+            allowed_products = {str(pk) for pk in allowed_products}
+            allowed_categories = {str(pk) for pk in allowed_categories}
+            valid_items = any(
+                line['product_id'] in allowed_products or line['category_id'] in allowed_categories
+                for line in pricing['lines'].values()
+            )
             
             if not valid_items:
                 raise serializers.ValidationError('این کد تخفیف فقط برای محصولات خاص قابل استفاده است')
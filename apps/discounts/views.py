@@ -15,6 +15,7 @@ from .serializers import (
     LoyaltyRewardSerializer, LoyaltyRewardClaimSerializer,
     ApplyDiscountSerializer, ClaimLoyaltyRewardSerializer
 )
+from apps.orders.cart_store import get_cart_store
 from apps.sellers.permissions import IsAdminUser
 
 
@@ -93,14 +94,14 @@ class ApplyDiscountView(generics.GenericAPIView):
         # ذخیره کد تخفیف در سبد خرید
         cart.discount_code = discount.code
         cart.discount_amount = discount_amount
-        cart.save()
+        get_cart_store().touch(cart)
         
         return Response({
             'status': 'کد تخفیف با موفقیت اعمال شد',
             'discount_code': discount.code,
             'discount_amount': discount_amount,
-            'cart_total_before_discount': sum(item.total_price for item in cart.items.all()),
-            'cart_total_after_discount': sum(item.total_price for item in cart.items.all()) - discount_amount
+            'cart_total_before_discount': cart.pricing['subtotal'],
+            'cart_total_after_discount': cart.pricing['subtotal'] - discount_amount
         })
 
 
@@ -9,14 +9,14 @@ from .serializers import (
     NotificationSerializer, NotificationSettingSerializer, DeviceTokenSerializer,
     NotificationCountSerializer, BulkNotificationActionSerializer
 )
-from apps.common.pagination import StandardResultsSetPagination
+from apps.common.pagination import CursorOptInPagination
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
     """Notification viewset for user notifications"""
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CursorOptInPagination
     
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user).order_by('-created_at')
@@ -0,0 +1,449 @@
+"""
+ذخیره‌سازی سبدهای خرید باز
+
+CartViewSet همه تغییرات سبد را از طریق یکی از دو backend زیر انجام می‌دهد که با
+تنظیم CART_BACKEND انتخاب می‌شود:
+
+- 'database' (پیش‌فرض): سبد و آیتم‌ها ردیف‌های Cart و CartItem هستند.
+- 'redis': سبدهای باز (از جمله سبد مهمان با session_key) در یک hash ردیس با TTL
+  نگهداری می‌شوند و افزودن یا تغییر آیتم‌ها هیچ نوشتنی در پایگاه داده ندارد. سبد
+  فقط هنگام ثبت سفارش (persist_checkout در تراکنش ثبت سفارش) یا پس از گذشتن
+  CART_STORE_TTL از آخرین تغییر (persist_idle_carts) در Cart و CartItem نوشته می‌شود. سبد ذخیره‌شده در پایگاه
+  داده با اولین دسترسی دوباره به ردیس بارگذاری می‌شود.
+
+ساختار داده‌ها در ردیس:
+    cart_store:cart:<id>       hash با فیلدهای meta، item:<شناسه آیتم> و qty:<شناسه آیتم>
+    cart_store:owner:<مالک>    شناسه سبد باز کاربر یا نشست
+    cart_store:deadlines       sorted set شناسه سبدها با مهلت ذخیره در پایگاه داده
+
+شناسه هر آیتم از شناسه سبد، محصول و تنوع ساخته می‌شود تا افزودن هم‌زمان یک محصول
+با HINCRBY روی همان آیتم جمع شود.
+"""
+import json
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Cart, CartItem, CartStatus
+from .pricing import invalidate_cart_pricing
+
+CART_STORE_TTL = getattr(settings, 'CART_STORE_TTL', 60 * 60 * 24 * 7)
+# فاصله مهلت ذخیره تا انقضای کلیدها؛ سبد در این فاصله توسط persist_idle_carts ذخیره می‌شود
+CART_STORE_GRACE = getattr(settings, 'CART_STORE_GRACE', 60 * 60 * 24)
+
+
+def cart_owner(request):
+    """فیلتر مالک سبد درخواست: کاربر واردشده یا کلید نشست مهمان"""
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    if not request.session.session_key:
+        request.session.save()
+    return {'session_key': request.session.session_key}
+
+
+def _cart_uuid(cart_id):
+    try:
+        return uuid.UUID(str(cart_id))
+    except ValueError:
+        return None
+
+
+class BaseCartStore:
+    def get_item(self, cart, item_id):
+        return next((item for item in cart.priced_items if str(item.pk) == str(item_id)), None)
+
+
+class DatabaseCartStore(BaseCartStore):
+    def get_active(self, owner, create=True):
+        """سبد باز مالک؛ خروجی: (سبد، ایجادشده)"""
+        cart = Cart.objects.filter(status=CartStatus.OPEN, **owner).first()
+        if cart is None and create:
+            return Cart.objects.create(**owner), True
+        return cart, False
+
+    def open_carts(self, owner):
+        return Cart.objects.filter(status=CartStatus.OPEN, **owner)
+
+    def get(self, cart_id):
+        if _cart_uuid(cart_id) is None:
+            return None
+        return Cart.objects.filter(pk=cart_id, status=CartStatus.OPEN).first()
+
+    def touch(self, cart):
+        # به‌روزرسانی زمان سبد خرید
+        cart.save()
+        invalidate_cart_pricing(cart)
+
+    def add_item(self, cart, product, variant, quantity, unit_price):
+        # بررسی وجود آیتم مشابه در سبد
+        try:
+            cart_item = CartItem.objects.get(cart=cart, product=product, variant=variant)
+            # به‌روزرسانی تعداد
+            cart_item.quantity += quantity
+            cart_item.save()
+        except CartItem.DoesNotExist:
+            # ایجاد آیتم جدید
+            cart_item = CartItem.objects.create(
+                cart=cart, product=product, variant=variant, quantity=quantity, unit_price=unit_price
+            )
+        self.touch(cart)
+        return cart_item
+
+    def update_item(self, cart, item, quantity):
+        item.quantity = quantity
+        item.save()
+        self.touch(cart)
+        return item
+
+    def remove_item(self, cart, item):
+        item.delete()
+        self.touch(cart)
+
+    def clear(self, cart):
+        cart.items.all().delete()
+        self.touch(cart)
+
+    def delete(self, cart):
+        cart.delete()
+
+    def checkout_cart(self, cart_id):
+        """سبد باز برای اعتبارسنجی ثبت سفارش؛ بدون هیچ نوشتنی"""
+        return self.get(cart_id)
+
+    def persist_checkout(self, cart):
+        """ردیف پایگاه داده سبد برای ثبت سفارش؛ سبد این backend از قبل ردیف است"""
+        return cart
+
+    def discard(self, cart):
+        """حذف نسخه موقت سبد پس از ثبت سفارش؛ در این backend نسخه موقتی وجود ندارد"""
+
+    def persist_idle_carts(self):
+        return 0
+
+    def live_cart_ids(self, cart_ids):
+        """شناسه سبدهایی که نسخه به‌روزتری بیرون از پایگاه داده دارند؛ در این backend وجود ندارد"""
+        return set()
+
+    def abandon_idle_carts(self, cutoff, limit):
+        """سبدهای بیرون از پایگاه داده که از cutoff تغییر نکرده‌اند؛ در این backend وجود ندارد"""
+        return []
+
+
+class RedisCartStore(BaseCartStore):
+    deadlines_key = 'cart_store:deadlines'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @staticmethod
+    def _cart_key(cart_id):
+        return f'cart_store:cart:{cart_id}'
+
+    @staticmethod
+    def _owner_key(user_id=None, session_key=None):
+        if user_id is not None:
+            return f'cart_store:owner:user:{user_id}'
+        return f'cart_store:owner:session:{session_key}'
+
+    def _owner_key_for(self, owner):
+        user = owner.get('user')
+        return self._owner_key(user.pk if user is not None else None, owner.get('session_key'))
+
+    @staticmethod
+    def _item_id(cart_id, product_id, variant_id):
+        return uuid.uuid5(uuid.UUID(str(cart_id)), f'{product_id}:{variant_id or ""}')
+
+    def _touch(self, pipeline, cart):
+        """به‌روزرسانی زمان سبد و تمدید TTL کلیدها در همان pipeline"""
+        cart.updated_at = timezone.now()
+        key = self._cart_key(cart.pk)
+        owner_key = self._owner_key(cart.user_id, cart.session_key)
+        expiry = CART_STORE_TTL + CART_STORE_GRACE
+        pipeline.hset(key, 'meta', json.dumps({
+            'user_id': cart.user_id and str(cart.user_id),
+            'session_key': cart.session_key,
+            'created_at': cart.created_at.isoformat(),
+            'updated_at': cart.updated_at.isoformat(),
+        }))
+        pipeline.expire(key, expiry)
+        pipeline.set(owner_key, str(cart.pk), ex=expiry)
+        pipeline.zadd(self.deadlines_key, {str(cart.pk): time.time() + CART_STORE_TTL})
+
+    def _load(self, cart_id, connection=None):
+        cart_uuid = _cart_uuid(cart_id)
+        if cart_uuid is None:
+            return None
+        data = (connection or self.connection).hgetall(self._cart_key(cart_uuid))
+        if b'meta' not in data:
+            return None
+        meta = json.loads(data[b'meta'])
+        cart = Cart(
+            id=cart_uuid,
+            user_id=Cart._meta.get_field('user').to_python(meta['user_id']),
+            session_key=meta['session_key'],
+            status=CartStatus.OPEN,
+            created_at=parse_datetime(meta['created_at']),
+            updated_at=parse_datetime(meta['updated_at']),
+        )
+        rows = {}
+        for field, value in data.items():
+            kind, _, item_id = field.decode().partition(':')
+            if kind == 'item':
+                rows.setdefault(item_id, {}).update(json.loads(value))
+            elif kind == 'qty':
+                rows.setdefault(item_id, {})['quantity'] = int(value)
+        cart._priced_items = self._build_items(cart, rows)
+        return cart
+
+    def _build_items(self, cart, rows):
+        """ساخت CartItem (ذخیره‌نشده) از آیتم‌های ردیس با یک کوئری برای محصولات و یک کوئری برای تنوع‌ها"""
+        from apps.products.models import Product, ProductVariant
+
+        # آیتمی که هم‌زمان با حذف، تعدادش تغییر کرده فقط فیلد qty دارد
+        rows = {item_id: row for item_id, row in rows.items() if 'product_id' in row and row.get('quantity', 0) > 0}
+        if not rows:
+            return []
+        products = Product.objects.select_related('seller', 'category').in_bulk(
+            {row['product_id'] for row in rows.values()}
+        )
+        variant_ids = {row['variant_id'] for row in rows.values() if row['variant_id']}
+        variants = ProductVariant.objects.in_bulk(variant_ids) if variant_ids else {}
+        items = []
+        for item_id, row in rows.items():
+            product = products.get(uuid.UUID(row['product_id']))
+            variant = variants.get(uuid.UUID(row['variant_id'])) if row['variant_id'] else None
+            if product is None or (row['variant_id'] and variant is None):
+                # محصول یا تنوع پس از افزودن به سبد حذف شده است
+                continue
+            items.append(CartItem(
+                id=uuid.UUID(item_id),
+                cart=cart,
+                product=product,
+                variant=variant,
+                quantity=row['quantity'],
+                unit_price=Decimal(row['unit_price']),
+                created_at=parse_datetime(row['created_at']),
+                updated_at=cart.updated_at,
+            ))
+        items.sort(key=lambda item: item.created_at)
+        return items
+
+    def _refresh(self, cart):
+        invalidate_cart_pricing(cart)
+        loaded = self._load(cart.pk)
+        cart._priced_items = loaded._priced_items if loaded is not None else []
+
+    def _hydrate(self, stored):
+        """بارگذاری سبد ذخیره‌شده در پایگاه داده به ردیس"""
+        pipeline = self.connection.pipeline()
+        key = self._cart_key(stored.pk)
+        for item in stored.items.all():
+            item_id = self._item_id(stored.pk, item.product_id, item.variant_id)
+            pipeline.hset(key, f'item:{item_id}', json.dumps({
+                'product_id': str(item.product_id),
+                'variant_id': item.variant_id and str(item.variant_id),
+                'unit_price': str(item.unit_price),
+                'created_at': item.created_at.isoformat(),
+            }))
+            pipeline.hset(key, f'qty:{item_id}', item.quantity)
+        self._touch(pipeline, stored)
+        pipeline.execute()
+        return self._load(stored.pk)
+
+    def get_active(self, owner, create=True):
+        cart_id = self.connection.get(self._owner_key_for(owner))
+        cart = self._load(cart_id.decode()) if cart_id else None
+        if cart is not None:
+            return cart, False
+        stored = Cart.objects.filter(status=CartStatus.OPEN, **owner).first()
+        if stored is not None:
+            return self._hydrate(stored), False
+        if not create:
+            return None, False
+        now = timezone.now()
+        cart = Cart(status=CartStatus.OPEN, created_at=now, updated_at=now, **owner)
+        pipeline = self.connection.pipeline()
+        self._touch(pipeline, cart)
+        pipeline.execute()
+        cart._priced_items = []
+        return cart, True
+
+    def open_carts(self, owner):
+        cart, _ = self.get_active(owner, create=False)
+        return [cart] if cart is not None else []
+
+    def get(self, cart_id):
+        cart = self._load(cart_id)
+        if cart is None and _cart_uuid(cart_id) is not None:
+            stored = Cart.objects.filter(pk=cart_id, status=CartStatus.OPEN).first()
+            cart = self._hydrate(stored) if stored is not None else None
+        return cart
+
+    def touch(self, cart):
+        pipeline = self.connection.pipeline()
+        self._touch(pipeline, cart)
+        pipeline.execute()
+
+    def add_item(self, cart, product, variant, quantity, unit_price):
+        item_id = self._item_id(cart.pk, product.pk, variant and variant.pk)
+        key = self._cart_key(cart.pk)
+        pipeline = self.connection.pipeline()
+        pipeline.hsetnx(key, f'item:{item_id}', json.dumps({
+            'product_id': str(product.pk),
+            'variant_id': variant and str(variant.pk),
+            'unit_price': str(unit_price),
+            'created_at': timezone.now().isoformat(),
+        }))
+        pipeline.hincrby(key, f'qty:{item_id}', quantity)
+        self._touch(pipeline, cart)
+        pipeline.execute()
+        self._refresh(cart)
+        return self.get_item(cart, item_id)
+
+    def update_item(self, cart, item, quantity):
+        pipeline = self.connection.pipeline()
+        pipeline.hset(self._cart_key(cart.pk), f'qty:{item.pk}', quantity)
+        self._touch(pipeline, cart)
+        pipeline.execute()
+        self._refresh(cart)
+        return self.get_item(cart, item.pk)
+
+    def remove_item(self, cart, item):
+        pipeline = self.connection.pipeline()
+        pipeline.hdel(self._cart_key(cart.pk), f'item:{item.pk}', f'qty:{item.pk}')
+        self._touch(pipeline, cart)
+        pipeline.execute()
+        self._refresh(cart)
+
+    def clear(self, cart):
+        key = self._cart_key(cart.pk)
+        pipeline = self.connection.pipeline()
+        pipeline.delete(key)
+        self._touch(pipeline, cart)
+        pipeline.execute()
+        self._refresh(cart)
+
+    def delete(self, cart):
+        self.discard(cart)
+        Cart.objects.filter(pk=cart.pk, status=CartStatus.OPEN).delete()
+
+    @transaction.atomic
+    def persist(self, cart, status=CartStatus.OPEN):
+        """نوشتن سبد در Cart و CartItem؛ آیتم‌های ذخیره‌شده قبلی جایگزین می‌شوند"""
+        stored, _ = Cart.objects.update_or_create(pk=cart.pk, defaults={
+            'user_id': cart.user_id,
+            'session_key': cart.session_key,
+            'status': status,
+        })
+        CartItem.objects.filter(cart=stored).delete()
+        CartItem.objects.bulk_create([
+            CartItem(
+                id=item.pk, cart=stored, product=item.product, variant=item.variant,
+                quantity=item.quantity, unit_price=item.unit_price,
+            )
+            for item in cart.priced_items
+        ])
+        return stored
+
+    def checkout_cart(self, cart_id):
+        """سبد باز برای اعتبارسنجی ثبت سفارش از ردیس یا پایگاه داده؛ بدون هیچ نوشتنی"""
+        cart = self._load(cart_id)
+        if cart is None and _cart_uuid(cart_id) is not None:
+            cart = Cart.objects.filter(pk=cart_id, status=CartStatus.OPEN).first()
+        return cart
+
+    def persist_checkout(self, cart):
+        """
+        نوشتن سبد ردیس در پایگاه داده در تراکنش ثبت سفارش؛ نسخه ردیس تا پایان ثبت
+        سفارش (discard) باقی می‌ماند
+        """
+        if not cart._state.adding:
+            return cart
+        stored = self.persist(cart)
+        stored._priced_items = cart.priced_items
+        return stored
+
+    def discard(self, cart):
+        owner_key = self._owner_key(cart.user_id, cart.session_key)
+        pipeline = self.connection.pipeline()
+        pipeline.delete(self._cart_key(cart.pk))
+        pipeline.zrem(self.deadlines_key, str(cart.pk))
+        pipeline.execute()
+        if self.connection.get(owner_key) == str(cart.pk).encode():
+            self.connection.delete(owner_key)
+
+    def _evict(self, raw_ids, status):
+        """
+        ذخیره سبدهای raw_ids با وضعیت status در پایگاه داده و حذف آن‌ها از ردیس
+
+        خروجی: سبدهای ذخیره‌شده
+        """
+        from redis.exceptions import WatchError
+
+        persisted = []
+        for raw_id in raw_ids:
+            cart_id = raw_id.decode()
+            key = self._cart_key(cart_id)
+            with self.connection.pipeline() as pipeline:
+                try:
+                    # اگر کاربر در همین فاصله سبد را تغییر دهد، حذف انجام نمی‌شود
+                    pipeline.watch(key)
+                    cart = self._load(cart_id, connection=pipeline)
+                    # سبد خالی فقط اگر پیش‌تر ذخیره شده باشد (برای حذف آیتم‌های قبلی) نوشته می‌شود
+                    stored = cart is not None and (cart.priced_items or Cart.objects.filter(pk=cart.pk).exists())
+                    if stored:
+                        self.persist(cart, status=status)
+                    pipeline.multi()
+                    pipeline.delete(key)
+                    pipeline.zrem(self.deadlines_key, cart_id)
+                    pipeline.execute()
+                except WatchError:
+                    continue
+            if stored:
+                persisted.append(cart)
+            if cart is not None:
+                owner_key = self._owner_key(cart.user_id, cart.session_key)
+                if self.connection.get(owner_key) == raw_id:
+                    self.connection.delete(owner_key)
+        return persisted
+
+    def persist_idle_carts(self):
+        """ذخیره سبدهایی که مهلتشان گذشته در پایگاه داده و حذف آن‌ها از ردیس"""
+        return len(self._evict(
+            self.connection.zrangebyscore(self.deadlines_key, '-inf', time.time()), CartStatus.OPEN
+        ))
+
+    def live_cart_ids(self, cart_ids):
+        """
+        شناسه سبدهایی که در ردیس بارگذاری شده‌اند
+
+        updated_at ردیف پایگاه داده این سبدها با تغییرات ردیس به‌روز نمی‌شود.
+        """
+        cart_ids = [str(cart_id) for cart_id in cart_ids]
+        pipeline = self.connection.pipeline()
+        for cart_id in cart_ids:
+            pipeline.exists(self._cart_key(cart_id))
+        return {cart_id for cart_id, exists in zip(cart_ids, pipeline.execute()) if exists}
+
+    def abandon_idle_carts(self, cutoff, limit):
+        """
+        ذخیره حداکثر limit سبد ردیس بدون تغییر از cutoff با وضعیت «رها شده»
+
+        مهلت هر سبد در deadlines زمان آخرین تغییر آن به علاوه CART_STORE_TTL است.
+        خروجی: سبدهای رهاشده
+        """
+        return self._evict(self.connection.zrangebyscore(
+            self.deadlines_key, '-inf', cutoff.timestamp() + CART_STORE_TTL, start=0, num=limit
+        ), CartStatus.ABANDONED)
+
+
+def get_cart_store():
+    if getattr(settings, 'CART_BACKEND', 'database') == 'redis':
+        from django_redis import get_redis_connection
+        return RedisCartStore(get_redis_connection('default'))
+    return DatabaseCartStore()
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['status', 'updated_at'], name='cart_status_updated_idx'),
+        ),
+    ]
@@ -25,23 +25,38 @@ class Cart(models.Model):
         verbose_name = _('سبد خرید')
         verbose_name_plural = _('سبدهای خرید')
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='cart_status_updated_idx'),
+        ]
     
     def __str__(self):
         if self.user:
             return f"سبد خرید {self.user.get_full_name()}"
         return f"سبد خرید مهمان {self.session_key}"
     
+    @property
+    def pricing(self):
+        """خلاصه قیمت سبد (apps.orders.pricing)"""
+        from .pricing import get_cart_pricing
+        return get_cart_pricing(self)
+    
+    @property
+    def priced_items(self):
+        """آیتم‌های سبد همراه با محصول و تنوع"""
+        from .pricing import load_cart_items
+        return load_cart_items(self)
+    
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.pricing['subtotal']
     
     @property
     def total_discount(self):
-        return sum(item.total_discount for item in self.items.all())
+        return self.pricing['total_discount']
     
     @property
     def total_items_count(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.pricing['items_count']
 
 
 class CartItem(models.Model):
@@ -70,9 +85,8 @@ class CartItem(models.Model):
     
     @property
     def total_discount(self):
-        if self.product.discount_price:
-            return (self.product.price - self.product.discount_price) * self.quantity
-        return 0
+        from .pricing import line_discount
+        return line_discount(self)
 
 
 class OrderStatus(models.TextChoices):
@@ -111,6 +125,11 @@ class Order(models.Model):
         verbose_name = _('سفارش')
         verbose_name_plural = _('سفارشات')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['payment_method', 'created_at'], name='order_payment_created_idx'),
+        ]
     
     def __str__(self):
         return f"سفارش {self.order_number} - {self.user.get_full_name()}"
@@ -137,6 +156,9 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = _('آیتم سفارش')
         verbose_name_plural = _('آیتم‌های سفارش')
+        indexes = [
+            models.Index(fields=['seller', 'order'], name='orderitem_seller_order_idx'),
+        ]
     
     def __str__(self):
         variant_name = f" - {self.variant_name}" if self.variant_name else ""
@@ -161,6 +183,40 @@ class OrderHistory(models.Model):
         return f"سفارش {self.order.order_number} - {self.get_status_display()}"
 
 
+class ReservationStatus(models.TextChoices):
+    ACTIVE = 'active', _('فعال')
+    CONVERTED = 'converted', _('تبدیل به فروش')
+    RELEASED = 'released', _('آزاد شده')
+
+
+class StockReservation(models.Model):
+    """
+    رزرو موجودی یک آیتم سفارش از ثبت سفارش تا پرداخت
+
+    مقدار رزروهای فعال در reserved_stock محصول یا تنوع جمع می‌شود (apps.orders.reservations)
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='reservations')
+    variant = models.ForeignKey('products.ProductVariant', on_delete=models.CASCADE,
+                                null=True, blank=True, related_name='reservations')
+    quantity = models.PositiveIntegerField(_('تعداد'))
+    status = models.CharField(_('وضعیت'), max_length=20, choices=ReservationStatus.choices,
+                              default=ReservationStatus.ACTIVE)
+    expires_at = models.DateTimeField(_('تاریخ انقضا'))
+    created_at = models.DateTimeField(_('تاریخ ایجاد'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('رزرو موجودی')
+        verbose_name_plural = _('رزروهای موجودی')
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"رزرو {self.quantity} عدد - سفارش {self.order.order_number}"
+
+
 class OrderReturn(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     order_item = models.ForeignKey(OrderItem, on_delete=models.CASCADE, related_name='returns')
@@ -192,6 +248,7 @@ class OrderReturnImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     order_return = models.ForeignKey(OrderReturn, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(_('تصویر'), upload_to='return_images/')
+    derivatives = models.JSONField(_('نسخه‌های تصویر'), default=dict, blank=True, editable=False)
     
     class Meta:
         verbose_name = _('تصویر مرجوعی')
@@ -0,0 +1,152 @@
+"""
+موتور قیمت‌گذاری سبد خرید
+
+آیتم‌های سبد همراه با محصول و تنوع با یک کوئری خوانده می‌شوند و جمع قیمت، تخفیف،
+تعداد، وزن و مالیات در یک گذر محاسبه می‌شوند. خلاصه حاصل روی نمونه سبد و در کش
+(بر اساس شناسه سبد) نگهداری می‌شود و افزودن، تغییر تعداد، حذف آیتم و خالی کردن سبد
+آن را نامعتبر می‌کنند. خلاصه کش‌شده همراه با نسخه جزئیات محصولات سبد
+(apps.products.cache) ذخیره می‌شود؛ تغییر قیمت، تخفیف، وزن یا تنوع یک محصول نسخه آن را
+عوض می‌کند و خلاصه در خواندن بعدی دوباره ساخته می‌شود. هزینه ارسال به روش ارسال
+انتخاب‌شده وابسته است و روی همین خلاصه محاسبه می‌شود.
+
+خطاهای سرور کش ثبت و نادیده گرفته می‌شوند.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.common.utils import CacheManager
+from apps.products.cache import get_detail_versions
+
+CART_PRICING_CACHE_TIMEOUT = getattr(settings, 'CART_PRICING_CACHE_TTL', 60 * 15)
+CART_TAX_RATE = Decimal(str(getattr(settings, 'CART_TAX_RATE', '0.09')))
+
+logger = logging.getLogger(__name__)
+
+
+def _pricing_key(cart_id):
+    return CacheManager.get_cache_key('cart_pricing', cart_id)
+
+
+def cart_items_queryset(cart):
+    """آیتم‌های سبد همراه با محصول، دسته، فروشنده و تنوع در یک کوئری"""
+    from .models import CartItem
+
+    return CartItem.objects.filter(cart_id=cart.pk).select_related(
+        'product__seller', 'product__category', 'variant'
+    ).order_by('created_at')
+
+
+def load_cart_items(cart):
+    """آیتم‌های سبد؛ تا نامعتبر شدن قیمت‌گذاری روی نمونه سبد نگه داشته می‌شوند"""
+    if getattr(cart, '_priced_items', None) is None:
+        cart._priced_items = list(cart_items_queryset(cart))
+    return cart._priced_items
+
+
+def line_discount(item):
+    """تخفیف یک آیتم: اختلاف قیمت پایه (با تغییر قیمت تنوع) و قیمت واحد ثبت‌شده"""
+    product = item.product
+    if not product.discount_price:
+        return Decimal(0)
+    list_price = product.price + (item.variant.price_adjustment if item.variant else 0)
+    return max(list_price - item.unit_price, Decimal(0)) * item.quantity
+
+
+def build_cart_pricing(items):
+    """خلاصه قیمت سبد در یک گذر روی آیتم‌ها"""
+    subtotal = total_discount = total_weight = Decimal(0)
+    items_count = 0
+    lines = {}
+    for item in items:
+        product = item.product
+        total_price = item.unit_price * item.quantity
+        discount = line_discount(item)
+        weight = (product.weight or 0) * item.quantity
+        subtotal += total_price
+        total_discount += discount
+        total_weight += weight
+        items_count += item.quantity
+        lines[str(item.pk)] = {
+            'product_id': str(product.pk),
+            'category_id': str(product.category_id),
+            'quantity': item.quantity,
+            'unit_price': item.unit_price,
+            'total_price': total_price,
+            'discount': discount,
+            'weight': weight,
+        }
+    return {
+        'subtotal': subtotal,
+        'total_discount': total_discount,
+        'total_weight': total_weight,
+        'items_count': items_count,
+        # مالیات بر ارزش افزوده روی مبلغ قابل پرداخت اقلام (پس از تخفیف محصولات)
+        'tax': Decimal(int(subtotal * CART_TAX_RATE)),
+        'lines': lines,
+    }
+
+
+def get_cart_pricing(cart):
+    """خلاصه قیمت سبد از نمونه سبد، کش یا پایگاه داده"""
+    pricing = getattr(cart, '_pricing', None)
+    if pricing is not None:
+        return pricing
+
+    key = _pricing_key(cart.pk)
+    try:
+        entry = cache.get(key)
+    except Exception:
+        logger.warning('Reading cart pricing cache failed', exc_info=True)
+        entry = None
+    if entry is not None and entry['versions'] == get_detail_versions(
+        line['product_id'] for line in entry['pricing']['lines'].values()
+    ):
+        pricing = entry['pricing']
+
+    if pricing is None:
+        items = load_cart_items(cart)
+        versions = get_detail_versions(str(item.product_id) for item in items)
+        pricing = build_cart_pricing(items)
+        if versions is not None:
+            try:
+                cache.set(key, {'versions': versions, 'pricing': pricing}, CART_PRICING_CACHE_TIMEOUT)
+            except Exception:
+                logger.warning('Writing cart pricing cache failed', exc_info=True)
+
+    cart._pricing = pricing
+    return pricing
+
+
+def invalidate_cart_pricing(cart):
+    """نامعتبر کردن خلاصه قیمت پس از هر تغییر در آیتم‌های سبد"""
+    cart._pricing = None
+    cart._priced_items = None
+    try:
+        cache.delete(_pricing_key(cart.pk))
+    except Exception:
+        logger.warning('Invalidating cart pricing cache failed', exc_info=True)
+
+
+def shipping_cost(pricing, method, rate=None):
+    """هزینه ارسال سبد با روش ارسال (و نرخ منطقه در صورت وجود)"""
+    cost = rate.cost if rate is not None else method.cost
+    threshold = getattr(method, 'free_shipping_threshold', None)
+    if threshold and pricing['subtotal'] >= threshold:
+        return Decimal(0)
+    return cost
+
+
+def cart_totals(pricing, method, rate=None):
+    """مبالغ نهایی سفارش برای سبد و روش ارسال"""
+    shipping = shipping_cost(pricing, method, rate)
+    return {
+        'total_price': pricing['subtotal'],
+        'total_discount': pricing['total_discount'],
+        'shipping_cost': shipping,
+        'tax': pricing['tax'],
+        # تخفیف محصولات در قیمت واحد آیتم‌ها لحاظ شده است
+        'final_price': pricing['subtotal'] + shipping + pricing['tax'],
+    }
@@ -0,0 +1,164 @@
+"""
+رزرو موجودی از ثبت سفارش تا پرداخت
+
+موجودی فقط پس از پرداخت کسر می‌شود؛ برای جلوگیری از فروش بیش از موجودی، ثبت سفارش
+مقدار هر آیتم را با یک UPDATE شرطی روی محصولات و یک UPDATE روی تنوع‌ها رزرو می‌کند:
+
+    UPDATE ... SET reserved_stock = reserved_stock + q WHERE stock >= reserved_stock + q
+
+اگر یکی از ردیف‌ها شرط را نداشته باشد هیچ رزروی ثبت نمی‌شود. هر رزرو یک ردیف
+StockReservation با زمان انقضا دارد؛ پرداخت رزروهای فعال سفارش را به کسر موجودی تبدیل
+می‌کند و release_expired_reservations (تسک دوره‌ای) رزروهای منقضی را آزاد می‌کند.
+موجودی قابل فروش محصول و تنوع (available_stock) موجودی منهای reserved_stock است.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps.products.inventory import per_row
+from .models import ReservationStatus, StockReservation
+
+STOCK_RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 60 * 30)
+RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_names):
+        self.product_names = product_names
+        super().__init__(', '.join(product_names))
+
+
+def _quantities(lines):
+    """جمع مقادیر (شناسه محصول، شناسه تنوع، تعداد) به تفکیک محصول بدون تنوع و تنوع"""
+    products, variants = Counter(), Counter()
+    for product_id, variant_id, quantity in lines:
+        if variant_id:
+            variants[variant_id] += quantity
+        else:
+            products[product_id] += quantity
+    return products, variants
+
+
+def _stock_models():
+    from apps.products.models import Product, ProductVariant
+    return Product, ProductVariant
+
+
+def _bump_product_details(lines):
+    from apps.products.cache import bump_detail_version
+
+    product_ids = {product_id for product_id, _, _ in lines}
+    transaction.on_commit(lambda: bump_detail_version(*product_ids))
+
+
+def _shortages(lines):
+    """نام محصولاتی که موجودی قابل فروششان از مقدار درخواستی کمتر است"""
+    Product, ProductVariant = _stock_models()
+    products, variants = _quantities(lines)
+    names = [
+        name for pk, name, stock, reserved in Product.objects.filter(pk__in=list(products)).values_list(
+            'pk', 'name', 'stock', 'reserved_stock'
+        ) if stock - reserved < products[pk]
+    ]
+    names += [
+        f'{product_name} - {name}'
+        for pk, product_name, name, stock, reserved in ProductVariant.objects.filter(pk__in=list(variants)).values_list(
+            'pk', 'product__name', 'name', 'stock', 'reserved_stock'
+        ) if stock - reserved < variants[pk]
+    ]
+    return names
+
+
+def reserve_stock(order, lines):
+    """
+    رزرو موجودی آیتم‌های سفارش؛ lines به شکل (شناسه محصول، شناسه تنوع، تعداد) است
+
+    در صورت کمبود موجودی هیچ رزروی ثبت نمی‌شود و InsufficientStock با نام محصولات
+    کمبوددار برانگیخته می‌شود.
+    """
+    Product, ProductVariant = _stock_models()
+    lines = list(lines)
+    products, variants = _quantities(lines)
+    try:
+        with transaction.atomic():
+            for model, quantities in ((Product, products), (ProductVariant, variants)):
+                if not quantities:
+                    continue
+                delta = per_row(quantities)
+                reserved = model.objects.filter(
+                    pk__in=list(quantities), stock__gte=F('reserved_stock') + delta
+                ).update(reserved_stock=F('reserved_stock') + delta)
+                if reserved != len(quantities):
+                    raise InsufficientStock([])
+            expires_at = timezone.now() + timedelta(seconds=STOCK_RESERVATION_TTL)
+            StockReservation.objects.bulk_create([
+                StockReservation(
+                    order=order, product_id=product_id, variant_id=variant_id,
+                    quantity=quantity, expires_at=expires_at,
+                )
+                for product_id, variant_id, quantity in lines
+            ])
+    except InsufficientStock:
+        raise InsufficientStock(_shortages(lines))
+    _bump_product_details(lines)
+
+
+def _settle(reservations, status):
+    """
+    بستن رزروهای فعال؛ با CONVERTED موجودی و رزرو هر دو کم می‌شوند و با RELEASED فقط رزرو
+
+    خروجی: فهرست (شناسه محصول، شناسه تنوع، تعداد) رزروهای بسته‌شده
+    """
+    Product, ProductVariant = _stock_models()
+    with transaction.atomic():
+        rows = list(reservations.filter(status=ReservationStatus.ACTIVE).select_for_update().values_list(
+            'pk', 'product_id', 'variant_id', 'quantity'
+        ))
+        if not rows:
+            return []
+        lines = [(product_id, variant_id, quantity) for _, product_id, variant_id, quantity in rows]
+        products, variants = _quantities(lines)
+        for model, quantities in ((Product, products), (ProductVariant, variants)):
+            if not quantities:
+                continue
+            delta = per_row(quantities)
+            changes = {'reserved_stock': Greatest(F('reserved_stock') - delta, Value(0))}
+            if status == ReservationStatus.CONVERTED:
+                changes['stock'] = Greatest(F('stock') - delta, Value(0))
+            model.objects.filter(pk__in=list(quantities)).update(**changes)
+        StockReservation.objects.filter(pk__in=[row[0] for row in rows]).update(status=status)
+    _bump_product_details(lines)
+    return lines
+
+
+def commit_reservations(order):
+    """
+    تبدیل رزروهای فعال سفارش پرداخت‌شده به کسر موجودی
+
+    خروجی: مجموعه (شناسه محصول، شناسه تنوع) آیتم‌هایی که موجودی‌شان کسر شد؛ آیتم‌هایی
+    که رزروشان پیش‌تر منقضی و آزاد شده در این مجموعه نیستند.
+    """
+    lines = _settle(StockReservation.objects.filter(order=order), ReservationStatus.CONVERTED)
+    return {(product_id, variant_id) for product_id, variant_id, _ in lines}
+
+
+def release_reservations(order):
+    """آزاد کردن رزروهای سفارش لغوشده"""
+    return len(_settle(StockReservation.objects.filter(order=order), ReservationStatus.RELEASED))
+
+
+def release_expired_reservations(batch_size=RELEASE_BATCH_SIZE):
+    """آزاد کردن رزروهای منقضی در دسته‌های محدود؛ خروجی: تعداد رزروهای آزادشده"""
+    released = 0
+    while True:
+        ids = list(StockReservation.objects.filter(
+            status=ReservationStatus.ACTIVE, expires_at__lte=timezone.now()
+        ).order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return released
+        released += len(_settle(StockReservation.objects.filter(pk__in=ids), ReservationStatus.RELEASED))
@@ -1,14 +1,20 @@
 from rest_framework import serializers
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from .models import (
     Cart, CartItem, Order, OrderItem, OrderHistory, OrderReturn, OrderReturnImage,
-    Invoice, InstallmentPlan, Installment
+    Invoice, InstallmentPlan, Installment, CartStatus, OrderStatus
 )
+from .cart_store import get_cart_store
+from .pricing import build_cart_pricing, cart_totals
+from .reservations import InsufficientStock, reserve_stock
+from apps.products.models import cover_images_prefetch
 from apps.products.serializers import ProductListSerializer
 from apps.accounts.serializers import AddressSerializer
 from apps.shipping.serializers import ShippingMethodSerializer
+from apps.common.serializers import SparseFieldsetMixin
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -41,10 +47,10 @@ class CartItemSerializer(serializers.ModelSerializer):
             except ProductVariant.DoesNotExist:
                 raise serializers.ValidationError('تنوع مورد نظر یافت نشد')
             
-            if quantity > variant.stock:
+            if quantity > variant.available_stock:
                 raise serializers.ValidationError('موجودی کافی نیست')
         else:
-            if quantity > product.stock:
+            if quantity > product.available_stock:
                 raise serializers.ValidationError('موجودی کافی نیست')
         
         data['product'] = product
@@ -53,7 +59,7 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
+    items = CartItemSerializer(source='priced_items', many=True, read_only=True)
     total_price = serializers.DecimalField(max_digits=15, decimal_places=0, read_only=True)
     total_discount = serializers.DecimalField(max_digits=15, decimal_places=0, read_only=True)
     total_items_count = serializers.IntegerField(read_only=True)
@@ -63,6 +69,12 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ('id', 'status', 'created_at', 'updated_at', 'items', 
                  'total_price', 'total_discount', 'total_items_count')
         read_only_fields = ('id', 'status', 'created_at', 'updated_at')
+    
+    def to_representation(self, instance):
+        # تصویر شاخص محصولات همه آیتم‌ها با یک کوئری
+        products = [item.product for item in instance.priced_items if not hasattr(item.product, 'cover_images')]
+        prefetch_related_objects(products, cover_images_prefetch())
+        return super().to_representation(instance)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -166,7 +178,7 @@ class InstallmentPlanSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class OrderListSerializer(serializers.ModelSerializer):
+class OrderListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     
     class Meta:
@@ -176,7 +188,19 @@ class OrderListSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class AdminOrderListSerializer(OrderListSerializer):
+    """ردیف سبک لیست سفارش‌های پنل مدیریت؛ فقط ستون‌های سفارش و کاربر (بدون رابطه‌های تودرتو)"""
+    customer_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    customer_phone = serializers.CharField(source='user.phone_number', read_only=True)
+    
+    class Meta(OrderListSerializer.Meta):
+        fields = OrderListSerializer.Meta.fields + (
+            'payment_date', 'tracking_code', 'customer_name', 'customer_phone'
+        )
+        read_only_fields = fields
+
+
+class OrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     history = OrderHistorySerializer(many=True, read_only=True)
     shipping_address = AddressSerializer(read_only=True)
@@ -197,7 +221,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
 
 class CheckoutSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
-    shipping_address_id = serializers.UUIDField()
+    shipping_address_id = serializers.IntegerField()
     shipping_method_id = serializers.UUIDField()
     payment_method = serializers.CharField()
     description = serializers.CharField(required=False, allow_blank=True)
@@ -208,10 +232,9 @@ class CheckoutSerializer(serializers.Serializer):
         shipping_method_id = data.get('shipping_method_id')
         payment_method = data.get('payment_method')
         
-        # بررسی سبد خرید
-        try:
-            cart = Cart.objects.get(id=cart_id, status=CartStatus.OPEN)
-        except Cart.DoesNotExist:
+        # بررسی سبد خرید؛ سبد فقط خوانده می‌شود و نوشتن آن در پایگاه داده به create موکول می‌شود
+        cart = get_cart_store().checkout_cart(cart_id)
+        if cart is None or cart.user_id != self.context['request'].user.pk:
             raise serializers.ValidationError('سبد خرید معتبر نیست')
         
         # بررسی آدرس
@@ -233,14 +256,12 @@ class CheckoutSerializer(serializers.Serializer):
         if payment_method not in valid_payment_methods:
             raise serializers.ValidationError('روش پرداخت معتبر نیست')
         
-        # بررسی موجودی محصولات
-        for item in cart.items.all():
-            if item.variant:
-                if item.variant.stock < item.quantity:
-                    raise serializers.ValidationError(f'موجودی محصول {item.product.name} کافی نیست')
-            else:
-                if item.product.stock < item.quantity:
-                    raise serializers.ValidationError(f'موجودی محصول {item.product.name} کافی نیست')
+        # بررسی موجودی قابل فروش (موجودی منهای رزروها) روی آیتم‌های بارگذاری‌شده سبد؛ رزرو
+        # شرطی در create همین شرط را در پایگاه داده تضمین می‌کند
+        for item in cart.priced_items:
+            stock = item.variant or item.product
+            if stock.stock - stock.reserved_stock < item.quantity:
+                raise serializers.ValidationError(f'موجودی محصول {item.product.name} کافی نیست')
         
         data['cart'] = cart
         data['address'] = address
@@ -249,7 +270,8 @@ class CheckoutSerializer(serializers.Serializer):
     
     @transaction.atomic
     def create(self, validated_data):
-        cart = validated_data['cart']
+        # سبد ردیس فقط پس از گذشتن همه بررسی‌ها و در همین تراکنش در پایگاه داده نوشته می‌شود
+        cart = get_cart_store().persist_checkout(validated_data['cart'])
         address = validated_data['address']
         shipping_method = validated_data['shipping_method']
         payment_method = validated_data['payment_method']
@@ -257,17 +279,12 @@ class CheckoutSerializer(serializers.Serializer):
         
         user = self.context['request'].user
         
-        # محاسبه مبالغ
-        total_price = sum(item.unit_price * item.quantity for item in cart.items.all())
-        total_discount = sum((item.product.price - item.unit_price) * item.quantity for item in cart.items.all() if item.product.discount_price)
-        shipping_cost = shipping_method.cost
-        
-        # محاسبه مالیات (مثلاً 9%)
-# محاسبه مالیات (مثلاً 9%)
-        tax = int(total_price * 0.09)
+        # آیتم‌ها همراه با محصول، فروشنده و تنوع با یک کوئری خوانده می‌شوند
+        items = cart.priced_items
         
-        # محاسبه مبلغ نهایی
-        final_price = total_price - total_discount + shipping_cost + tax
+        # محاسبه مبالغ با موتور قیمت‌گذاری سبد؛ سفارش از روی ردیف‌های فعلی قیمت‌گذاری می‌شود نه کش
+        pricing = build_cart_pricing(items)
+        totals = cart_totals(pricing, shipping_method)
         
         # ایجاد شماره سفارش یکتا
         order_number = f"ORD-{get_random_string(8, '0123456789').upper()}"
@@ -277,20 +294,18 @@ class CheckoutSerializer(serializers.Serializer):
             user=user,
             order_number=order_number,
             status=OrderStatus.PENDING,
-            total_price=total_price,
-            total_discount=total_discount,
-            shipping_cost=shipping_cost,
-            tax=tax,
-            final_price=final_price,
+            **totals,
             description=description,
             shipping_address=address,
             shipping_method=shipping_method,
             payment_method=payment_method
         )
         
-        # ایجاد آیتم‌های سفارش
-        for item in cart.items.all():
-            OrderItem.objects.create(
+        # ایجاد آیتم‌های سفارش با یک INSERT
+        order_items = []
+        for item in items:
+            line = pricing['lines'][str(item.pk)]
+            order_items.append(OrderItem(
                 order=order,
                 product=item.product,
                 variant=item.variant,
@@ -298,12 +313,21 @@ class CheckoutSerializer(serializers.Serializer):
                 product_name=item.product.name,
                 variant_name=item.variant.name if item.variant else None,
                 quantity=item.quantity,
-                unit_price=item.product.price,
-                discount=item.product.price - item.unit_price if item.product.discount_price else 0,
+                unit_price=item.unit_price + line['discount'] / item.quantity,
+                discount=line['discount'] / item.quantity,
                 final_price=item.unit_price,
-                total_price=item.unit_price * item.quantity,
+                total_price=line['total_price'],
                 status=OrderStatus.PENDING
-            )
+            ))
+        OrderItem.objects.bulk_create(order_items)
+        
+        # رزرو موجودی تا پرداخت؛ در صورت کمبود، کل سفارش برگردانده می‌شود
+        try:
+            reserve_stock(order, [(item.product_id, item.variant_id, item.quantity) for item in items])
+        except InsufficientStock as exc:
+            if exc.product_names:
+                raise serializers.ValidationError(f'موجودی محصول {exc.product_names[0]} کافی نیست')
+            raise serializers.ValidationError('موجودی کافی نیست')
         
         # ایجاد تاریخچه سفارش
         OrderHistory.objects.create(
@@ -322,6 +346,7 @@ class CheckoutSerializer(serializers.Serializer):
         
         # تغییر وضعیت سبد خرید
         cart.status = CartStatus.CONVERTED
-        cart.save()
+        cart.save(update_fields=['status', 'updated_at'])
+        transaction.on_commit(lambda: get_cart_store().discard(cart))
         
         return order
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+تسویه سفارش پرداخت‌شده
+
+پس از پرداخت، موجودی محصولات و تنوع‌ها با دفتر موجودی (apps.products.inventory) کسر
+می‌شود، تعداد فروش محصولات و آمار و موجودی حساب فروشندگان افزایش می‌یابد و کمیسیون
+هر آیتم ثبت می‌شود. همه تغییرات با UPDATEهای گروهی (عبارت F به‌علاوه مقدار هر ردیف)
+در یک تراکنش اعمال می‌شوند تا پرداخت‌های همزمان تغییرات یکدیگر را بازنویسی نکنند.
+ردیف فروشندگان قفل می‌شود و کمیسیون پلکانی با جدول پله‌های فروشندگان که یک‌جا خوانده
+می‌شود در حافظه محاسبه می‌شود؛ بنابراین تعداد کوئری‌ها به تعداد آیتم‌های سفارش وابسته
+نیست. لغو سفارش پرداخت‌شده (reverse_settlement) همین تغییرات را برمی‌گرداند.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F
+
+from apps.products.inventory import StockMovement, apply_movements, per_row, record_movements
+from .models import OrderItem
+from .reservations import commit_reservations
+
+
+def _commission(seller, total_price, revenue, tiers):
+    """کمیسیون یک آیتم با درآمد تجمعی فروشنده پس از همان آیتم"""
+    from apps.sellers.models import CommissionType
+
+    if seller.commission_type == CommissionType.FIXED:
+        return seller.commission_value.quantize(Decimal(1))
+    percentage = seller.commission_value
+    if seller.commission_type == CommissionType.TIERED:
+        tier = next((
+            tier for tier in tiers
+            if tier.min_sales <= revenue and (tier.max_sales is None or tier.max_sales >= revenue)
+        ), None)
+        if tier is not None:
+            percentage = tier.commission_percentage
+    elif seller.commission_type != CommissionType.PERCENTAGE:
+        return Decimal(0)
+    return (total_price * percentage / 100).quantize(Decimal(1))
+
+
+@transaction.atomic
+def settle_paid_order(order):
+    """کسر موجودی، ثبت آمار فروش و کمیسیون و به‌روزرسانی حساب فروشندگان سفارش پرداخت‌شده"""
+    from apps.products.models import Product
+    from apps.sellers.models import Seller, TieredCommission
+
+    # موجودی آیتم‌های رزروشده با تبدیل رزروها کسر می‌شود
+    reserved = commit_reservations(order)
+
+    items = list(order.items.only(
+        'id', 'order_id', 'product_id', 'variant_id', 'seller_id', 'quantity', 'total_price', 'commission'
+    ))
+    if not items:
+        return
+
+    # کسر موجودی آیتم‌های بدون رزرو و ثبت همه آیتم‌ها در دفتر موجودی
+    movements = [
+        StockMovement(
+            item.product_id, item.variant_id, delta=-item.quantity,
+            reason=f'فروش - سفارش {order.order_number}', reference=str(order.id),
+        ) for item in items
+    ]
+    record_movements(movement for movement in movements if movement.key[:2] in reserved)
+    apply_movements(movement for movement in movements if movement.key[:2] not in reserved)
+
+    sales = Counter()
+    for item in items:
+        sales[item.product_id] += item.quantity
+    Product.objects.filter(pk__in=list(sales)).update(sales_count=F('sales_count') + per_row(sales))
+
+    # آمار فروشندگان با ردیف‌های قفل‌شده و پله‌های کمیسیون در حافظه محاسبه می‌شود
+    sellers = Seller.objects.select_for_update().in_bulk({item.seller_id for item in items})
+    tiers = defaultdict(list)
+    for tier in TieredCommission.objects.filter(seller_id__in=list(sellers)).order_by('min_sales'):
+        tiers[tier.seller_id].append(tier)
+
+    revenue = {pk: seller.total_revenue for pk, seller in sellers.items()}
+    sales_count, revenue_delta, balance_delta = Counter(), Counter(), Counter()
+    for item in items:
+        seller = sellers[item.seller_id]
+        revenue[seller.pk] += item.total_price
+        item.commission = _commission(seller, item.total_price, revenue[seller.pk], tiers[seller.pk])
+        sales_count[seller.pk] += item.quantity
+        revenue_delta[seller.pk] += item.total_price
+        balance_delta[seller.pk] += item.total_price - item.commission
+
+    amount = DecimalField(max_digits=15, decimal_places=0)
+    Seller.objects.filter(pk__in=list(sellers)).update(
+        sales_count=F('sales_count') + per_row(sales_count),
+        total_revenue=F('total_revenue') + per_row(revenue_delta, amount),
+        balance=F('balance') + per_row(balance_delta, amount),
+    )
+    OrderItem.objects.bulk_update(items, ['commission'])
+
+
+@transaction.atomic
+def reverse_settlement(order):
+    """برگشت موجودی، آمار فروش و حساب فروشندگان سفارش پرداخت‌شده‌ای که لغو می‌شود"""
+    from apps.products.models import Product
+    from apps.sellers.models import Seller
+
+    items = list(order.items.only(
+        'id', 'order_id', 'product_id', 'variant_id', 'seller_id', 'quantity', 'total_price', 'commission'
+    ))
+    if not items:
+        return
+
+    apply_movements(
+        StockMovement(
+            item.product_id, item.variant_id, delta=item.quantity,
+            reason=f'لغو سفارش {order.order_number}', reference=str(order.id),
+        ) for item in items
+    )
+
+    sales = Counter()
+    sales_count, revenue_delta, balance_delta = Counter(), Counter(), Counter()
+    for item in items:
+        sales[item.product_id] += item.quantity
+        sales_count[item.seller_id] += item.quantity
+        revenue_delta[item.seller_id] += item.total_price
+        balance_delta[item.seller_id] += item.total_price - item.commission
+    Product.objects.filter(pk__in=list(sales)).update(sales_count=F('sales_count') - per_row(sales))
+
+    amount = DecimalField(max_digits=15, decimal_places=0)
+    Seller.objects.filter(pk__in=list(sales_count)).update(
+        sales_count=F('sales_count') - per_row(sales_count),
+        total_revenue=F('total_revenue') - per_row(revenue_delta, amount),
+        balance=F('balance') - per_row(balance_delta, amount),
+    )
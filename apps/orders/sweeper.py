@@ -0,0 +1,157 @@
+"""
+رها شدن خودکار سبدهای خرید
+
+sweep_abandoned_carts (تسک دوره‌ای) سبدهای باز بدون تغییر در ABANDONED_CART_AFTER
+ثانیه گذشته را در دسته‌های CART_SWEEP_BATCH_SIZE تایی با ایندکس (status, updated_at)
+پیدا می‌کند، وضعیتشان را با یک UPDATE به «رها شده» تغییر می‌دهد و رویدادهای abandon را
+با یک bulk_create ثبت می‌کند. به‌روزرسانی گروهی updated_at سبدها را تغییر نمی‌دهد.
+
+هر اجرا حداکثر CART_SWEEP_MAX_BATCHES دسته را پردازش می‌کند و آخرین موقعیت
+(updated_at و شناسه آخرین سبد) را در کش نگه می‌دارد تا اجرای بعدی از همان‌جا ادامه
+دهد؛ با رسیدن به انتهای بازه موقعیت پاک می‌شود. اگر GUEST_CART_PURGE_AFTER تنظیم شده
+باشد، سبدهای مهمانی که از آن مدت قدیمی‌ترند (به جز سبدهای تبدیل‌شده) نیز دسته‌دسته حذف
+می‌شوند.
+
+با CART_BACKEND='redis' ردیف پایگاه داده سبدی که در ردیس بارگذاری شده updated_at قدیمی
+دارد؛ چنین سبدهایی رها یا حذف نمی‌شوند. سبدهای ردیس بر اساس زمان آخرین تغییر ذخیره‌شده
+در ردیس رها می‌شوند: با وضعیت «رها شده» در پایگاه داده نوشته و از ردیس حذف می‌شوند.
+
+خطاهای سرور کش ثبت و نادیده گرفته می‌شوند؛ در این حالت اجرا از ابتدای بازه آغاز می‌شود.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.common.utils import CacheManager
+from .cart_store import get_cart_store
+from .models import Cart, CartStatus
+
+ABANDONED_CART_AFTER = getattr(settings, 'ABANDONED_CART_AFTER', 60 * 60 * 24 * 3)
+GUEST_CART_PURGE_AFTER = getattr(settings, 'GUEST_CART_PURGE_AFTER', None)
+CART_SWEEP_BATCH_SIZE = getattr(settings, 'CART_SWEEP_BATCH_SIZE', 500)
+CART_SWEEP_MAX_BATCHES = getattr(settings, 'CART_SWEEP_MAX_BATCHES', 20)
+CHECKPOINT_TIMEOUT = 60 * 60 * 24
+
+logger = logging.getLogger(__name__)
+
+
+def _checkpoint_key():
+    return CacheManager.get_cache_key('cart_sweeper_checkpoint')
+
+
+def _load_checkpoint():
+    try:
+        checkpoint = cache.get(_checkpoint_key())
+    except Exception:
+        logger.warning('Reading cart sweeper checkpoint failed', exc_info=True)
+        return None
+    if not checkpoint:
+        return None
+    updated_at, pk = checkpoint
+    return parse_datetime(updated_at), Cart._meta.pk.to_python(pk)
+
+
+def _save_checkpoint(updated_at, pk):
+    try:
+        cache.set(_checkpoint_key(), (updated_at.isoformat(), str(pk)), CHECKPOINT_TIMEOUT)
+    except Exception:
+        logger.warning('Writing cart sweeper checkpoint failed', exc_info=True)
+
+
+def _clear_checkpoint():
+    try:
+        cache.delete(_checkpoint_key())
+    except Exception:
+        logger.warning('Clearing cart sweeper checkpoint failed', exc_info=True)
+
+
+def _record_abandon_events(rows):
+    from apps.analytics.models import CartEvent
+
+    CartEvent.objects.bulk_create([
+        CartEvent(cart_id=pk, user_id=user_id, session_id=session_key or '', event_type='abandon')
+        for pk, user_id, session_key in rows
+    ])
+
+
+def _abandon_batch(cutoff, after, batch_size, store):
+    """
+    رها کردن یک دسته از قدیمی‌ترین سبدهای باز پس از موقعیت after
+
+    خروجی: (تعداد سبدهای رهاشده، تعداد سبدهای بررسی‌شده، موقعیت آخرین سبد دسته یا None
+    در انتهای بازه)
+    """
+    carts = Cart.objects.filter(status=CartStatus.OPEN, updated_at__lt=cutoff)
+    if after is not None:
+        updated_at, pk = after
+        carts = carts.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk))
+
+    with transaction.atomic():
+        rows = list(carts.order_by('updated_at', 'pk').select_for_update(skip_locked=True).values_list(
+            'pk', 'user_id', 'session_key', 'updated_at'
+        )[:batch_size])
+        if not rows:
+            return 0, 0, None
+        live = store.live_cart_ids(row[0] for row in rows)
+        idle = [row[:3] for row in rows if str(row[0]) not in live]
+        if idle:
+            Cart.objects.filter(pk__in=[row[0] for row in idle]).update(status=CartStatus.ABANDONED)
+            _record_abandon_events(idle)
+    last_pk, _, _, last_updated_at = rows[-1]
+    return len(idle), len(rows), (last_updated_at, last_pk)
+
+
+def _purge_guest_carts(cutoff, batch_size, max_batches, store):
+    """حذف دسته‌ای سبدهای مهمان قدیمی‌تر از cutoff؛ خروجی: تعداد سبدهای حذف‌شده"""
+    purged, live = 0, set()
+    for _ in range(max_batches):
+        ids = list(Cart.objects.filter(
+            user__isnull=True, updated_at__lt=cutoff
+        ).exclude(status=CartStatus.CONVERTED).exclude(pk__in=live).order_by('updated_at').values_list(
+            'pk', flat=True
+        )[:batch_size])
+        if not ids:
+            break
+        batch_live = store.live_cart_ids(ids)
+        live.update(pk for pk in ids if str(pk) in batch_live)
+        Cart.objects.filter(pk__in=[pk for pk in ids if str(pk) not in batch_live]).delete()
+        purged += len(ids) - len(batch_live)
+    return purged
+
+
+def sweep_abandoned_carts(batch_size=CART_SWEEP_BATCH_SIZE, max_batches=CART_SWEEP_MAX_BATCHES,
+                          purge_after=GUEST_CART_PURGE_AFTER):
+    """
+    رها کردن سبدهای باز قدیمی و حذف اختیاری سبدهای مهمان بسیار قدیمی
+
+    خروجی: {'abandoned': تعداد، 'purged': تعداد، 'complete': رسیدن به انتهای بازه}
+    """
+    store = get_cart_store()
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=ABANDONED_CART_AFTER)
+    position = _load_checkpoint()
+    abandoned, complete = 0, False
+    for _ in range(max_batches):
+        count, scanned, position = _abandon_batch(cutoff, position, batch_size, store)
+        abandoned += count
+        if scanned < batch_size:
+            complete = True
+            break
+        _save_checkpoint(*position)
+    if complete:
+        _clear_checkpoint()
+
+    idle_carts = store.abandon_idle_carts(cutoff, batch_size * max_batches)
+    _record_abandon_events([(cart.pk, cart.user_id, cart.session_key) for cart in idle_carts])
+    abandoned += len(idle_carts)
+
+    purged = 0
+    if purge_after:
+        purged = _purge_guest_carts(now - timedelta(seconds=purge_after), batch_size, max_batches, store)
+    return {'abandoned': abandoned, 'purged': purged, 'complete': complete}
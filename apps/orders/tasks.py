@@ -0,0 +1,22 @@
+from celery import shared_task
+
+
+@shared_task(name='apps.orders.tasks.persist_idle_carts')
+def persist_idle_carts():
+    """ذخیره سبدهای بدون تغییر ردیس در پایگاه داده پیش از انقضای کلیدها"""
+    from .cart_store import get_cart_store
+    return get_cart_store().persist_idle_carts()
+
+
+@shared_task(name='apps.orders.tasks.release_expired_reservations')
+def release_expired_reservations():
+    """آزاد کردن رزروهای موجودی سفارش‌هایی که در مهلت پرداخت نشده‌اند"""
+    from .reservations import release_expired_reservations as _release
+    return _release()
+
+
+@shared_task(name='apps.orders.tasks.sweep_abandoned_carts')
+def sweep_abandoned_carts():
+    """علامت‌گذاری سبدهای باز قدیمی به عنوان رها شده و حذف سبدهای مهمان بسیار قدیمی"""
+    from .sweeper import sweep_abandoned_carts as _sweep
+    return _sweep()
@@ -1,3 +1,583 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.common.testing import (
+    CatalogTestMixin, create_address, create_category, create_product, create_seller, create_shipping_method,
+    create_user,
+)
+from apps.products.models import Product, ProductVariant
+from .models import Cart, CartItem, Order
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CartPricingTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.shipping.models import ShippingLocation, ShippingRate, ShippingZone
+
+        super().setUpTestData()
+        cls.teapot = cls.create_product(
+            'teapot', name='قوری', price=1000, discount_price=800, weight=500, stock=10
+        )
+        cls.cup = cls.create_product('cup', name='فنجان', price=300, weight=100, stock=10)
+        cls.blue = ProductVariant.objects.create(product=cls.teapot, name='آبی', price_adjustment=100, stock=10)
+        zone = ShippingZone.objects.create(name='تهران')
+        ShippingLocation.objects.create(zone=zone, province='تهران', city='تهران')
+        cls.post = create_shipping_method()
+        cls.courier = create_shipping_method(name='پیک', cost=500)
+        ShippingRate.objects.create(shipping_method=cls.courier, zone=zone, cost=350)
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.teapot, variant=self.blue, quantity=2, unit_price=900)
+        CartItem.objects.create(cart=self.cart, product=self.cup, quantity=3, unit_price=300)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pricing_is_computed_in_one_query_and_cached(self):
+        with self.assertNumQueries(1):
+            pricing = self.cart.pricing
+            self.assertEqual(self.cart.total_price, 2700)
+            self.assertEqual(self.cart.total_discount, 400)
+            self.assertEqual(self.cart.total_items_count, 5)
+        self.assertEqual(pricing['total_weight'], 1300)
+        self.assertEqual(pricing['tax'], 243)
+
+        # نمونه دیگری از همان سبد خلاصه را از کش می‌خواند
+        with self.assertNumQueries(0):
+            self.assertEqual(Cart(pk=self.cart.pk).total_price, 2700)
+
+    def test_product_changes_invalidate_cached_pricing(self):
+        self.assertEqual(self.cart.total_discount, 400)
+        teapot = Product.objects.get(pk=self.teapot.pk)
+        teapot.price = 1200
+        teapot.weight = 600
+        teapot.save()
+        # قیمت واحد آیتم ثابت است؛ تخفیف و وزن از محصول فعلی محاسبه می‌شوند
+        pricing = Cart(pk=self.cart.pk).pricing
+        self.assertEqual((pricing['total_discount'], pricing['total_weight']), (800, 1500))
+
+    def test_cart_actions_invalidate_pricing(self):
+        self.assertEqual(self.cart.total_price, 2700)
+        url = f'/api/orders/carts/{self.cart.pk}/'
+        cup_item = self.cart.items.get(product=self.cup)
+
+        self.client.post(f'{url}update_item/', {'item_id': cup_item.pk, 'quantity': 1})
+        self.assertEqual(self.client.get(url).data['total_price'], '2100')
+
+        self.client.post(f'{url}remove_item/', {'item_id': cup_item.pk})
+        self.assertEqual(self.client.get(url).data['total_items_count'], 2)
+
+        self.client.post(f'{url}add_item/', {'product_id': self.cup.pk, 'quantity': 2})
+        self.assertEqual(self.client.get(url).data['total_price'], '2400')
+
+        self.client.post(f'{url}clear/')
+        self.assertEqual(self.client.get(url).data['total_price'], '0')
+
+    def test_shipping_calculator_uses_zone_rates_and_cart_totals(self):
+        response = self.client.post('/api/shipping/calculate-shipping/', {
+            'province': 'تهران', 'city': 'تهران', 'cart_id': self.cart.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        costs = {method['name']: method['cost'] for method in response.data['shipping_methods']}
+        self.assertEqual(costs, {'پست': 200, 'پیک': 350})
+        self.assertEqual(response.data['cart_total'], 2700)
+        self.assertEqual(response.data['total_weight'], Decimal(1300))
+
+    def test_checkout_totals_come_from_pricing(self):
+        from .pricing import build_cart_pricing, cart_totals
+
+        address = create_address(self.user)
+        response = self.client.post('/api/orders/checkout/', {
+            'cart_id': self.cart.pk, 'shipping_address_id': address.pk,
+            'shipping_method_id': self.post.pk, 'payment_method': 'online',
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        order = self.user.orders.get()
+        totals = cart_totals(build_cart_pricing(self.cart.items.select_related('product', 'variant')), self.post)
+        self.assertEqual(order.final_price, totals['final_price'])
+        self.assertEqual(order.final_price, 2700 + 200 + 243)
+        self.assertEqual(
+            sorted(order.items.values_list('unit_price', 'discount', 'total_price')), [(300, 0, 900), (1100, 200, 1800)]
+        )
+
+
+class CartStoreTests(TestCase):
+    def test_backend_follows_setting(self):
+        from .cart_store import DatabaseCartStore, RedisCartStore, get_cart_store
+
+        self.assertIsInstance(get_cart_store(), DatabaseCartStore)
+        with override_settings(CART_BACKEND='redis'):
+            self.assertIsInstance(get_cart_store(), RedisCartStore)
+
+    def test_redis_item_ids_merge_same_product_and_variant(self):
+        from .cart_store import RedisCartStore
+
+        cart_id = '5c3f0f4e-6a1b-4c55-9d0e-2f0a4b7f9a10'
+        self.assertEqual(RedisCartStore._item_id(cart_id, 'p', None), RedisCartStore._item_id(cart_id, 'p', ''))
+        self.assertNotEqual(RedisCartStore._item_id(cart_id, 'p', None), RedisCartStore._item_id(cart_id, 'p', 'v'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CheckoutQueryBudgetTests(CatalogTestMixin, TestCase):
+    """
+    تعداد کوئری‌های ثبت سفارش نباید به تعداد آیتم‌های سبد وابسته باشد
+    """
+    # هر سبد هم آیتم با تنوع و هم بدون تنوع دارد (رزرو برای هر کدام یک UPDATE جدا دارد)
+    cart_sizes = (2, 5, 20)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.products = [
+            cls.create_product(
+                f'product-{number}', name=f'محصول {number}', discount_price=900 if number % 2 else None, stock=5
+            ) for number in range(max(cls.cart_sizes))
+        ]
+        cls.variant = ProductVariant.objects.create(product=cls.products[0], name='آبی', stock=5)
+        cls.address = create_address(cls.user)
+        cls.method = create_shipping_method()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, size, quantity=1):
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products[:size]:
+            variant = self.variant if product == self.products[0] else None
+            CartItem.objects.create(
+                cart=cart, product=product, variant=variant, quantity=quantity, unit_price=product.final_price
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/checkout/', {
+                'cart_id': cart.pk, 'shipping_address_id': self.address.pk,
+                'shipping_method_id': self.method.pk, 'payment_method': 'cod',
+            })
+        return response, len(queries)
+
+    def test_query_count_is_constant_in_cart_size(self):
+        counts = {}
+        for size in self.cart_sizes:
+            response, counts[size] = self.checkout(size)
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(Order.objects.get(pk=response.data['order_id']).items.count(), size)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_stock_is_checked_before_reserving(self):
+        self.variant.stock = 0
+        self.variant.save()
+        response, _ = self.checkout(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('محصول 0', str(response.data))
+        self.assertFalse(Order.objects.exists())
+
+    def test_cart_of_another_user_is_rejected(self):
+        self.client.force_authenticate(create_user())
+        response, _ = self.checkout(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Cart.objects.filter(status='converted').exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StockReservationTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = cls.create_product('vase', name='گلدان', stock=1)
+        cls.address = create_address(cls.user)
+        cls.method = create_shipping_method()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1, unit_price=1000)
+        return self.client.post('/api/orders/checkout/', {
+            'cart_id': cart.pk, 'shipping_address_id': self.address.pk,
+            'shipping_method_id': self.method.pk, 'payment_method': 'online',
+        })
+
+    def test_last_unit_is_reserved_for_one_checkout(self):
+        self.assertEqual(self.checkout().status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (1, 1))
+        self.assertFalse(self.product.is_in_stock)
+
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_payment_converts_reservation(self):
+        from .reservations import commit_reservations
+
+        order = Order.objects.get(pk=self.checkout().data['order_id'])
+        self.assertEqual(commit_reservations(order), {(self.product.pk, None)})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (0, 0))
+        self.assertEqual(commit_reservations(order), set())
+
+    def test_expired_reservations_are_released(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import ReservationStatus, StockReservation
+        from .reservations import release_expired_reservations
+
+        self.checkout()
+        self.assertEqual(release_expired_reservations(), 0)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (1, 0))
+        self.assertEqual(StockReservation.objects.get().status, ReservationStatus.RELEASED)
+
+    def sell_out_after_expiry(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import StockReservation
+        from .reservations import release_expired_reservations
+
+        order = Order.objects.get(pk=self.checkout().data['order_id'])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_reservations()
+        # آخرین واحد پس از آزاد شدن رزرو به خریدار دیگری فروخته می‌شود
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+        return order
+
+    def test_wallet_payment_after_expiry_is_rejected_without_charging(self):
+        from apps.wallet.models import Wallet
+        from .views import CheckoutView
+
+        order = self.sell_out_after_expiry()
+        wallet = Wallet.objects.create(user=self.user, balance=5000)
+        result = CheckoutView()._process_wallet_payment(order, self.user)
+
+        self.assertFalse(result['success'])
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, 5000)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.invoice.is_paid), ('pending', False))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (0, 0))
+
+    def test_gateway_payment_after_expiry_is_refunded_to_wallet(self):
+        from django.utils import timezone
+        from apps.payments.models import Payment, PaymentGateway
+        from apps.payments.views import PaymentCallbackView
+
+        order = self.sell_out_after_expiry()
+        payment = Payment.objects.create(
+            user=self.user, order=order, amount=order.final_price, status='completed',
+            gateway=PaymentGateway.objects.create(name='زرین‌پال', code='zarinpal'),
+            payment_date=timezone.now(), transaction_id='TX-1'
+        )
+        PaymentCallbackView()._update_order_status(payment)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(self.user.wallet.balance, order.final_price)
+        self.assertEqual(self.user.wallet.transactions.get().transaction_type, 'refund')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.sales_count), (0, 0))
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.balance, 0)
+
+    def test_product_edit_does_not_overwrite_reservations(self):
+        import uuid
+        from apps.products.serializers import ProductCreateUpdateSerializer
+
+        # نمونه پیش از رزرو خوانده شده و reserved_stock آن قدیمی است
+        stale = Product.objects.get(pk=self.product.pk)
+        self.checkout()
+        serializer = ProductCreateUpdateSerializer(stale, data={'stock': 5}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (5, 1))
+
+        # ذخیره نمونه جدید با شناسه از پیش تعیین‌شده درج می‌شود
+        copy = Product(
+            id=uuid.uuid4(), seller=self.product.seller, category=self.product.category,
+            name='کپی', slug='copy', description='-', price=1000,
+        )
+        copy.save()
+        self.assertTrue(Product.objects.filter(pk=copy.pk).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SettlementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.sellers.models import TieredCommission
+
+        cls.flat = create_seller(shop_name='درصدی', commission_value=10)
+        cls.user = cls.flat.user
+        cls.tiered = create_seller(shop_name='پلکانی', commission_type='tiered', commission_value=20)
+        TieredCommission.objects.create(seller=cls.tiered, min_sales=0, max_sales=2500, commission_percentage=5)
+        TieredCommission.objects.create(seller=cls.tiered, min_sales=2501, commission_percentage=2)
+        category = create_category()
+        cls.products = [
+            create_product(
+                cls.flat if number % 2 else cls.tiered, category, f'product-{number}',
+                name=f'محصول {number}', stock=50
+            ) for number in range(10)
+        ]
+        cls.address = create_address(cls.user)
+        cls.method = create_shipping_method()
+
+    def create_order(self, products, number):
+        from .models import OrderItem
+
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD-{number}', total_price=0, final_price=0,
+            shipping_address=self.address, shipping_method=self.method, payment_method='online'
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=product, seller=product.seller, product_name=product.name,
+                quantity=2, unit_price=1000, final_price=1000, total_price=2000
+            ) for product in products
+        ])
+        return order
+
+    def test_query_count_is_constant_in_order_size(self):
+        from .settlement import settle_paid_order
+
+        counts = set()
+        for number, size in enumerate((2, 10)):
+            order = self.create_order(self.products[:size], number)
+            with CaptureQueriesContext(connection) as queries:
+                settle_paid_order(order)
+            counts.add(len(queries))
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_stock_sales_and_seller_balances(self):
+        from apps.products.models import ProductInventoryLog
+        from .settlement import settle_paid_order
+
+        order = self.create_order(self.products[:4], 1)
+        settle_paid_order(order)
+
+        self.assertEqual(
+            set(Product.objects.filter(pk__in=[p.pk for p in self.products[:4]]).values_list('stock', 'sales_count')),
+            {(48, 2)}
+        )
+        self.assertEqual(ProductInventoryLog.objects.filter(reference=str(order.id)).count(), 4)
+        # پله اول (۵٪) برای آیتم اول و پله دوم (۲٪) پس از عبور درآمد از ۲۵۰۰
+        self.assertEqual(
+            sorted(order.items.filter(seller=self.tiered).values_list('commission', flat=True)), [40, 100]
+        )
+        self.tiered.refresh_from_db()
+        self.flat.refresh_from_db()
+        self.assertEqual((self.tiered.sales_count, self.tiered.total_revenue, self.tiered.balance), (4, 4000, 3860))
+        self.assertEqual((self.flat.sales_count, self.flat.total_revenue, self.flat.balance), (4, 4000, 3600))
+
+    def test_reverse_settlement_restores_stock_and_balances(self):
+        from .settlement import reverse_settlement, settle_paid_order
+
+        order = self.create_order(self.products[:3], 2)
+        settle_paid_order(order)
+        reverse_settlement(order)
+
+        self.assertEqual(
+            set(Product.objects.filter(pk__in=[p.pk for p in self.products[:3]]).values_list('stock', 'sales_count')),
+            {(50, 0)}
+        )
+        self.tiered.refresh_from_db()
+        self.assertEqual((self.tiered.sales_count, self.tiered.total_revenue, self.tiered.balance), (0, 0, 0))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AbandonedCartSweeperTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        user = create_user()
+        now = timezone.now()
+        self.stale = [Cart.objects.create(user=user) for _ in range(3)]
+        self.fresh = Cart.objects.create(user=user)
+        self.old_guest = Cart.objects.create(session_key='guest')
+        Cart.objects.filter(pk__in=[cart.pk for cart in self.stale]).update(updated_at=now - timedelta(days=5))
+        Cart.objects.filter(pk=self.old_guest.pk).update(updated_at=now - timedelta(days=60))
+
+    def test_stale_carts_are_abandoned_in_resumable_chunks(self):
+        from apps.analytics.models import CartEvent
+        from .models import CartStatus
+        from .sweeper import sweep_abandoned_carts
+
+        # سه سبد کاربر و سبد مهمان قدیمی؛ اجرای دوم از موقعیت ذخیره‌شده ادامه می‌دهد
+        first = sweep_abandoned_carts(batch_size=3, max_batches=1, purge_after=None)
+        self.assertEqual(first, {'abandoned': 3, 'purged': 0, 'complete': False})
+        second = sweep_abandoned_carts(batch_size=3, max_batches=1, purge_after=None)
+        self.assertEqual(second, {'abandoned': 1, 'purged': 0, 'complete': True})
+
+        self.assertEqual(Cart.objects.filter(status=CartStatus.ABANDONED).count(), 4)
+        self.fresh.refresh_from_db()
+        self.assertEqual(self.fresh.status, CartStatus.OPEN)
+        self.assertEqual(CartEvent.objects.filter(event_type='abandon').count(), 4)
+        self.assertEqual(CartEvent.objects.get(cart=self.old_guest).session_id, 'guest')
+
+    def test_old_guest_carts_are_purged(self):
+        from .sweeper import sweep_abandoned_carts
+
+        result = sweep_abandoned_carts(purge_after=60 * 60 * 24 * 30)
+        self.assertEqual(result['purged'], 1)
+        self.assertFalse(Cart.objects.filter(pk=self.old_guest.pk).exists())
+        self.assertEqual(Cart.objects.count(), 4)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AdminOrderListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .models import OrderItem, OrderStatus
+
+        cls.admin = create_user(is_staff=True)
+        customer = create_user(first_name='مریم')
+        cls.sellers = [create_seller(shop_name=f'فروشگاه {number}') for number in range(2)]
+        product = create_product(cls.sellers[0], create_category(), 'teapot', name='قوری')
+        address = create_address(customer)
+        method = create_shipping_method()
+        statuses = [OrderStatus.PENDING, OrderStatus.PAID, OrderStatus.SHIPPED] * 4
+        for number, order_status in enumerate(statuses):
+            order = Order.objects.create(
+                user=customer, order_number=f'ORD-{number:04}', status=order_status, total_price=1000,
+                final_price=1200, shipping_address=address, shipping_method=method,
+                payment_method='cod' if number % 2 else 'online'
+            )
+            OrderItem.objects.create(
+                order=order, product=product, seller=cls.sellers[number % 2], product_name=product.name,
+                quantity=1, unit_price=1000, final_price=1000, total_price=1000
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_list_is_lean_filtered_and_keyset_paged(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/admin/orders/', {'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        # جز INSERT لاگ فعالیت (میان‌افزار)، فقط یک SELECT با JOIN کاربر
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1, selects)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['customer_name'], 'مریم')
+        self.assertNotIn('items', response.data['results'][0])
+
+        seen = {row['order_number'] for row in response.data['results']}
+        next_page = self.client.get(response.data['next'])
+        self.assertFalse(seen & {row['order_number'] for row in next_page.data['results']})
+
+        response = self.client.get('/api/orders/admin/orders/', {
+            'status': 'paid,shipped', 'payment_method': 'cod', 'seller': self.sellers[1].pk,
+        })
+        self.assertEqual({row['status'] for row in response.data['results']}, {'paid', 'shipped'})
+        self.assertEqual(len(response.data['results']), 4)
+
+        self.assertEqual(self.client.get('/api/orders/admin/orders/', {'date_from': '2024-13-01'}).status_code, 400)
+
+    def test_export_streams_csv_and_xlsx(self):
+        response = self.client.get('/api/orders/admin/orders/export/', {'status': 'pending'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertIn('در انتظار پرداخت', lines[1])
+
+        response = self.client.get('/api/orders/admin/orders/export/', {'file_format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+        self.assertEqual(self.client.get('/api/orders/admin/orders/export/', {'file_format': 'pdf'}).status_code, 400)
+
+
+class BulkOrderStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.accounts.models import UserProfile
+        from .models import OrderItem, OrderStatus
+
+        cls.admin = create_user(is_staff=True)
+        cls.customers = [create_user() for _ in range(2)]
+        UserProfile.objects.create(user=cls.customers[0], loyalty_points=5)
+        seller = create_seller()
+        product = create_product(seller, create_category(), 'teapot', name='قوری')
+        method = create_shipping_method()
+        cls.orders = []
+        for number in range(8):
+            customer = cls.customers[number % 2]
+            address = create_address(customer)
+            order = Order.objects.create(
+                user=customer, order_number=f'BLK-{number:04}',
+                status=OrderStatus.PENDING if number == 7 else OrderStatus.SHIPPED,
+                total_price=25000, final_price=25000, shipping_address=address, shipping_method=method,
+            )
+            OrderItem.objects.create(
+                order=order, product=product, seller=seller, product_name=product.name, status=order.status,
+                quantity=1, unit_price=25000, final_price=25000, total_price=25000
+            )
+            cls.orders.append(order)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, order_ids, new_status='delivered'):
+        return self.client.post('/api/orders/admin/orders/bulk_update_status/', {
+            'order_ids': [str(order_id) for order_id in order_ids], 'status': new_status, 'description': 'گروهی',
+        }, format='json')
+
+    def test_valid_orders_move_and_others_are_reported(self):
+        from apps.accounts.models import UserProfile
+        from .models import OrderHistory, OrderItem
+
+        order_ids = [order.pk for order in self.orders] + ['not-a-uuid']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.post(order_ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 7)
+        failed = [result for result in response.data['results'] if not result['success']]
+        self.assertEqual([result['order_id'] for result in failed], [str(self.orders[7].pk), 'not-a-uuid'])
+
+        self.assertEqual(Order.objects.filter(status='delivered').count(), 7)
+        self.assertEqual(OrderItem.objects.filter(status='delivered').count(), 7)
+        self.assertEqual(OrderHistory.objects.filter(status='delivered', created_by=self.admin).count(), 7)
+        # هر سفارش ۲ امتیاز؛ یک تسک برای هر کاربر
+        self.assertEqual(len(callbacks), 1)
+        points = dict(UserProfile.objects.values_list('user_id', 'loyalty_points'))
+        self.assertEqual(points, {self.customers[0].pk: 5 + 4 * 2, self.customers[1].pk: 3 * 2})
+
+        # سفارش تحویل‌شده دوباره منتقل نمی‌شود
+        response = self.post([self.orders[0].pk])
+        self.assertEqual(response.data['updated'], 0)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        counts = []
+        for orders in (self.orders[:2], self.orders[2:7]):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post([order.pk for order in orders])
+            self.assertEqual(response.data['updated'], len(orders))
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post([], 'delivered').status_code, 400)
+        self.assertEqual(self.post([self.orders[0].pk], 'lost').status_code, 400)
+
+    def test_money_and_stock_states_are_not_bulk_transitions(self):
+        from .models import OrderStatus
+
+        for new_status in ('paid', 'cancelled', 'refunded', 'pending'):
+            self.assertEqual(self.post([self.orders[7].pk], new_status).status_code, 400)
+        # سفارش در انتظار پرداخت فقط از مسیر پرداخت جلو می‌رود
+        response = self.post([self.orders[7].pk], 'processing')
+        self.assertEqual(response.data['updated'], 0)
+        self.assertEqual(Order.objects.get(pk=self.orders[7].pk).status, OrderStatus.PENDING)
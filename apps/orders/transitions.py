@@ -0,0 +1,110 @@
+"""
+تغییر گروهی وضعیت سفارش‌ها
+
+سفارش‌های درخواستی با یک SELECT قفل می‌شوند و هر کدام با جدول ALLOWED_TRANSITIONS
+سنجیده می‌شود که فقط مراحل ارسال (پرداخت‌شده ← در حال پردازش ← ارسال‌شده ← تحویل‌شده)
+را مجاز می‌داند؛ سفارش‌های مجاز با یک UPDATE روی سفارش‌ها و یک UPDATE روی آیتم‌ها
+منتقل می‌شوند و تاریخچه آن‌ها با یک bulk_create ثبت می‌شود. امتیاز وفاداری سفارش‌های
+تحویل‌شده برای هر کاربر جمع می‌شود و پس از commit به صورت یک تسک برای هر کاربر در صف
+قرار می‌گیرد. نتیجه هر سفارش (موفق یا دلیل رد) جداگانه برگردانده می‌شود.
+"""
+import logging
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderHistory, OrderItem, OrderStatus
+
+# هر 10 هزار تومان مبلغ نهایی سفارش تحویل‌شده 1 امتیاز وفاداری
+LOYALTY_POINT_AMOUNT = 10000
+
+# فقط مراحل ارسال؛ پرداخت، لغو و استرداد موجودی، رزروها و حساب‌ها را تغییر می‌دهند و
+# باید از مسیرهای خودشان (تسویه، لغو سفارش و مرجوعی) انجام شوند
+ALLOWED_TRANSITIONS = {
+    OrderStatus.PAID: {OrderStatus.PROCESSING},
+    OrderStatus.PROCESSING: {OrderStatus.SHIPPED},
+    OrderStatus.SHIPPED: {OrderStatus.DELIVERED},
+}
+BULK_STATUSES = set().union(*ALLOWED_TRANSITIONS.values())
+
+logger = logging.getLogger(__name__)
+
+
+def loyalty_points(final_price):
+    return int(final_price / LOYALTY_POINT_AMOUNT)
+
+
+def _queue_loyalty_credits(points_by_user):
+    from apps.accounts.tasks import credit_loyalty_points
+
+    for user_id, points in points_by_user.items():
+        try:
+            credit_loyalty_points.delay(str(user_id), points)
+        except Exception:
+            # در نبود broker امتیاز همین‌جا اعمال می‌شود تا از دست نرود
+            logger.warning('Queueing loyalty points for user %s failed', user_id, exc_info=True)
+            credit_loyalty_points(user_id, points)
+
+
+def _rejection(current, new_status):
+    if current == new_status:
+        return 'سفارش در همین وضعیت است'
+    if new_status not in ALLOWED_TRANSITIONS.get(current, ()):
+        return f'تغییر وضعیت از «{OrderStatus(current).label}» به «{OrderStatus(new_status).label}» مجاز نیست'
+    return None
+
+
+def bulk_transition(order_ids, new_status, description='', user=None):
+    """
+    انتقال گروهی سفارش‌ها به new_status
+
+    خروجی: فهرست {'order_id', 'success', 'error'} به ترتیب order_ids
+    """
+    pk_field = Order._meta.pk
+    requested = []
+    for order_id in order_ids:
+        try:
+            requested.append((order_id, pk_field.to_python(order_id)))
+        except ValidationError:
+            requested.append((order_id, None))
+
+    results, moved = [], []
+    with transaction.atomic():
+        orders = {
+            pk: (current, user_id, final_price)
+            for pk, current, user_id, final_price in Order.objects.select_for_update().filter(
+                pk__in={pk for _, pk in requested if pk is not None}
+            ).values_list('pk', 'status', 'user_id', 'final_price')
+        }
+        for order_id, pk in requested:
+            if pk not in orders:
+                error = 'سفارش یافت نشد'
+            elif pk in moved:
+                error = 'سفارش تکراری است'
+            else:
+                error = _rejection(orders[pk][0], new_status)
+            if error is None:
+                moved.append(pk)
+                results.append({'order_id': str(order_id), 'success': True})
+            else:
+                results.append({'order_id': str(order_id), 'success': False, 'error': error})
+
+        if moved:
+            Order.objects.filter(pk__in=moved).update(status=new_status, updated_at=timezone.now())
+            OrderItem.objects.filter(order_id__in=moved).update(status=new_status)
+            OrderHistory.objects.bulk_create([
+                OrderHistory(order_id=pk, status=new_status, description=description, created_by=user)
+                for pk in moved
+            ])
+
+            if new_status == OrderStatus.DELIVERED:
+                points_by_user = Counter()
+                for pk in moved:
+                    _, user_id, final_price = orders[pk]
+                    points_by_user[user_id] += loyalty_points(final_price)
+                points_by_user = {user_id: points for user_id, points in points_by_user.items() if points}
+                if points_by_user:
+                    transaction.on_commit(lambda: _queue_loyalty_credits(points_by_user))
+    return results
@@ -1,22 +1,35 @@
 from rest_framework import viewsets, permissions, status, generics
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import Sum, F, Q
+from django.db.models import Exists, OuterRef, Sum, F
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from datetime import datetime, time, timedelta
 import uuid
 
 from .models import (
     Cart, CartItem, Order, OrderItem, OrderHistory, OrderReturn,
     OrderReturnImage, Invoice, InstallmentPlan, Installment, CartStatus, OrderStatus
 )
+from .cart_store import cart_owner, get_cart_store
+from .exports import CONTENT_TYPES, ExportError, export_orders
+from .reservations import release_reservations
+from .settlement import reverse_settlement, settle_paid_order
+from .transitions import BULK_STATUSES, bulk_transition
 from .serializers import (
     CartSerializer, CartItemSerializer, OrderListSerializer, OrderDetailSerializer,
-    CheckoutSerializer, OrderReturnSerializer, OrderHistorySerializer
+    AdminOrderListSerializer, CheckoutSerializer, OrderReturnSerializer, OrderHistorySerializer
 )
+from apps.products.inventory import NegativeStock, StockMovement, apply_movements
 from apps.products.models import Product, ProductVariant
 from apps.sellers.permissions import IsAdminUser
+from apps.common.pagination import CursorOptInPagination, KeysetPagination
+from apps.common.serializers import prefetch_requested
 
 
 class CartPermission(permissions.BasePermission):
@@ -30,23 +43,48 @@ class CartPermission(permissions.BasePermission):
 
 
 class CartViewSet(viewsets.ModelViewSet):
+    """
+    سبد خرید؛ سبدها از طریق backend تنظیم‌شده در CART_BACKEND خوانده و نوشته می‌شوند
+    (apps.orders.cart_store)
+    """
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated, CartPermission]
     
+    @property
+    def cart_store(self):
+        if not hasattr(self, '_cart_store'):
+            self._cart_store = get_cart_store()
+        return self._cart_store
+    
     def get_queryset(self):
         return Cart.objects.filter(user=self.request.user, status=CartStatus.OPEN)
     
+    def get_object(self):
+        cart = self.cart_store.get(self.kwargs[self.lookup_field])
+        if cart is None or cart.user_id != self.request.user.pk:
+            raise Http404
+        self.check_object_permissions(self.request, cart)
+        return cart
+    
+    def list(self, request, *args, **kwargs):
+        carts = self.cart_store.open_carts(cart_owner(request))
+        page = self.paginate_queryset(carts)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(carts, many=True).data)
+    
     def create(self, request, *args, **kwargs):
-        # بررسی وجود سبد خرید فعال
-        active_cart = Cart.objects.filter(user=request.user, status=CartStatus.OPEN).first()
-        if active_cart:
-            serializer = self.get_serializer(active_cart)
-            return Response(serializer.data)
-        
-        # ایجاد سبد خرید جدید
-        cart = Cart.objects.create(user=request.user)
+        # سبد خرید فعال یا در صورت نبود، سبد جدید
+        cart, created = self.cart_store.get_active(cart_owner(request))
         serializer = self.get_serializer(cart)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
+    def perform_update(self, serializer):
+        # همه فیلدهای سبد فقط‌خواندنی هستند؛ فقط زمان سبد به‌روز می‌شود
+        self.cart_store.touch(serializer.instance)
+    
+    def perform_destroy(self, instance):
+        self.cart_store.delete(instance)
     
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
@@ -63,28 +101,8 @@ class CartViewSet(viewsets.ModelViewSet):
             if variant:
                 unit_price += variant.price_adjustment
             
-            # بررسی وجود آیتم مشابه در سبد
-            try:
-                cart_item = CartItem.objects.get(
-                    cart=cart,
-                    product=product,
-                    variant=variant
-                )
-                # به‌روزرسانی تعداد
-                cart_item.quantity += quantity
-                cart_item.save()
-            except CartItem.DoesNotExist:
-                # ایجاد آیتم جدید
-                cart_item = CartItem.objects.create(
-                    cart=cart,
-                    product=product,
-                    variant=variant,
-                    quantity=quantity,
-                    unit_price=unit_price
-                )
-            
-            # به‌روزرسانی زمان سبد خرید
-            cart.save()
+            # افزودن به آیتم مشابه یا ایجاد آیتم جدید
+            cart_item = self.cart_store.add_item(cart, product, variant, quantity, unit_price)
             
             return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
         
@@ -99,25 +117,20 @@ class CartViewSet(viewsets.ModelViewSet):
         if not item_id or not quantity or int(quantity) < 1:
             return Response({'error': 'آیتم یا تعداد نامعتبر است'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            cart_item = CartItem.objects.get(cart=cart, id=item_id)
-        except CartItem.DoesNotExist:
+        cart_item = self.cart_store.get_item(cart, item_id)
+        if cart_item is None:
             return Response({'error': 'آیتم در سبد خرید یافت نشد'}, status=status.HTTP_404_NOT_FOUND)
         
         # بررسی موجودی
         if cart_item.variant:
-            if cart_item.variant.stock < int(quantity):
+            if cart_item.variant.available_stock < int(quantity):
                 return Response({'error': 'موجودی کافی نیست'}, status=status.HTTP_400_BAD_REQUEST)
         else:
-            if cart_item.product.stock < int(quantity):
+            if cart_item.product.available_stock < int(quantity):
                 return Response({'error': 'موجودی کافی نیست'}, status=status.HTTP_400_BAD_REQUEST)
         
         # به‌روزرسانی تعداد
-        cart_item.quantity = int(quantity)
-        cart_item.save()
-        
-        # به‌روزرسانی زمان سبد خرید
-        cart.save()
+        cart_item = self.cart_store.update_item(cart, cart_item, int(quantity))
         
         return Response(CartItemSerializer(cart_item).data)
     
@@ -129,39 +142,27 @@ class CartViewSet(viewsets.ModelViewSet):
         if not item_id:
             return Response({'error': 'آیتم نامعتبر است'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            cart_item = CartItem.objects.get(cart=cart, id=item_id)
-        except CartItem.DoesNotExist:
+        cart_item = self.cart_store.get_item(cart, item_id)
+        if cart_item is None:
             return Response({'error': 'آیتم در سبد خرید یافت نشد'}, status=status.HTTP_404_NOT_FOUND)
         
-        cart_item.delete()
-        
-        # به‌روزرسانی زمان سبد خرید
-        cart.save()
+        self.cart_store.remove_item(cart, cart_item)
         
         return Response({'status': 'آیتم با موفقیت حذف شد'})
     
     @action(detail=True, methods=['post'])
     def clear(self, request, pk=None):
         cart = self.get_object()
-        cart.items.all().delete()
-        
-        # به‌روزرسانی زمان سبد خرید
-        cart.save()
+        self.cart_store.clear(cart)
         
         return Response({'status': 'سبد خرید با موفقیت خالی شد'})
     
     @action(detail=False, methods=['get'])
     def active(self, request):
-        cart = Cart.objects.filter(user=request.user, status=CartStatus.OPEN).first()
-        if cart:
-            serializer = self.get_serializer(cart)
-            return Response(serializer.data)
-        else:
-            # ایجاد سبد خرید جدید
-            cart = Cart.objects.create(user=request.user)
-            serializer = self.get_serializer(cart)
-            return Response(serializer.data)
+        # سبد خرید فعال یا در صورت نبود، سبد جدید
+        cart, _ = self.cart_store.get_active(cart_owner(request))
+        serializer = self.get_serializer(cart)
+        return Response(serializer.data)
 
 
 class CheckoutView(generics.GenericAPIView):
@@ -214,8 +215,12 @@ class CheckoutView(generics.GenericAPIView):
         # بررسی موجودی کیف پول
         from apps.wallet.models import Wallet
         try:
-            wallet = Wallet.objects.get(user=user)
-            if wallet.balance >= order.final_price:
+            # برداشت از کیف پول و تسویه سفارش با هم انجام یا با هم برگردانده می‌شوند
+            with transaction.atomic():
+                wallet = Wallet.objects.select_for_update().get(user=user)
+                if wallet.balance < order.final_price:
+                    return {'success': False, 'message': 'موجودی کیف پول کافی نیست'}
+
                 # کسر از موجودی کیف پول
                 wallet.balance -= order.final_price
                 wallet.save()
@@ -243,14 +248,15 @@ class CheckoutView(generics.GenericAPIView):
                 invoice.payment_date = timezone.now()
                 invoice.save()
                 
-                # به‌روزرسانی موجودی محصولات
-                self._update_product_inventory(order)
-                
-                return {'success': True}
-            else:
-                return {'success': False, 'message': 'موجودی کیف پول کافی نیست'}
+                # کسر موجودی و تسویه فروشندگان
+                settle_paid_order(order)
         except Wallet.DoesNotExist:
             return {'success': False, 'message': 'کیف پول شما فعال نیست'}
+        except NegativeStock:
+            # رزرو منقضی شده و موجودی در این فاصله فروخته شده است؛ پرداخت انجام نمی‌شود
+            return {'success': False, 'message': 'موجودی برخی از محصولات این سفارش تمام شده است'}
+        
+        return {'success': True}
     
     def _create_installment_plan(self, order):
         # ایجاد طرح اقساطی با پیش‌فرض‌های مناسب
@@ -279,86 +285,28 @@ class CheckoutView(generics.GenericAPIView):
             )
         
         return plan
-    
-    def _update_product_inventory(self, order):
-        # به‌روزرسانی موجودی محصولات
-        for item in order.items.all():
-            if item.variant:
-                variant = item.variant
-                variant.stock -= item.quantity
-                variant.save()
-                
-                # ثبت لاگ تغییر موجودی
-                from apps.products.models import ProductInventoryLog
-                ProductInventoryLog.objects.create(
-                    product=item.product,
-                    variant=variant,
-                    previous_stock=variant.stock + item.quantity,
-                    new_stock=variant.stock,
-                    change_reason=f'فروش - سفارش {order.order_number}',
-                    reference=str(order.id)
-                )
-            else:
-                product = item.product
-                product.stock -= item.quantity
-                product.save()
-                
-                # ثبت لاگ تغییر موجودی
-                from apps.products.models import ProductInventoryLog
-                ProductInventoryLog.objects.create(
-                    product=product,
-                    previous_stock=product.stock + item.quantity,
-                    new_stock=product.stock,
-                    change_reason=f'فروش - سفارش {order.order_number}',
-                    reference=str(order.id)
-                )
-            
-            # به‌روزرسانی تعداد فروش محصول
-            product = item.product
-            product.sales_count += item.quantity
-            product.save()
-            
-            # به‌روزرسانی آمار فروشنده
-            seller = item.seller
-            seller.sales_count += item.quantity
-            seller.total_revenue += item.total_price
-            
-            # محاسبه کمیسیون
-            commission = 0
-            if seller.commission_type == 'fixed':
-                commission = seller.commission_value
-            elif seller.commission_type == 'percentage':
-                commission = item.total_price * (seller.commission_value / 100)
-            elif seller.commission_type == 'tiered':
-                # محاسبه کمیسیون پلکانی بر اساس میزان فروش
-                from apps.sellers.models import TieredCommission
-                tiered_commission = TieredCommission.objects.filter(
-                    seller=seller,
-                    min_sales__lte=seller.total_revenue
-                ).filter(
-                    Q(max_sales__gte=seller.total_revenue) | Q(max_sales__isnull=True)
-                ).first()
-                
-                if tiered_commission:
-                    commission = item.total_price * (tiered_commission.commission_percentage / 100)
-                else:
-                    commission = item.total_price * (seller.commission_value / 100)
-            
-            # ذخیره کمیسیون در آیتم سفارش
-            item.commission = commission
-            item.save()
-            
-            # به‌روزرسانی موجودی فروشنده (درآمد منهای کمیسیون)
-            seller.balance += (item.total_price - commission)
-            seller.save()
 
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = OrderListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CursorOptInPagination
+    
+    # prefetchهای جزئیات سفارش به تفکیک فیلد؛ فقط برای فیلدهای درخواستی اعمال می‌شوند
+    detail_prefetches = {
+        'items': ['items'],
+        'history': ['history__created_by'],
+        'shipping_address': ['select:shipping_address'],
+        'shipping_method': ['select:shipping_method'],
+        'invoice': ['select:invoice'],
+        'installment_plan': ['select:installment_plan', 'installment_plan__installments'],
+    }
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Order.objects.filter(user=self.request.user).order_by('-created_at')
+        if self.action == 'retrieve':
+            queryset = prefetch_requested(queryset, self.request, self.detail_prefetches)
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -376,6 +324,7 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        was_paid = order.status == OrderStatus.PAID
         with transaction.atomic():
             # به‌روزرسانی وضعیت سفارش
             order.status = OrderStatus.CANCELLED
@@ -409,51 +358,12 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
                     reference_id=str(order.id)
                 )
             
-            # برگشت موجودی محصولات
-            for item in order.items.all():
-                if item.variant:
-                    variant = item.variant
-                    variant.stock += item.quantity
-                    variant.save()
-                    
-                    # ثبت لاگ تغییر موجودی
-                    from apps.products.models import ProductInventoryLog
-                    ProductInventoryLog.objects.create(
-                        product=item.product,
-                        variant=variant,
-                        previous_stock=variant.stock - item.quantity,
-                        new_stock=variant.stock,
-                        change_reason=f'لغو سفارش {order.order_number}',
-                        reference=str(order.id)
-                    )
-                else:
-                    product = item.product
-                    product.stock += item.quantity
-                    product.save()
-                    
-                    # ثبت لاگ تغییر موجودی
-                    from apps.products.models import ProductInventoryLog
-                    ProductInventoryLog.objects.create(
-                        product=product,
-                        previous_stock=product.stock - item.quantity,
-                        new_stock=product.stock,
-                        change_reason=f'لغو سفارش {order.order_number}',
-                        reference=str(order.id)
-                    )
-                
-                # به‌روزرسانی تعداد فروش محصول
-                product = item.product
-                product.sales_count -= item.quantity
-                product.save()
-                
-                # به‌روزرسانی آمار فروشنده
-                seller = item.seller
-                seller.sales_count -= item.quantity
-                seller.total_revenue -= item.total_price
-                
-                # برگشت کمیسیون و درآمد
-                seller.balance -= (item.total_price - item.commission)
-                seller.save()
+            # سفارش پرداخت‌نشده فقط موجودی رزروشده دارد
+            release_reservations(order)
+            
+            # موجودی و آمار فروش فقط برای سفارش پرداخت‌شده کسر شده‌اند
+            if was_paid:
+                reverse_settlement(order)
         
         return Response({'status': 'سفارش با موفقیت لغو شد'})
     
@@ -487,6 +397,79 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = OrderDetailSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = KeysetPagination
+    bulk_status_limit = 1000
+    
+    # ستون‌های ردیف لیست؛ رابطه‌های تودرتو فقط در جزئیات سفارش خوانده می‌شوند
+    list_fields = (
+        'id', 'order_number', 'status', 'final_price', 'created_at', 'payment_method', 'payment_date',
+        'tracking_code', 'user__phone_number', 'user__first_name', 'user__last_name',
+    )
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'export'):
+            queryset = self.filter_orders(queryset)
+        if self.action == 'list':
+            queryset = queryset.select_related('user').only(*self.list_fields)
+        elif self.action == 'retrieve':
+            queryset = prefetch_requested(queryset, self.request, OrderViewSet.detail_prefetches)
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return AdminOrderListSerializer
+        return OrderDetailSerializer
+    
+    def filter_orders(self, queryset):
+        """فیلترهای status (چند مقدار با کاما)، payment_method، seller، date_from و date_to روی ستون‌های ایندکس‌شده"""
+        params = self.request.query_params
+        
+        statuses = [value for value in params.get('status', '').split(',') if value]
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        
+        payment_method = params.get('payment_method')
+        if payment_method:
+            queryset = queryset.filter(payment_method=payment_method)
+        
+        seller_id = params.get('seller')
+        if seller_id:
+            try:
+                seller_id = OrderItem._meta.get_field('seller').target_field.to_python(seller_id)
+            except DjangoValidationError:
+                raise ValidationError({'seller': 'شناسه فروشنده نامعتبر است'})
+            queryset = queryset.filter(
+                Exists(OrderItem.objects.filter(order=OuterRef('pk'), seller_id=seller_id))
+            )
+        
+        # بازه تاریخ به صورت بازه روی created_at تا ایندکس قابل استفاده بماند
+        for param, lookup, days in (('date_from', 'created_at__gte', 0), ('date_to', 'created_at__lt', 1)):
+            value = params.get(param)
+            if not value:
+                continue
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValidationError({param: 'تاریخ باید به شکل YYYY-MM-DD باشد'})
+            start = timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min))
+            queryset = queryset.filter(**{lookup: start})
+        return queryset
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """خروجی جریانی سفارش‌های فیلترشده در قالب csv یا xlsx"""
+        file_format = request.query_params.get('file_format', 'csv')
+        try:
+            content = export_orders(self.get_queryset(), file_format)
+        except ExportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+        return response
     
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
@@ -522,6 +505,34 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
         
         return Response({'status': 'وضعیت سفارش با موفقیت به‌روزرسانی شد'})
     
+    @action(detail=False, methods=['post'])
+    def bulk_update_status(self, request):
+        """تغییر وضعیت گروهی سفارش‌ها با نتیجه جداگانه برای هر سفارش"""
+        order_ids = request.data.get('order_ids')
+        new_status = request.data.get('status')
+        description = request.data.get('description', '')
+        
+        if not isinstance(order_ids, list) or not order_ids:
+            return Response({'error': 'فهرست شناسه سفارش‌ها الزامی است'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(order_ids) > self.bulk_status_limit:
+            return Response(
+                {'error': f'حداکثر {self.bulk_status_limit} سفارش در هر درخواست مجاز است'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if new_status not in dict(OrderStatus.choices).keys():
+            return Response({'error': 'وضعیت نامعتبر است'}, status=status.HTTP_400_BAD_REQUEST)
+        if new_status not in BULK_STATUSES:
+            return Response(
+                {'error': 'تغییر گروهی فقط برای مراحل ارسال سفارش مجاز است'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = bulk_transition(order_ids, new_status, description, user=request.user)
+        return Response({
+            'updated': sum(result['success'] for result in results),
+            'results': results,
+        })
+    
     @action(detail=True, methods=['post'])
     def update_tracking(self, request, pk=None):
         order = self.get_object()
@@ -568,36 +579,10 @@ class AdminOrderReturnViewSet(viewsets.ModelViewSet):
             # اگر وضعیت "تایید شده" باشد، به‌روزرسانی موجودی محصول
             if new_status == 'approved':
                 order_item = order_return.order_item
-                
-                if order_item.variant:
-                    variant = order_item.variant
-                    variant.stock += order_return.quantity
-                    variant.save()
-                    
-                    # ثبت لاگ تغییر موجودی
-                    from apps.products.models import ProductInventoryLog
-                    ProductInventoryLog.objects.create(
-                        product=order_item.product,
-                        variant=variant,
-                        previous_stock=variant.stock - order_return.quantity,
-                        new_stock=variant.stock,
-                        change_reason=f'مرجوعی سفارش {order_item.order.order_number}',
-                        reference=str(order_return.id)
-                    )
-                else:
-                    product = order_item.product
-                    product.stock += order_return.quantity
-                    product.save()
-                    
-                    # ثبت لاگ تغییر موجودی
-                    from apps.products.models import ProductInventoryLog
-                    ProductInventoryLog.objects.create(
-                        product=product,
-                        previous_stock=product.stock - order_return.quantity,
-                        new_stock=product.stock,
-                        change_reason=f'مرجوعی سفارش {order_item.order.order_number}',
-                        reference=str(order_return.id)
-                    )
+                apply_movements([StockMovement(
+                    order_item.product_id, order_item.variant_id, delta=order_return.quantity,
+                    reason=f'مرجوعی سفارش {order_item.order.order_number}', reference=str(order_return.id),
+                )], user=request.user)
             
             # اگر وضعیت "مسترد شده" باشد، برگشت وجه به کاربر
             if new_status == 'refunded':
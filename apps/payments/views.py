@@ -15,6 +15,9 @@ from .serializers import (
     PaymentGatewaySerializer, PaymentSerializer, PaymentInitSerializer,
     PaymentCallbackSerializer
 )
+from apps.orders.reservations import release_reservations
+from apps.orders.settlement import settle_paid_order
+from apps.products.inventory import NegativeStock
 from apps.sellers.permissions import IsAdminUser
 
 logger = logging.getLogger(__name__)
@@ -448,8 +451,44 @@ class PaymentCallbackView(generics.GenericAPIView):
         invoice.payment_date = payment.payment_date
         invoice.save()
         
-        # به‌روزرسانی موجودی محصولات
-        self._update_product_inventory(order)
+        # کسر موجودی و تسویه فروشندگان
+        try:
+            with transaction.atomic():
+                settle_paid_order(order)
+        except NegativeStock as exc:
+            # وجه از درگاه کسر شده ولی موجودی پس از انقضای رزرو فروخته شده است؛
+            # پرداخت ثبت می‌ماند، سفارش لغو و مبلغ به کیف پول مشتری برگردانده می‌شود
+            logger.error(f"Order {order.order_number} paid after its stock sold out: {exc}")
+            self._refund_unfulfillable_order(payment)
+    
+    def _refund_unfulfillable_order(self, payment):
+        from apps.orders.models import OrderStatus, OrderHistory
+        from apps.wallet.models import Wallet, WalletTransaction, TransactionStatus
+        
+        order = payment.order
+        order.status = OrderStatus.CANCELLED
+        order.save()
+        order.items.update(status=OrderStatus.CANCELLED)
+        release_reservations(order)
+        
+        wallet, created = Wallet.objects.select_for_update().get_or_create(user=order.user)
+        wallet.balance += payment.amount
+        wallet.save()
+        WalletTransaction.objects.create(
+            wallet=wallet,
+            amount=payment.amount,
+            transaction_type='refund',
+            status=TransactionStatus.COMPLETED,
+            description=f'برگشت وجه سفارش {order.order_number} به دلیل اتمام موجودی',
+            reference_id=str(order.id)
+        )
+        
+        OrderHistory.objects.create(
+            order=order,
+            status=OrderStatus.CANCELLED,
+            description='موجودی برخی از محصولات تمام شده بود؛ مبلغ پرداختی به کیف پول برگشت داده شد',
+            created_by=payment.user
+        )
     
     def _update_installment_status(self, payment):
         installment = payment.installment
@@ -476,80 +515,6 @@ class PaymentCallbackView(generics.GenericAPIView):
         wallet = wallet_transaction.wallet
         wallet.balance += wallet_transaction.amount
         wallet.save()
-    
-    def _update_product_inventory(self, order):
-        # به‌روزرسانی موجودی محصولات
-        for item in order.items.all():
-            if item.variant:
-                variant = item.variant
-                variant.stock -= item.quantity
-                variant.save()
-                
-                # ثبت لاگ تغییر موجودی
-                from apps.products.models import ProductInventoryLog
-                ProductInventoryLog.objects.create(
-                    product=item.product,
-                    variant=variant,
-                    previous_stock=variant.stock + item.quantity,
-                    new_stock=variant.stock,
-                    change_reason=f'فروش - سفارش {order.order_number}',
-                    reference=str(order.id)
-                )
-            else:
-                product = item.product
-                product.stock -= item.quantity
-                product.save()
-                
-                # ثبت لاگ تغییر موجودی
-                from apps.products.models import ProductInventoryLog
-                ProductInventoryLog.objects.create(
-                    product=product,
-                    previous_stock=product.stock + item.quantity,
-                    new_stock=product.stock,
-                    change_reason=f'فروش - سفارش {order.order_number}',
-                    reference=str(order.id)
-                )
-            
-            # به‌روزرسانی تعداد فروش محصول
-            product = item.product
-            product.sales_count += item.quantity
-            product.save()
-            
-            # به‌روزرسانی آمار فروشنده
-            seller = item.seller
-            seller.sales_count += item.quantity
-            seller.total_revenue += item.total_price
-            
-            # محاسبه کمیسیون
-            commission = 0
-            if seller.commission_type == 'fixed':
-                commission = seller.commission_value
-            elif seller.commission_type == 'percentage':
-                commission = item.total_price * (seller.commission_value / 100)
-            elif seller.commission_type == 'tiered':
-                # محاسبه کمیسیون پلکانی بر اساس میزان فروش
-                from apps.sellers.models import TieredCommission
-                from django.db.models import Q
-                
-                tiered_commission = TieredCommission.objects.filter(
-                    seller=seller,
-                    min_sales__lte=seller.total_revenue
-                ).filter(
-                    Q(max_sales__gte=seller.total_revenue) | Q(max_sales__isnull=True)
-                ).first()
-                
-                if tiered_commission:
-                    commission = item.total_price * (tiered_commission.commission_percentage / 100)
-                else:
-                    commission = item.total_price * (seller.commission_value / 100)
-            
-            # ذخیره کمیسیون در آیتم سفارش
-            item.commission = commission
-            item.save()
-            
-            # به‌روزرسانی موجودی فروشنده (درآمد منهای کمیسیون)
-            seller.balance += (item.total_price - commission)
-            seller.save()
 
 
 class AdminPaymentViewSet(viewsets.ReadOnlyModelViewSet):
@@ -5,6 +5,22 @@ from .models import (Product, ProductImage, ProductAttribute, ProductVariant,
                      ProductReview, ProductReviewImage, ProductReviewComment, 
                      ProductReviewReport, ProductQuestion, ProductAnswer, 
                      RelatedProduct, ProductInventoryLog)
+from .sync import update_products
+
+
+class ChangedFieldsSaveMixin:
+    """
+    ذخیره فقط فیلدهای تغییرکرده فرم در ویرایش؛ reserved_stock فقط با UPDATE رزروها
+    (apps.orders.reservations) تغییر می‌کند و نباید با مقدار خوانده‌شده فرم بازنویسی شود
+    """
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        update_fields = list(form.changed_data)
+        if update_fields and any(field.name == 'updated_at' for field in obj._meta.concrete_fields):
+            update_fields.append('updated_at')
+        obj.save(update_fields=update_fields)
 
 
 class ProductImageInline(admin.TabularInline):
@@ -41,7 +57,7 @@ class RelatedProductInline(admin.TabularInline):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ChangedFieldsSaveMixin, admin.ModelAdmin):
     list_display = ('name', 'seller', 'category', 'price', 'discount_price', 'stock', 
                    'is_active', 'is_approved', 'rating', 'sales_count', 'created_at')
     list_filter = ('is_active', 'is_approved', 'is_featured', 'category', 'created_at')
@@ -75,29 +91,42 @@ class ProductAdmin(admin.ModelAdmin):
     )
     actions = ['approve_products', 'unapprove_products', 'mark_as_featured', 'unmark_as_featured']
     
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ProductVariant:
+            return super().save_formset(request, form, formset, change)
+        # تنوع‌های موجود فقط با فیلدهای تغییرکرده ذخیره می‌شوند (reserved_stock دست نمی‌خورد)
+        formset.save(commit=False)
+        for variant in formset.deleted_objects:
+            variant.delete()
+        for variant in formset.new_objects:
+            variant.save()
+        for variant, changed_fields in formset.changed_objects:
+            variant.save(update_fields=changed_fields)
+        formset.save_m2m()
+    
     def approve_products(self, request, queryset):
-        updated = queryset.update(is_approved=True)
+        updated = update_products(queryset, is_approved=True)
         self.message_user(request, f'{updated} محصول تایید شد.')
     approve_products.short_description = 'تایید محصولات انتخاب شده'
     
     def unapprove_products(self, request, queryset):
-        updated = queryset.update(is_approved=False)
+        updated = update_products(queryset, is_approved=False)
         self.message_user(request, f'{updated} محصول از حالت تایید خارج شد.')
     unapprove_products.short_description = 'لغو تایید محصولات انتخاب شده'
     
     def mark_as_featured(self, request, queryset):
-        updated = queryset.update(is_featured=True)
+        updated = update_products(queryset, is_featured=True)
         self.message_user(request, f'{updated} محصول به عنوان ویژه علامت‌گذاری شد.')
     mark_as_featured.short_description = 'علامت‌گذاری به عنوان محصول ویژه'
     
     def unmark_as_featured(self, request, queryset):
-        updated = queryset.update(is_featured=False)
+        updated = update_products(queryset, is_featured=False)
         self.message_user(request, f'{updated} محصول از حالت ویژه خارج شد.')
     unmark_as_featured.short_description = 'حذف علامت محصول ویژه'
 
 
 @admin.register(ProductVariant)
-class ProductVariantAdmin(admin.ModelAdmin):
+class ProductVariantAdmin(ChangedFieldsSaveMixin, admin.ModelAdmin):
     list_display = ('name', 'product', 'sku', 'price_adjustment', 'stock', 'is_default')
     list_filter = ('is_default', 'product')
     search_fields = ('name', 'sku', 'product__name')
@@ -215,8 +244,8 @@ class ProductAnswerAdmin(admin.ModelAdmin):
 
 @admin.register(ProductInventoryLog)
 class ProductInventoryLogAdmin(admin.ModelAdmin):
-    list_display = ('product', 'variant', 'previous_stock', 'new_stock', 'change_reason', 'created_by', 'created_at')
-    list_filter = ('change_reason', 'created_at')
+    list_display = ('product', 'variant', 'warehouse', 'previous_stock', 'new_stock', 'change_reason', 'created_by', 'created_at')
+    list_filter = ('change_reason', 'warehouse', 'created_at')
     search_fields = ('product__name', 'variant__name', 'reference', 'created_by__username')
     readonly_fields = ('created_at',)
     date_hierarchy = 'created_at'
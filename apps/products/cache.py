@@ -0,0 +1,132 @@
+"""
+کش خروجی سریال‌شده صفحه جزئیات محصول
+
+خروجی ProductDetailSerializer زیر کلید slug محصول و گونه درخواست (expand و
+fields/omit) همراه با «نسخه» محصول در لحظه ساخت ذخیره می‌شود. نسخه هر محصول یک
+کلید جداگانه بر اساس شناسه محصول است که با هر تغییر محصول یا زیرمجموعه‌های آن
+(تصاویر، ویژگی‌ها، تنوع‌ها، برچسب‌ها، نظرات، پرسش‌ها و محصولات مرتبط) توسط
+سیگنال‌ها عوض می‌شود؛ بنابراین ورودی‌های قدیمی بدون نیاز به حذف صریح و حتی پس از
+تغییر slug نامعتبر می‌شوند.
+
+مقدار فیلدهای DETAIL_CACHE_VOLATILE_FIELDS (شمارنده بازدید) در کش ذخیره نمی‌شود و
+هنگام پاسخ از پایگاه داده خوانده می‌شود تا تغییرات پرتکرار آن‌ها کش را نامعتبر نکند.
+
+خطاهای سرور کش ثبت و نادیده گرفته می‌شوند تا در دسترس نبودن Redis مانع خواندن یا
+ذخیره محصولات نشود.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.common.utils import CacheManager
+
+DETAIL_CACHE_TIMEOUT = getattr(settings, 'PRODUCT_DETAIL_CACHE_TTL', 60 * 60)
+
+# فیلدهایی که در کش ذخیره نمی‌شوند و تغییر آن‌ها کش جزئیات را نامعتبر نمی‌کند
+DETAIL_CACHE_VOLATILE_FIELDS = {'view_count'}
+
+logger = logging.getLogger(__name__)
+
+
+def _detail_key(slug, variant=''):
+    # «|» در slug مجاز نیست و ترکیب slug و گونه درخواست را یکتا می‌کند
+    return CacheManager.get_cache_key('product_detail', f"{slug}|{variant}")
+
+
+def _version_key(product_id):
+    return CacheManager.get_cache_key('product_detail_version', product_id)
+
+
+def get_detail_version(product_id):
+    """نسخه فعلی محصول؛ در صورت نبود، نسخه جدیدی ساخته می‌شود"""
+    key = _version_key(product_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+    except Exception:
+        logger.warning('Reading product detail version failed', exc_info=True)
+        return None
+    return version
+
+
+def get_detail_versions(product_ids):
+    """
+    {شناسه محصول: نسخه فعلی} با یک خواندن گروهی؛ برای محصولات بدون نسخه، نسخه جدید
+    ساخته می‌شود. در صورت خطای کش None برگردانده می‌شود.
+    """
+    keys = {str(product_id): _version_key(product_id) for product_id in product_ids}
+    try:
+        versions = cache.get_many(list(keys.values()))
+        missing = [key for key in keys.values() if key not in versions]
+        if missing:
+            for key in missing:
+                cache.add(key, uuid.uuid4().hex, None)
+            versions.update(cache.get_many(missing))
+    except Exception:
+        logger.warning('Reading product detail versions failed', exc_info=True)
+        return None
+    return {product_id: versions.get(key) for product_id, key in keys.items()}
+
+
+def bump_detail_version(*product_ids):
+    """نامعتبر کردن کش جزئیات محصولات با تعویض نسخه آن‌ها"""
+    product_ids = {product_id for product_id in product_ids if product_id is not None}
+    if not product_ids:
+        return
+    try:
+        cache.set_many(
+            {_version_key(product_id): uuid.uuid4().hex for product_id in product_ids}, None
+        )
+    except Exception:
+        logger.warning('Invalidating product detail cache failed', exc_info=True)
+
+
+def get_cached_detail(slug, variant=''):
+    """
+    (شناسه محصول، خروجی کش‌شده جزئیات) یا None در صورت نبود یا قدیمی بودن
+
+    فیلدهای ناپایدار خروجی مقدار None دارند و باید با live_detail_fields پر شوند.
+    """
+    try:
+        entry = cache.get(_detail_key(slug, variant))
+        if not entry or cache.get(_version_key(entry['product_id'])) != entry['version']:
+            return None
+    except Exception:
+        logger.warning('Reading product detail cache failed', exc_info=True)
+        return None
+    return entry['product_id'], entry['data']
+
+
+def live_detail_fields(product_id, data):
+    """مقدار فعلی فیلدهای ناپایدار موجود در خروجی کش‌شده از پایگاه داده"""
+    from .models import Product
+
+    fields = [name for name in DETAIL_CACHE_VOLATILE_FIELDS if name in data]
+    if not fields:
+        return {}
+    return Product.objects.filter(pk=product_id).values(*fields).first() or {}
+
+
+def set_cached_detail(slug, product_id, version, data, variant=''):
+    """
+    ذخیره خروجی جزئیات محصول
+
+    نسخه باید پیش از سریال‌سازی خوانده شود تا تغییرات همزمان باعث ذخیره داده قدیمی
+    با نسخه جدید نشوند.
+    """
+    if version is None:
+        return
+    try:
+        cache.set(_detail_key(slug, variant), {
+            'product_id': product_id,
+            'version': version,
+            'data': {
+                name: None if name in DETAIL_CACHE_VOLATILE_FIELDS else value for name, value in data.items()
+            },
+        }, DETAIL_CACHE_TIMEOUT)
+    except Exception:
+        logger.warning('Writing product detail cache failed', exc_info=True)
@@ -0,0 +1,580 @@
+"""
+ورود و خروج گروهی کاتالوگ محصولات فروشنده
+
+فایل ورودی (CSV، JSONL یا xlsx) به صورت جریانی و ردیف به ردیف خوانده و اعتبارسنجی
+می‌شود. ردیف‌های معتبر در دسته‌های CHUNK_SIZE تایی با bulk_create/bulk_update در
+Product، ProductAttribute، ProductVariant و ProductTagRelation درج یا به‌روزرسانی
+می‌شوند. کلید تطبیق محصول، sku آن در کاتالوگ همان فروشنده است.
+
+ستون‌های attributes و variants در CSV و xlsx به صورت JSON و ستون tags به صورت
+فهرست جداشده با کاما نوشته می‌شوند؛ در JSONL می‌توانند مستقیماً شیء و آرایه باشند.
+خروجی export همین ساختار را دارد و دوباره قابل ورود است.
+
+ردیف‌هایی که sku آن‌ها در کاتالوگ فروشنده وجود دارد به صورت partial اعتبارسنجی
+می‌شوند تا فایل‌های فقط قیمت یا فقط موجودی قابل ورود باشند. فایل‌های بزرگ‌تر از
+CATALOG_SYNC_IMPORT_MAX_SIZE در فضای ذخیره‌سازی نوشته و در Celery وارد می‌شوند و
+گزارش نتیجه به صورت اعلان برای فروشنده ثبت می‌شود.
+"""
+import csv
+import io
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from apps.categories.counts import apply_count_deltas, state_deltas
+from apps.categories.models import Category, CategoryAttribute
+from .cache import bump_detail_version
+from .facets import schedule_facet_update
+from .inventory import StockMovement, apply_movements
+from .models import (
+    Product, ProductAttribute, ProductVariant, ProductTag, ProductTagRelation
+)
+from .search import index_products
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+STOCK_CHANGE_REASON = 'ورود کاتالوگ'
+
+FORMATS = ('csv', 'jsonl', 'xlsx')
+
+# فایل‌های بزرگ‌تر از این اندازه (بایت) در Celery وارد می‌شوند
+SYNC_IMPORT_MAX_SIZE = getattr(settings, 'CATALOG_SYNC_IMPORT_MAX_SIZE', 2 * 1024 * 1024)
+UPLOAD_PATH = 'catalog_imports'
+
+# فیلدهای ساده محصول که از هر ردیف خوانده و در به‌روزرسانی نوشته می‌شوند؛ در به‌روزرسانی
+# فقط ستون‌های موجود در ردیف تغییر می‌کنند و موجودی از طریق دفتر موجودی اعمال می‌شود
+PRODUCT_FIELDS = (
+    'name', 'description', 'short_description', 'price', 'discount_price', 'stock',
+    'weight', 'width', 'height', 'length', 'meta_title', 'meta_description', 'meta_keywords',
+)
+EXPORT_COLUMNS = ('sku', 'category', *PRODUCT_FIELDS, 'is_active', 'attributes', 'tags', 'variants')
+VARIANT_FIELDS = ('name', 'sku', 'price_adjustment', 'is_default')
+# ستون‌هایی که فقط برای ساخت محصول جدید الزامی‌اند
+REQUIRED_FIELDS = ('category', 'name', 'description', 'price')
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogError(Exception):
+    """خطای ساختاری فایل (فرمت نامعتبر، هدر ناقص و ...)"""
+
+
+class JSONValueField(serializers.Field):
+    """مقدار JSON که در CSV و xlsx به صورت رشته می‌آید"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if not data.strip():
+                return None
+            try:
+                return json.loads(data)
+            except ValueError:
+                raise serializers.ValidationError('JSON نامعتبر است')
+        return data
+
+
+DISCOUNT_PRICE_ERROR = 'قیمت تخفیف باید کمتر از قیمت باشد'
+
+
+class CatalogVariantSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    sku = serializers.CharField(max_length=50, required=False, allow_null=True, allow_blank=True)
+    price_adjustment = serializers.DecimalField(max_digits=15, decimal_places=0, required=False)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    is_default = serializers.BooleanField(required=False)
+
+
+class CatalogRowSerializer(serializers.Serializer):
+    """
+    اعتبارسنجی یک ردیف کاتالوگ بدون کوئری پایگاه داده
+
+    دسته‌بندی‌ها، ویژگی‌ها و دسته محصولات موجود فروشنده پیش‌تر در context بارگذاری
+    شده‌اند. ردیف محصول موجود با partial=True اعتبارسنجی می‌شود.
+    """
+    sku = serializers.CharField(max_length=50)
+    category = serializers.CharField()
+    name = serializers.CharField(max_length=200)
+    description = serializers.CharField()
+    short_description = serializers.CharField(max_length=500, required=False, allow_blank=True, allow_null=True)
+    price = serializers.DecimalField(max_digits=15, decimal_places=0, min_value=0)
+    discount_price = serializers.DecimalField(max_digits=15, decimal_places=0, min_value=0,
+                                              required=False, allow_null=True)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    weight = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    width = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    height = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    length = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    meta_title = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    meta_description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    meta_keywords = serializers.CharField(max_length=200, required=False, allow_blank=True, allow_null=True)
+    is_active = serializers.BooleanField(required=False)
+    attributes = JSONValueField(required=False, allow_null=True)
+    tags = JSONValueField(required=False, allow_null=True)
+    variants = JSONValueField(required=False, allow_null=True)
+
+    def to_internal_value(self, data):
+        # ستون‌های خالی CSV/xlsx به معنی نبود مقدار هستند
+        data = {key: value for key, value in data.items() if value not in ('', None)}
+        if isinstance(data.get('tags'), str) and not data['tags'].lstrip().startswith('['):
+            data['tags'] = [tag.strip() for tag in data['tags'].split(',') if tag.strip()]
+        return super().to_internal_value(data)
+
+    def validate_category(self, value):
+        category_id = self.context['categories'].get(value)
+        if category_id is None:
+            raise serializers.ValidationError('دسته‌بندی یافت نشد')
+        return category_id
+
+    def validate_tags(self, value):
+        if value is None:
+            return None
+        if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+            raise serializers.ValidationError('برچسب‌ها باید فهرستی از رشته‌ها باشند')
+        return list(dict.fromkeys(tag.strip()[:100] for tag in value if tag.strip()))
+
+    def validate_variants(self, value):
+        if value is None:
+            return None
+        if not isinstance(value, list):
+            raise serializers.ValidationError('تنوع‌ها باید آرایه باشند')
+        variants = CatalogVariantSerializer(data=value, many=True)
+        variants.is_valid(raise_exception=True)
+        return variants.validated_data
+
+    def validate(self, data):
+        # در ردیف‌های partial قیمت تخفیف هنگام اعمال با قیمت فعلی محصول مقایسه می‌شود
+        if data.get('discount_price') and 'price' in data and data['discount_price'] >= data['price']:
+            raise serializers.ValidationError({'discount_price': DISCOUNT_PRICE_ERROR})
+
+        attributes = data.get('attributes')
+        if attributes is not None:
+            if not isinstance(attributes, dict):
+                raise serializers.ValidationError({'attributes': 'ویژگی‌ها باید شیء JSON باشند'})
+            category_id = data.get('category', self.context['existing'].get(data['sku']))
+            category_attributes = self.context['attributes'].get(category_id, {})
+            resolved, unknown = {}, []
+            for name, value in attributes.items():
+                attribute_id = category_attributes.get(name)
+                if attribute_id is None:
+                    unknown.append(name)
+                else:
+                    resolved[attribute_id] = str(value)[:255]
+            if unknown:
+                raise serializers.ValidationError({
+                    'attributes': f"ویژگی‌های نامعتبر برای این دسته‌بندی: {', '.join(unknown)}"
+                })
+            data['attributes'] = resolved
+        return data
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in FORMATS:
+        raise CatalogError(f"فرمت فایل پشتیبانی نمی‌شود؛ فرمت‌های مجاز: {', '.join(FORMATS)}")
+    return extension
+
+
+def iter_rows(fileobj, file_format):
+    """خواندن جریانی ردیف‌های فایل به صورت (شماره ردیف، دیکشنری)"""
+    if file_format == 'csv':
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, row
+    elif file_format == 'jsonl':
+        for number, line in enumerate(fileobj, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None
+                continue
+            yield number, row if isinstance(row, dict) else None
+    elif file_format == 'xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise CatalogError('برای ورود فایل xlsx نصب openpyxl لازم است')
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+            for number, values in enumerate(rows, start=2):
+                if not any(value is not None for value in values):
+                    continue
+                yield number, {
+                    column: value for column, value in zip(header, values) if column
+                }
+        finally:
+            workbook.close()
+    else:
+        raise CatalogError('فرمت فایل نامعتبر است')
+
+
+def _validation_context(seller):
+    categories = {}
+    for category_id, slug in Category.objects.values_list('id', 'slug'):
+        categories[slug] = category_id
+        categories[str(category_id)] = category_id
+    attributes = {}
+    for attribute_id, category_id, name, slug in CategoryAttribute.objects.values_list(
+        'id', 'category_id', 'name', 'slug'
+    ):
+        by_name = attributes.setdefault(category_id, {})
+        by_name[name] = attribute_id
+        by_name[slug] = attribute_id
+    existing = dict(Product.objects.filter(seller=seller).values_list('sku', 'category_id'))
+    return {'categories': categories, 'attributes': attributes, 'existing': existing}
+
+
+def _new_slug(name):
+    # پسوند تصادفی یکتایی slug را بدون کوئری جداگانه برای هر محصول تضمین می‌کند
+    base = slugify(name, allow_unicode=True)[:180] or 'product'
+    return f'{base}-{uuid.uuid4().hex[:8]}'
+
+
+def _get_or_create_tags(names):
+    tags = dict(ProductTag.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [
+        ProductTag(name=name, slug=_new_slug(name)[:100]) for name in names if name not in tags
+    ]
+    if missing:
+        ProductTag.objects.bulk_create(missing, ignore_conflicts=True)
+        tags.update(ProductTag.objects.filter(name__in=[tag.name for tag in missing]).values_list('name', 'id'))
+    return tags
+
+
+def _reserved_stock_errors(product, data, variants):
+    """خطای ردیفی که موجودی جدید محصول یا یکی از تنوع‌هایش را کمتر از مقدار رزروشده می‌کند"""
+    if data.get('stock', product.stock) < product.reserved_stock:
+        return {'stock': [f'موجودی نمی‌تواند کمتر از مقدار رزروشده ({product.reserved_stock}) باشد']}
+    for variant_data in data.get('variants') or ():
+        variant = variants.get((product.pk, variant_data.get('sku') or variant_data['name']))
+        if variant is not None and variant_data.get('stock', variant.stock) < variant.reserved_stock:
+            return {'variants': [
+                f"موجودی تنوع {variant.name} نمی‌تواند کمتر از مقدار رزروشده ({variant.reserved_stock}) باشد"
+            ]}
+    return None
+
+
+def _discount_price_errors(product, data):
+    """خطای ردیفی که قیمت تخفیف محصول موجود را بیشتر یا برابر قیمت آن می‌کند"""
+    price = data.get('price', product.price)
+    discount_price = data.get('discount_price', product.discount_price)
+    if discount_price and discount_price >= price:
+        return {'discount_price': [DISCOUNT_PRICE_ERROR]}
+    return None
+
+
+class CatalogImporter:
+    """
+    ورود گروهی کاتالوگ یک فروشنده
+
+    هر دسته در یک تراکنش اعمال می‌شود؛ اگر اعمال دسته‌ای شکست بخورد خطا برای تمام
+    ردیف‌های آن دسته گزارش می‌شود و دسته‌های دیگر ادامه می‌یابند.
+    """
+
+    def __init__(self, seller, chunk_size=CHUNK_SIZE):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self._seen_skus = set()
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def run(self, fileobj, file_format):
+        context = _validation_context(self.seller)
+        chunk = []
+        for row_number, row in iter_rows(fileobj, file_format):
+            if row is None:
+                self.add_error(row_number, {'non_field_errors': ['ردیف قابل خواندن نیست']})
+                continue
+            serializer = CatalogRowSerializer(
+                data=row, context=context, partial=str(row.get('sku') or '').strip() in context['existing']
+            )
+            if not serializer.is_valid():
+                self.add_error(row_number, serializer.errors)
+                continue
+            data = serializer.validated_data
+            if data['sku'] in self._seen_skus:
+                self.add_error(row_number, {'sku': ['کد محصول در فایل تکراری است']})
+                continue
+            self._seen_skus.add(data['sku'])
+            chunk.append((row_number, data))
+            if len(chunk) >= self.chunk_size:
+                self._apply_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._apply_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def _apply_chunk(self, chunk):
+        try:
+            with transaction.atomic():
+                created, updated, rejected = self._upsert(chunk)
+        except DatabaseError:
+            logger.exception('Importing catalog chunk for seller %s failed', self.seller.pk)
+            for row_number, _ in chunk:
+                self.add_error(row_number, {'non_field_errors': ['خطا در ذخیره ردیف؛ دوباره تلاش کنید']})
+            return
+        for row_number, errors in rejected:
+            self.add_error(row_number, errors)
+        self.created += created
+        self.updated += updated
+
+    def _upsert(self, chunk):
+        # ردیف‌های موجود قفل می‌شوند تا تفاضل موجودی ثبت‌شده در دفتر موجودی دقیق باشد
+        existing = {
+            product.sku: product for product in Product.objects.select_for_update().filter(
+                seller=self.seller, sku__in=[data['sku'] for _, data in chunk]
+            )
+        }
+        variants = {}
+        for variant in ProductVariant.objects.select_for_update().filter(product__in=list(existing.values())):
+            variants[(variant.product_id, variant.sku or variant.name)] = variant
+
+        new_products, changed_products, products, rejected = [], [], [], []
+        previous_categories, previous_states = set(), {}
+        movements = []
+        for row_number, data in chunk:
+            product = existing.get(data['sku'])
+            if product is not None:
+                errors = _reserved_stock_errors(product, data, variants) or _discount_price_errors(product, data)
+                if errors:
+                    rejected.append((row_number, errors))
+                    continue
+            elif any(field not in data for field in REQUIRED_FIELDS):
+                # محصول پس از اعتبارسنجی partial حذف شده است
+                rejected.append((row_number, {
+                    field: [str(serializers.Field.default_error_messages['required'])]
+                    for field in REQUIRED_FIELDS if field not in data
+                }))
+                continue
+            if product is None:
+                product = Product(
+                    seller=self.seller, sku=data['sku'], slug=_new_slug(data['name']),
+                    is_approved=False, is_active=data.get('is_active', True),
+                )
+                for field in PRODUCT_FIELDS:
+                    if field != 'stock':
+                        setattr(product, field, data.get(field, Product._meta.get_field(field).get_default()))
+                new_products.append(product)
+            else:
+                changed_products.append(product)
+                previous_categories.add(product.category_id)
+                previous_states[product.pk] = product.loaded_state
+                for field in (*PRODUCT_FIELDS, 'is_active'):
+                    if field in data and field != 'stock':
+                        setattr(product, field, data[field])
+            product.category_id = data.get('category', product.category_id)
+            if 'stock' in data and data['stock'] != product.stock:
+                movements.append(StockMovement(
+                    product.pk, delta=data['stock'] - product.stock, reason=STOCK_CHANGE_REASON
+                ))
+            products.append((product, data))
+
+        if new_products:
+            Product.objects.bulk_create(new_products, batch_size=self.chunk_size)
+        if changed_products:
+            fields = ['category', 'is_active', *(field for field in PRODUCT_FIELDS if field != 'stock')]
+            Product.objects.bulk_update(changed_products, fields, batch_size=self.chunk_size)
+
+        self._upsert_attributes(products)
+        movements += self._upsert_variants(products, variants)
+        self._replace_tags(products)
+        apply_movements(movements)
+
+        # bulk_update سیگنال ندارد؛ ایندکس جستجو، ایندکس فست و کش جزئیات مستقیماً به‌روز می‌شوند
+        index_products([product for product, _ in products])
+        schedule_facet_update([product.pk for product, _ in products], previous_categories)
+        apply_count_deltas(state_deltas(
+            previous_states, {product.pk: product.visibility_state() for product, _ in products}
+        ))
+        bump_detail_version(*[product.pk for product in changed_products])
+        return len(new_products), len(changed_products), rejected
+
+    def _upsert_attributes(self, products):
+        rows = [(product, data['attributes']) for product, data in products if data.get('attributes')]
+        if not rows:
+            return
+        existing = {
+            (attribute.product_id, attribute.attribute_id): attribute
+            for attribute in ProductAttribute.objects.filter(product__in=[product for product, _ in rows])
+        }
+        to_create, to_update = [], []
+        for product, attributes in rows:
+            for attribute_id, value in attributes.items():
+                attribute = existing.get((product.pk, attribute_id))
+                if attribute is None:
+                    to_create.append(ProductAttribute(product=product, attribute_id=attribute_id, value=value))
+                elif attribute.value != value:
+                    attribute.value = value
+                    to_update.append(attribute)
+        ProductAttribute.objects.bulk_create(to_create, batch_size=self.chunk_size)
+        ProductAttribute.objects.bulk_update(to_update, ['value'], batch_size=self.chunk_size)
+
+    def _upsert_variants(self, products, existing):
+        """درج و به‌روزرسانی تنوع‌ها؛ خروجی: حرکت‌های موجودی تنوع‌ها"""
+        rows = [(product, data['variants']) for product, data in products if data.get('variants')]
+        to_create, to_update, movements = [], [], []
+        for product, variants in rows:
+            for data in variants:
+                variant = existing.get((product.pk, data.get('sku') or data['name']))
+                if variant is None:
+                    variant = ProductVariant(product=product)
+                    to_create.append(variant)
+                else:
+                    to_update.append(variant)
+                for field in VARIANT_FIELDS:
+                    if field in data:
+                        setattr(variant, field, data[field])
+                variant.sku = variant.sku or None
+                if 'stock' in data and data['stock'] != variant.stock:
+                    movements.append(StockMovement(
+                        product.pk, variant.pk, delta=data['stock'] - variant.stock, reason=STOCK_CHANGE_REASON
+                    ))
+        ProductVariant.objects.bulk_create(to_create, batch_size=self.chunk_size)
+        ProductVariant.objects.bulk_update(to_update, VARIANT_FIELDS, batch_size=self.chunk_size)
+        return movements
+
+    def _replace_tags(self, products):
+        rows = [(product, data['tags']) for product, data in products if data.get('tags') is not None]
+        if not rows:
+            return
+        tags = _get_or_create_tags({name for _, names in rows for name in names})
+        ProductTagRelation.objects.filter(product__in=[product for product, _ in rows]).delete()
+        ProductTagRelation.objects.bulk_create([
+            ProductTagRelation(product=product, tag_id=tags[name])
+            for product, names in rows for name in names if name in tags
+        ], batch_size=self.chunk_size)
+
+
+def import_catalog(seller, fileobj, file_format, chunk_size=CHUNK_SIZE):
+    return CatalogImporter(seller, chunk_size=chunk_size).run(fileobj, file_format)
+
+
+def queue_catalog_import(seller, upload, file_format):
+    """
+    ذخیره فایل کاتالوگ و سپردن ورود آن به Celery
+
+    خروجی: True در صورت صف شدن؛ اگر broker در دسترس نباشد فایل حذف و False برگردانده
+    می‌شود تا ورود در همان درخواست انجام شود.
+    """
+    from .tasks import import_catalog_file
+
+    path = default_storage.save(f'{UPLOAD_PATH}/{uuid.uuid4().hex}.{file_format}', upload)
+    try:
+        import_catalog_file.delay(str(seller.pk), path, file_format)
+    except Exception:
+        logger.warning('Queueing catalog import for seller %s failed', seller.pk, exc_info=True)
+        default_storage.delete(path)
+        return False
+    return True
+
+
+def import_stored_catalog(seller_id, path, file_format):
+    """ورود فایل ذخیره‌شده توسط queue_catalog_import و ثبت گزارش آن در اعلان‌های فروشنده"""
+    from apps.notifications.models import Notification
+    from apps.sellers.models import Seller
+
+    seller = Seller.objects.select_related('user').get(pk=seller_id)
+    try:
+        with default_storage.open(path, 'rb') as fileobj:
+            report = import_catalog(seller, fileobj, file_format)
+    except CatalogError as exc:
+        report = {'error': str(exc)}
+    finally:
+        default_storage.delete(path)
+    Notification.objects.create(
+        user=seller.user, type='product', title='نتیجه ورود کاتالوگ',
+        message=report.get('error') or (
+            f"{report['created']} محصول ایجاد، {report['updated']} محصول به‌روزرسانی و "
+            f"{report['error_count']} ردیف رد شد."
+        ),
+        data=report,
+    )
+    return report
+
+
+class _Echo:
+    """شیء شبه‌فایل برای csv.writer که هر خط را برمی‌گرداند"""
+
+    def write(self, value):
+        return value
+
+
+def _export_records(queryset, chunk_size):
+    queryset = queryset.select_related('category').prefetch_related(
+        'attributes__attribute', 'variants', 'tags__tag'
+    ).order_by('pk')
+    for product in queryset.iterator(chunk_size=chunk_size):
+        record = {
+            'sku': product.sku,
+            'category': product.category.slug,
+            'is_active': product.is_active,
+            'attributes': {
+                attribute.attribute.name: attribute.value for attribute in product.attributes.all()
+            },
+            'tags': [relation.tag.name for relation in product.tags.all()],
+            'variants': [
+                {
+                    'name': variant.name, 'sku': variant.sku,
+                    'price_adjustment': variant.price_adjustment,
+                    'stock': variant.stock, 'is_default': variant.is_default,
+                }
+                for variant in product.variants.all()
+            ],
+        }
+        for field in PRODUCT_FIELDS:
+            record[field] = getattr(product, field)
+        yield record
+
+
+def _json_default(value):
+    return str(value)
+
+
+def export_catalog(queryset, file_format='csv', chunk_size=CHUNK_SIZE):
+    """
+    تولید جریانی خطوط خروجی کاتالوگ؛ محصولات به صورت دسته‌ای با iterator خوانده
+    می‌شوند و کل کاتالوگ هیچ‌گاه در حافظه نیست
+    """
+    records = _export_records(queryset, chunk_size)
+    if file_format == 'jsonl':
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False, default=_json_default) + '\n'
+        return
+    if file_format != 'csv':
+        raise CatalogError('خروجی فقط در قالب csv یا jsonl ممکن است')
+
+    writer = csv.writer(_Echo())
+    # BOM برای نمایش درست متن فارسی در Excel
+    yield '\ufeff' + writer.writerow(EXPORT_COLUMNS)
+    for record in records:
+        record['attributes'] = json.dumps(record['attributes'], ensure_ascii=False)
+        record['tags'] = ','.join(record['tags'])
+        record['variants'] = json.dumps(record['variants'], ensure_ascii=False, default=_json_default)
+        yield writer.writerow([
+            '' if record[column] is None else record[column] for column in EXPORT_COLUMNS
+        ])
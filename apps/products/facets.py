@@ -0,0 +1,463 @@
+"""
+ایندکس فست (facet) ویژگی‌های قابل فیلتر محصولات
+
+برای هر دسته‌بندی یک ایندکس در کش نگهداری می‌شود که به هر محصول دسته یک شماره بیت
+ثابت می‌دهد و برای هر (ویژگی، مقدار) از ویژگی‌های is_filter یک bitmap (عدد صحیح
+پایتون) از محصولات دارای آن مقدار نگه می‌دارد. فیلتر چندویژگی‌ای و شمارش فست‌ها با
+AND/OR بیتی و bit_count در حافظه انجام می‌شود و نیازی به JOIN به ازای هر ویژگی یا
+GROUP BY روی محصولات دسته نیست.
+
+ایندکس در اولین درخواست با دو کوئری ساخته می‌شود و پس از آن با تغییر محصولات و
+ویژگی‌هایشان (سیگنال‌ها، به‌روزرسانی‌های گروهی و ورود کاتالوگ) پس از commit به صورت
+افزایشی به‌روز می‌شود. اگر به‌روزرسانی همزمان دیگری در جریان باشد، ایندکس حذف می‌شود
+تا در درخواست بعدی از نو ساخته شود.
+
+در کش، bitmap هر (ویژگی، مقدار) و فهرست شماره بیت محصولات کلیدهای جداگانه دارند و
+کلید اصلی دسته فقط نسخه، bitmapهای all/visible و نام مقادیر را نگه می‌دارد؛ بنابراین
+هر به‌روزرسانی فقط bitmapهای تغییرکرده را بازنویسی می‌کند. بیت محصولاتی که از دسته
+خارج یا حذف شده‌اند تا ساخت دوباره ایندکس در فهرست می‌مانند؛ وقتی بیش از نیمی از
+بیت‌ها بلااستفاده باشند، ایندکس با نسخه جدید و شماره‌گذاری فشرده از نو ساخته می‌شود.
+اگر یکی از کلیدها زودتر منقضی شود، ایندکس در خواندن بعدی از نو ساخته می‌شود.
+
+ایندکس فقط محصولاتی را در بر می‌گیرد که مستقیماً در همان دسته‌بندی (پارامتر category)
+هستند و زیردسته‌ها را شامل نمی‌شود؛ فیلتر ویژگی همراه با category_slug (کل زیردرخت)
+با زیرکوئری SQL انجام می‌شود و شمارش فست ندارد.
+
+اگر تعداد محصولات منطبق از FACET_PK_FILTER_LIMIT بیشتر باشد، فهرست شناسه‌ها در کوئری
+قرار نمی‌گیرد و فیلتر با زیرکوئری روی مقادیر ویژگی‌ها در SQL انجام می‌شود.
+"""
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from rest_framework.filters import BaseFilterBackend
+
+from apps.common.utils import CacheManager
+from .search import normalize_text
+
+FACET_INDEX_TIMEOUT = getattr(settings, 'PRODUCT_FACET_INDEX_TTL', 60 * 60)
+FACET_LOCK_TIMEOUT = 30
+FACET_PK_FILTER_LIMIT = getattr(settings, 'PRODUCT_FACET_PK_FILTER_LIMIT', 500)
+# حداقل تعداد بیت‌های بلااستفاده پیش از ساخت دوباره و فشرده ایندکس
+FACET_COMPACT_MIN_DEAD = 256
+
+# پارامترهای فیلتر ویژگی به شکل attr_<اسلاگ ویژگی>=مقدار۱,مقدار۲
+ATTRIBUTE_PARAM_PREFIX = 'attr_'
+
+logger = logging.getLogger(__name__)
+
+
+def _index_key(category_id):
+    return CacheManager.get_cache_key('product_facets', category_id)
+
+
+def _products_key(category_id, generation):
+    return CacheManager.get_cache_key('product_facet_products', category_id, generation)
+
+
+def _mask_key(category_id, generation, slug, key):
+    digest = hashlib.md5(f'{slug}|{key}'.encode()).hexdigest()
+    return CacheManager.get_cache_key('product_facet_mask', category_id, generation, digest)
+
+
+def _lock_key(category_id):
+    return CacheManager.get_cache_key('product_facets_lock', category_id)
+
+
+def _value_key(value):
+    return normalize_text(value).strip()
+
+
+class FacetIndex:
+    """
+    ایندکس فست یک دسته‌بندی
+
+    products فهرست شناسه محصولات به ترتیب شماره بیت است؛ all و visible بیت محصولات
+    فعلی دسته و محصولات فعال و تاییدشده آن هستند و attributes برای هر اسلاگ ویژگی
+    نام، ترتیب و bitmap هر مقدار را نگه می‌دارد.
+    """
+
+    def __init__(self, products=None, all_mask=0, visible_mask=0, attributes=None):
+        self.products = products or []
+        self.positions = {product_id: bit for bit, product_id in enumerate(self.products)}
+        self.all = all_mask
+        self.visible = visible_mask
+        self.attributes = attributes or {}
+
+    @classmethod
+    def build(cls, category_id):
+        from .models import Product, ProductAttribute
+
+        index = cls()
+        for product_id, is_active, is_approved in Product.objects.filter(
+            category_id=category_id
+        ).values_list('pk', 'is_active', 'is_approved').order_by('pk'):
+            index.set_product(str(product_id), is_active and is_approved)
+        for product_id, slug, name, order, value in ProductAttribute.objects.filter(
+            product__category_id=category_id, attribute__is_filter=True
+        ).values_list('product_id', 'attribute__slug', 'attribute__name', 'attribute__order', 'value'):
+            index.add_value(str(product_id), slug, name, order, value)
+        return index
+
+    def masks(self):
+        """{(اسلاگ ویژگی، کلید مقدار): bitmap}"""
+        return {
+            (slug, key): mask
+            for slug, attribute in self.attributes.items()
+            for key, (_, mask) in attribute['values'].items()
+        }
+
+    @property
+    def dead_bits(self):
+        """تعداد شماره بیت‌های محصولاتی که دیگر در دسته نیستند"""
+        return len(self.products) - self.all.bit_count()
+
+    def _bit(self, product_id):
+        bit = self.positions.get(product_id)
+        if bit is None:
+            bit = self.positions[product_id] = len(self.products)
+            self.products.append(product_id)
+        return 1 << bit
+
+    def set_product(self, product_id, visible):
+        bit = self._bit(product_id)
+        self.all |= bit
+        self.visible = self.visible | bit if visible else self.visible & ~bit
+
+    def add_value(self, product_id, slug, name, order, value):
+        key = _value_key(value)
+        if not key:
+            return
+        attribute = self.attributes.setdefault(slug, {'name': name, 'order': order, 'values': {}})
+        label, mask = attribute['values'].get(key, (value, 0))
+        attribute['values'][key] = (label, mask | self._bit(product_id))
+
+    def remove_product(self, product_id):
+        bit = self.positions.get(product_id)
+        if bit is None:
+            return
+        clear = ~(1 << bit)
+        self.all &= clear
+        self.visible &= clear
+        for slug, attribute in list(self.attributes.items()):
+            values = attribute['values']
+            for key, (label, mask) in list(values.items()):
+                mask &= clear
+                if mask:
+                    values[key] = (label, mask)
+                else:
+                    del values[key]
+            if not values:
+                del self.attributes[slug]
+
+    def mask_for(self, product_ids):
+        mask = 0
+        for product_id in product_ids:
+            bit = self.positions.get(str(product_id))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask & self.all
+
+    def product_ids(self, mask):
+        product_ids = []
+        while mask:
+            lowest = mask & -mask
+            product_ids.append(self.products[lowest.bit_length() - 1])
+            mask ^= lowest
+        return product_ids
+
+    def _selection_mask(self, slug, values):
+        # مقادیر یک ویژگی با OR و ویژگی‌های مختلف با AND ترکیب می‌شوند
+        attribute_values = self.attributes.get(slug, {}).get('values', {})
+        mask = 0
+        for value in values:
+            mask |= attribute_values.get(_value_key(value), (None, 0))[1]
+        return mask
+
+    def selected_keys(self, slug, values):
+        """کلیدهای نرمال‌شده مقادیر انتخاب‌شده یک ویژگی که در ایندکس وجود دارند"""
+        attribute_values = self.attributes.get(slug, {}).get('values', {})
+        return {_value_key(value) for value in values} & set(attribute_values)
+
+    def match(self, selected, base=None):
+        mask = self.all if base is None else base
+        for slug, values in selected.items():
+            mask &= self._selection_mask(slug, values)
+        return mask
+
+    def counts(self, base, selected):
+        """
+        تعداد محصولات هر مقدار هر ویژگی
+
+        شمارش هر ویژگی با فیلتر سایر ویژگی‌های انتخاب‌شده انجام می‌شود تا مقادیر
+        دیگر همان ویژگی نیز با تعداد درست قابل انتخاب بمانند.
+        """
+        selection_masks = {slug: self._selection_mask(slug, values) for slug, values in selected.items()}
+        facets = []
+        for slug, attribute in sorted(self.attributes.items(), key=lambda item: (item[1]['order'], item[1]['name'])):
+            mask = base
+            for other, selection_mask in selection_masks.items():
+                if other != slug:
+                    mask &= selection_mask
+            chosen = {_value_key(value) for value in selected.get(slug, ())}
+            values = [
+                {'value': label, 'count': (mask & value_mask).bit_count(), 'selected': key in chosen}
+                for key, (label, value_mask) in attribute['values'].items()
+            ]
+            values = [value for value in values if value['count'] or value['selected']]
+            if values:
+                values.sort(key=lambda value: (-value['count'], value['value']))
+                facets.append({'attribute': slug, 'name': attribute['name'], 'values': values})
+        return facets
+
+
+def _load(category_id):
+    """
+    (ایندکس، نسخه) ذخیره‌شده در کش
+
+    اگر ایندکس ساخته نشده باشد نسخه None است و اگر یکی از کلیدهای آن منقضی شده باشد
+    ایندکس None است.
+    """
+    meta = cache.get(_index_key(category_id))
+    if meta is None:
+        return None, None
+    generation = meta['generation']
+    keys = {
+        (slug, key): _mask_key(category_id, generation, slug, key)
+        for slug, attribute in meta['attributes'].items() for key in attribute['values']
+    }
+    products_key = _products_key(category_id, generation)
+    stored = cache.get_many([products_key, *keys.values()])
+    # فهرست محصولات فقط بزرگ می‌شود و ممکن است جلوتر از کلید اصلی نوشته شده باشد
+    if len(stored) != len(keys) + 1 or len(stored[products_key]) < meta['size']:
+        return None, generation
+    attributes = {
+        slug: {
+            'name': attribute['name'],
+            'order': attribute['order'],
+            'values': {key: (label, stored[keys[slug, key]]) for key, label in attribute['values'].items()},
+        }
+        for slug, attribute in meta['attributes'].items()
+    }
+    return FacetIndex(stored[products_key], meta['all'], meta['visible'], attributes), generation
+
+
+def _store(category_id, index, generation=None, previous_masks=None, previous_size=None):
+    """
+    ذخیره ایندکس در کش
+
+    بدون generation نسخه جدیدی با همه کلیدها نوشته می‌شود؛ در غیر این صورت فقط
+    bitmapهایی که با previous_masks فرق دارند و در صورت تغییر previous_size فهرست
+    محصولات بازنویسی می‌شوند.
+    """
+    new = generation is None
+    generation = generation or uuid.uuid4().hex
+    masks = index.masks()
+    values = {
+        _mask_key(category_id, generation, slug, key): mask
+        for (slug, key), mask in masks.items()
+        if new or previous_masks.get((slug, key)) != mask
+    }
+    if new or len(index.products) != previous_size:
+        values[_products_key(category_id, generation)] = index.products
+    cache.set_many(values, FACET_INDEX_TIMEOUT)
+    if not new:
+        cache.delete_many([
+            _mask_key(category_id, generation, slug, key) for slug, key in set(previous_masks) - set(masks)
+        ])
+    # کلید اصلی آخر نوشته می‌شود تا خواننده‌ها نسخه جدید را پس از نوشته شدن bitmapها ببینند
+    cache.set(_index_key(category_id), {
+        'generation': generation,
+        'size': len(index.products),
+        'all': index.all,
+        'visible': index.visible,
+        'attributes': {
+            slug: {
+                'name': attribute['name'],
+                'order': attribute['order'],
+                'values': {key: label for key, (label, _) in attribute['values'].items()},
+            }
+            for slug, attribute in index.attributes.items()
+        },
+    }, FACET_INDEX_TIMEOUT)
+
+
+def get_facet_index(category_id):
+    """ایندکس فست دسته‌بندی از کش یا در صورت نبود، ساخت و ذخیره آن"""
+    try:
+        index, _ = _load(category_id)
+    except Exception:
+        logger.warning('Reading product facet index failed', exc_info=True)
+        index = None
+    if index is not None:
+        return index
+
+    index = FacetIndex.build(category_id)
+    try:
+        _store(category_id, index)
+    except Exception:
+        logger.warning('Writing product facet index failed', exc_info=True)
+    return index
+
+
+def invalidate_facet_index(*category_ids):
+    keys = [_index_key(category_id) for category_id in set(category_ids) if category_id is not None]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception:
+        logger.warning('Invalidating product facet index failed', exc_info=True)
+
+
+def update_product_facets(product_ids, category_ids=()):
+    """
+    به‌روزرسانی افزایشی ایندکس فست برای محصولات تغییرکرده
+
+    ایندکس دسته فعلی محصولات و دسته‌های category_ids (دسته‌های قبلی) به‌روز می‌شوند؛
+    ایندکسی که هنوز در کش ساخته نشده دست نمی‌خورد.
+    """
+    from .models import Product, ProductAttribute
+
+    product_ids = {str(product_id) for product_id in product_ids}
+    if not product_ids:
+        return
+    products = {
+        str(product_id): (category_id, is_active and is_approved)
+        for product_id, category_id, is_active, is_approved in Product.objects.filter(
+            pk__in=product_ids
+        ).values_list('pk', 'category_id', 'is_active', 'is_approved')
+    }
+    values = defaultdict(list)
+    for row in ProductAttribute.objects.filter(
+        product_id__in=products, attribute__is_filter=True
+    ).values_list('product_id', 'attribute__slug', 'attribute__name', 'attribute__order', 'value'):
+        values[str(row[0])].append(row[1:])
+
+    categories = {category_id for category_id, _ in products.values()} | set(category_ids)
+    for category_id in categories - {None}:
+        key, lock = _index_key(category_id), _lock_key(category_id)
+        try:
+            if not cache.add(lock, 1, FACET_LOCK_TIMEOUT):
+                cache.delete(key)
+                continue
+            try:
+                index, generation = _load(category_id)
+                if generation is None:
+                    continue
+                if index is None:
+                    cache.delete(key)
+                    continue
+                previous_masks, previous_size = index.masks(), len(index.products)
+                for product_id in product_ids:
+                    index.remove_product(product_id)
+                    product = products.get(product_id)
+                    if product is None or product[0] != category_id:
+                        continue
+                    index.set_product(product_id, product[1])
+                    for slug, name, order, value in values[product_id]:
+                        index.add_value(product_id, slug, name, order, value)
+                if index.dead_bits > max(FACET_COMPACT_MIN_DEAD, len(index.products) // 2):
+                    _store(category_id, FacetIndex.build(category_id))
+                else:
+                    _store(category_id, index, generation, previous_masks, previous_size)
+            finally:
+                cache.delete(lock)
+        except Exception:
+            logger.warning('Updating product facet index failed', exc_info=True)
+
+
+def schedule_facet_update(product_ids, category_ids=()):
+    """
+    به‌روزرسانی ایندکس پس از commit تراکنش جاری
+
+    شناسه‌ها فقط همراه callback ثبت‌شده در on_commit نگه داشته می‌شوند تا با برگشت
+    تراکنش (یا savepoint) همراه آن دور ریخته شوند.
+    """
+    product_ids = set(product_ids)
+    category_ids = {category_id for category_id in category_ids if category_id is not None}
+    transaction.on_commit(lambda: update_product_facets(product_ids, category_ids))
+
+
+def get_selected_attributes(request):
+    """{اسلاگ ویژگی: [مقادیر]} از پارامترهای attr_<slug>"""
+    selected = {}
+    for param in request.query_params:
+        if not param.startswith(ATTRIBUTE_PARAM_PREFIX) or len(param) == len(ATTRIBUTE_PARAM_PREFIX):
+            continue
+        values = [
+            value.strip()
+            for raw in request.query_params.getlist(param)
+            for value in raw.split(',') if value.strip()
+        ]
+        if values:
+            selected[param[len(ATTRIBUTE_PARAM_PREFIX):]] = values
+    return selected
+
+
+class ProductFacetFilter(BaseFilterBackend):
+    """
+    فیلتر محصولات بر اساس مقادیر ویژگی‌ها
+
+    در صورت تعیین دسته‌بندی (فقط محصولات مستقیم همان دسته)، محصولات منطبق از ایندکس
+    فست و بدون JOIN پیدا می‌شوند؛ در غیر این صورت برای هر ویژگی یک فیلتر روی
+    ProductAttribute اعمال می‌شود.
+    """
+    category_param = 'category'
+
+    def filter_queryset(self, request, queryset, view):
+        selected = get_selected_attributes(request)
+        if not selected:
+            return queryset
+        category_id = request.query_params.get(self.category_param)
+        if category_id:
+            index = get_facet_index(category_id)
+            mask = index.match(selected)
+            if mask.bit_count() <= FACET_PK_FILTER_LIMIT:
+                return queryset.filter(pk__in=index.product_ids(mask))
+            return self.filter_by_values(queryset, category_id, {
+                slug: index.selected_keys(slug, values) for slug, values in selected.items()
+            })
+        for slug, values in selected.items():
+            queryset = queryset.filter(
+                attributes__attribute__slug=slug, attributes__attribute__is_filter=True,
+                attributes__value__in=values,
+            )
+        return queryset
+
+    def filter_by_values(self, queryset, category_id, selected):
+        """
+        فیلتر SQL برای مجموعه‌های بزرگ؛ selected کلیدهای نرمال‌شده هر ویژگی است
+
+        مقادیر خام ذخیره‌شده‌ای که به همان کلیدها نرمال می‌شوند با یک کوئری برای هر
+        ویژگی پیدا می‌شوند تا نتیجه با ایندکس یکسان باشد.
+        """
+        from .models import ProductAttribute
+
+        attributes = ProductAttribute.objects.filter(
+            product__category_id=category_id, attribute__is_filter=True
+        )
+        for slug, keys in selected.items():
+            raw_values = [
+                value for value in attributes.filter(attribute__slug=slug).values_list(
+                    'value', flat=True
+                ).distinct() if _value_key(value) in keys
+            ]
+            queryset = queryset.filter(Exists(ProductAttribute.objects.filter(
+                product=OuterRef('pk'), attribute__slug=slug, attribute__is_filter=True, value__in=raw_values
+            )))
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': f'{ATTRIBUTE_PARAM_PREFIX}{{slug}}',
+            'required': False,
+            'in': 'query',
+            'description': 'مقادیر ویژگی قابل فیلتر (جداشده با ویرگول)',
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,213 @@
+"""
+دفتر موجودی
+
+همه تغییرات موجودی (فروش، لغو سفارش، مرجوعی، ویرایش دستی، تنظیم موجودی انبار و
+انتقال بین انبارها) به شکل دسته‌ای از حرکت‌ها (StockMovement) ثبت می‌شوند. حرکت
+بدون انبار موجودی فروش محصول یا تنوع را تغییر می‌دهد و حرکت با انبار موجودی همان
+کالا در آن انبار را. حرکت‌های هر جدول جمع و با یک UPDATE شرطی اعمال می‌شوند:
+
+    UPDATE ... SET stock = stock + delta WHERE stock >= -delta
+
+اگر موجودی یکی از ردیف‌ها منفی شود هیچ حرکتی اعمال نمی‌شود و NegativeStock با
+کلیدهای کمبوددار برانگیخته می‌شود. برای هر حرکت یک ردیف ProductInventoryLog با
+موجودی قبل و بعد ثبت می‌شود؛ همه ردیف‌ها با یک bulk_create.
+"""
+from collections import Counter, defaultdict
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .cache import bump_detail_version
+from .models import Product, ProductInventoryLog, ProductVariant
+
+
+class StockMovement(NamedTuple):
+    product_id: object
+    variant_id: object = None
+    warehouse_id: object = None
+    delta: int = 0
+    reason: str = ''
+    reference: str = None
+
+    @property
+    def key(self):
+        return self.product_id, self.variant_id, self.warehouse_id
+
+
+class NegativeStock(Exception):
+    def __init__(self, keys):
+        self.keys = keys
+        super().__init__(', '.join(str(key) for key in keys))
+
+
+def _normalized(movements):
+    """تبدیل شناسه‌های ورودی (مثلاً رشته‌های درخواست) به نوع کلید اصلی هر مدل"""
+    from apps.shipping.models import Warehouse
+
+    product_pk, variant_pk, warehouse_pk = Product._meta.pk, ProductVariant._meta.pk, Warehouse._meta.pk
+    return [
+        movement._replace(
+            product_id=product_pk.to_python(movement.product_id),
+            variant_id=variant_pk.to_python(movement.variant_id) if movement.variant_id else None,
+            warehouse_id=warehouse_pk.to_python(movement.warehouse_id) if movement.warehouse_id else None,
+        ) for movement in movements
+    ]
+
+
+def per_row(values, output_field=None):
+    """مقدار هر ردیف بر اساس کلید اصلی برای UPDATE گروهی؛ ردیف‌های دیگر صفر"""
+    return Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+        default=Value(0),
+        output_field=output_field or IntegerField(),
+    )
+
+
+def _warehouse_rows(keys, create=False):
+    """{کلید: شناسه ردیف WarehouseProduct}؛ با create ردیف‌های نبود با موجودی صفر ساخته می‌شوند"""
+    from apps.shipping.models import WarehouseProduct
+
+    if not keys:
+        return {}
+    rows = {
+        (product_id, variant_id, warehouse_id): pk
+        for pk, product_id, variant_id, warehouse_id in WarehouseProduct.objects.filter(
+            warehouse_id__in={key[2] for key in keys}, product_id__in={key[0] for key in keys}
+        ).values_list('pk', 'product_id', 'variant_id', 'warehouse_id')
+    }
+    missing = [key for key in keys if key not in rows]
+    if create and missing:
+        created = WarehouseProduct.objects.bulk_create([
+            WarehouseProduct(product_id=product_id, variant_id=variant_id, warehouse_id=warehouse_id, stock=0)
+            for product_id, variant_id, warehouse_id in missing
+        ])
+        rows.update(zip(missing, (row.pk for row in created)))
+    return {key: rows[key] for key in keys if key in rows}
+
+
+def _targets(keys, create=False):
+    """{کلید: (مدل، شناسه ردیف)} ردیفی که موجودی هر کلید در آن نگهداری می‌شود"""
+    from apps.shipping.models import WarehouseProduct
+
+    targets = {}
+    for key in keys:
+        product_id, variant_id, warehouse_id = key
+        if warehouse_id is None:
+            targets[key] = (ProductVariant, variant_id) if variant_id else (Product, product_id)
+    warehouse_rows = _warehouse_rows([key for key in keys if key[2] is not None], create)
+    targets.update((key, (WarehouseProduct, pk)) for key, pk in warehouse_rows.items())
+    return targets
+
+
+def _levels(targets):
+    """موجودی فعلی هر کلید؛ با یک کوئری برای هر جدول"""
+    pks = defaultdict(set)
+    for model, pk in targets.values():
+        pks[model].add(pk)
+    stock = {
+        (model, pk): level
+        for model, model_pks in pks.items()
+        for pk, level in model.objects.filter(pk__in=model_pks).values_list('pk', 'stock')
+    }
+    return {key: stock[target] for key, target in targets.items() if target in stock}
+
+
+def _shortages(movements):
+    """کلیدهایی که موجودی فعلی‌شان جمع حرکت‌های منفی را پوشش نمی‌دهد"""
+    net = Counter()
+    for movement in movements:
+        net[movement.key] += movement.delta
+    levels = _levels(_targets(list(net)))
+    return [key for key, delta in net.items() if levels.get(key, 0) + delta < 0]
+
+
+def _write_logs(movements, levels, user=None):
+    """ثبت حرکت‌ها با موجودی قبل و بعد هر حرکت؛ levels موجودی پس از همه حرکت‌هاست"""
+    net = Counter()
+    for movement in movements:
+        net[movement.key] += movement.delta
+    running = {key: levels[key] - delta for key, delta in net.items()}
+    logs = []
+    for movement in movements:
+        previous = running[movement.key]
+        running[movement.key] = previous + movement.delta
+        if running[movement.key] < 0:
+            # جمع حرکت‌ها منفی نیست ولی ترتیبشان موجودی را در میانه منفی می‌کند
+            raise NegativeStock([movement.key])
+        logs.append(ProductInventoryLog(
+            product_id=movement.product_id,
+            variant_id=movement.variant_id,
+            warehouse_id=movement.warehouse_id,
+            previous_stock=previous,
+            new_stock=running[movement.key],
+            change_reason=movement.reason,
+            reference=movement.reference,
+            created_by=user,
+        ))
+    ProductInventoryLog.objects.bulk_create(logs)
+
+
+def _bump_catalog(movements):
+    # موجودی فروش محصول یا تنوع در صفحه جزئیات نمایش داده می‌شود؛ موجودی انبارها نه
+    product_ids = {movement.product_id for movement in movements if movement.warehouse_id is None}
+    if product_ids:
+        transaction.on_commit(lambda: bump_detail_version(*product_ids))
+
+
+def apply_movements(movements, user=None):
+    """
+    اعمال دسته‌ای حرکت‌های موجودی و ثبت آن‌ها در دفتر
+
+    خروجی: {(شناسه محصول، شناسه تنوع، شناسه انبار): موجودی پس از حرکت‌ها}
+    """
+    movements = _normalized(movements)
+    if not movements:
+        return {}
+    try:
+        with transaction.atomic():
+            targets = _targets({movement.key for movement in movements}, create=True)
+            deltas = defaultdict(Counter)
+            for movement in movements:
+                model, pk = targets[movement.key]
+                deltas[model][pk] += movement.delta
+            for model, values in deltas.items():
+                values = {pk: delta for pk, delta in values.items() if delta}
+                if not values:
+                    continue
+                updated = model.objects.filter(
+                    pk__in=list(values), stock__gte=per_row({pk: -delta for pk, delta in values.items()})
+                ).update(stock=F('stock') + per_row(values))
+                if updated != len(values):
+                    raise NegativeStock([])
+            levels = _levels(targets)
+            _write_logs(movements, levels, user)
+    except NegativeStock as exc:
+        raise NegativeStock(exc.keys or _shortages(movements))
+    _bump_catalog(movements)
+    return levels
+
+
+def record_movements(movements, user=None):
+    """ثبت حرکت‌هایی که موجودی‌شان جای دیگری (مثلاً با تبدیل رزرو) کسر شده است"""
+    movements = _normalized(movements)
+    if not movements:
+        return {}
+    levels = _levels(_targets({movement.key for movement in movements}))
+    _write_logs(movements, levels, user)
+    return levels
+
+
+def sync_catalog_stock(product_id, variant_id=None):
+    """برابر کردن موجودی فروش محصول یا تنوع با جمع موجودی آن در انبارها"""
+    from apps.shipping.models import WarehouseProduct
+
+    total = WarehouseProduct.objects.filter(
+        product_id=product_id, variant_id=variant_id
+    ).aggregate(total=Sum('stock'))['total'] or 0
+    if variant_id:
+        ProductVariant.objects.filter(pk=variant_id).update(stock=total)
+    else:
+        Product.objects.filter(pk=product_id).update(stock=total)
+    transaction.on_commit(lambda: bump_detail_version(product_id))
+    return total
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.recommendations import MIN_CO_OCCURRENCE, TOP_N, rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'محاسبه محصولات «اغلب با هم خریداری می‌شوند» از سفارش‌ها و رویدادهای سبد خرید'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=TOP_N)
+        parser.add_argument('--min-co-occurrence', type=float, default=MIN_CO_OCCURRENCE)
+
+    def handle(self, *args, **options):
+        written = rebuild_related_products(
+            top_n=options['top_n'], min_co_occurrence=options['min_co_occurrence']
+        )
+        self.stdout.write(self.style.SUCCESS(f'{written} رابطه محصول مرتبط محاسبه شد'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.catalog import CHUNK_SIZE, export_catalog
+from apps.products.models import Product
+from apps.sellers.models import Seller
+
+
+class Command(BaseCommand):
+    help = 'خروجی جریانی کاتالوگ محصولات یک فروشنده در قالب csv یا jsonl'
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller', help='اسلاگ فروشنده')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seller = Seller.objects.get(slug=options['seller'])
+        except Seller.DoesNotExist:
+            raise CommandError('فروشنده یافت نشد')
+
+        products = Product.objects.filter(seller=seller)
+        with open(options['path'], 'w', encoding='utf-8', newline='') as fileobj:
+            for line in export_catalog(products, options['format'], chunk_size=options['chunk_size']):
+                fileobj.write(line)
+        self.stdout.write(self.style.SUCCESS(f"کاتالوگ در {options['path']} ذخیره شد"))
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.catalog import CHUNK_SIZE, FORMATS, CatalogError, detect_format, import_catalog
+from apps.sellers.models import Seller
+
+
+class Command(BaseCommand):
+    help = 'ورود گروهی کاتالوگ محصولات یک فروشنده از فایل csv، jsonl یا xlsx'
+
+    def add_arguments(self, parser):
+        parser.add_argument('seller', help='اسلاگ فروشنده')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='در صورت نبود، از پسوند فایل تشخیص داده می‌شود')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seller = Seller.objects.get(slug=options['seller'])
+        except Seller.DoesNotExist:
+            raise CommandError('فروشنده یافت نشد')
+
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+            with open(options['path'], 'rb') as fileobj:
+                report = import_catalog(seller, fileobj, file_format, chunk_size=options['chunk_size'])
+        except (CatalogError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors']:
+            self.stderr.write(f"ردیف {error['row']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} محصول ایجاد و {report['updated']} محصول به‌روزرسانی شد؛ "
+            f"{report['error_count']} ردیف خطا داشت"
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import Product
+from apps.products.search import FIELD_WEIGHTS, index_products
+
+
+class Command(BaseCommand):
+    help = 'بازسازی کامل ایندکس جستجوی محصولات'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Product.objects.only('pk', *FIELD_WEIGHTS).order_by('pk')
+
+        batch, products, terms = [], 0, 0
+        for product in queryset.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                terms += index_products(batch)
+                products += len(batch)
+                batch = []
+        if batch:
+            terms += index_products(batch)
+            products += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'{products} محصول با {terms} واژه ایندکس شد'))
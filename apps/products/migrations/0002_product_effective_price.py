@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:54
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, NullIf
+
+
+def populate_effective_price(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(
+        effective_price=Coalesce(NullIf(F('discount_price'), Value(0)), F('price'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=0, default=0, editable=False, max_digits=15, verbose_name='قیمت نهایی'),
+        ),
+        migrations.RunPython(populate_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_approved', 'effective_price'], name='product_visible_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_active', 'is_approved', 'effective_price'], name='product_category_price_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='واژه')),
+                ('weight', models.FloatField(default=1, verbose_name='وزن')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'واژه ایندکس جستجو',
+                'verbose_name_plural': 'ایندکس جستجوی محصولات',
+                'unique_together': {('term', 'product')},
+            },
+        ),
+    ]
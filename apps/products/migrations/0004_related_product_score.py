@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_term'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='relatedproduct',
+            options={'ordering': ['-is_pinned', '-score'], 'verbose_name': 'محصول مرتبط', 'verbose_name_plural': 'محصولات مرتبط'},
+        ),
+        migrations.AddField(
+            model_name='relatedproduct',
+            name='is_pinned',
+            field=models.BooleanField(default=True, verbose_name='سنجاق شده'),
+        ),
+        migrations.AddField(
+            model_name='relatedproduct',
+            name='score',
+            field=models.FloatField(default=0, verbose_name='امتیاز شباهت'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved_stock',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='موجودی رزروشده'),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='reserved_stock',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='موجودی رزروشده'),
+        ),
+    ]
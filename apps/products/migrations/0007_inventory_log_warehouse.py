@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0001_initial'),
+        ('products', '0006_reserved_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinventorylog',
+            name='warehouse',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_logs', to='shipping.warehouse'),
+        ),
+    ]
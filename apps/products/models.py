@@ -1,10 +1,93 @@
 from itertools import product
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Value, Window
+from django.db.models.functions import Coalesce, NullIf, RowNumber
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
 from django.conf import settings
 import uuid
 
+from apps.categories.counts import product_states
+
+
+# فیلدهایی که قیمت پرداختی مشتری (effective_price) از آن‌ها محاسبه می‌شود
+PRICE_FIELDS = ('price', 'discount_price')
+
+# فیلدهایی که عضویت محصول در ایندکس فست دسته‌بندی را تعیین می‌کنند
+FACET_FIELDS = ('category', 'category_id', 'is_active', 'is_approved')
+
+
+def effective_price_expression(price=F('price'), discount_price=F('discount_price')):
+    """
+    معادل SQL ویژگی Product.final_price
+
+    مقادیر ورودی می‌توانند عدد یا عبارت باشند تا در QuerySet.update بتوان قیمت جدید
+    را مستقیماً در همان UPDATE محاسبه کرد.
+    """
+    def as_expression(value):
+        if hasattr(value, 'resolve_expression'):
+            return value
+        return Value(value, output_field=models.DecimalField(max_digits=15, decimal_places=0))
+
+    return Coalesce(
+        NullIf(as_expression(discount_price), Value(0)),
+        as_expression(price),
+        output_field=models.DecimalField(max_digits=15, decimal_places=0),
+    )
+
+
+def cover_images_prefetch(lookup='images'):
+    """
+    Prefetch تصویر شاخص هر محصول (تصویر اصلی یا در نبود آن اولین تصویر) در
+    ویژگی cover_images؛ lookup می‌تواند مسیر تصاویر از طریق یک رابطه باشد
+    """
+    cover_images = ProductImage.objects.annotate(
+        cover_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('product_id')],
+            order_by=[F('is_primary').desc(), F('order').asc()],
+        )
+    ).filter(cover_rank=1)
+    return Prefetch(lookup, queryset=cover_images, to_attr='cover_images')
+
+
+class ProductQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # به‌روزرسانی‌های گروهی قیمت باید ستون effective_price را هم در همان UPDATE همگام کنند
+        if any(field in kwargs for field in PRICE_FIELDS) and 'effective_price' not in kwargs:
+            kwargs['effective_price'] = effective_price_expression(
+                kwargs.get('price', F('price')), kwargs.get('discount_price', F('discount_price'))
+            )
+        return super().update(**kwargs)
+    
+    update.alters_data = True
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.effective_price = obj.final_price
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if any(field in fields for field in PRICE_FIELDS):
+            for obj in objs:
+                obj.effective_price = obj.final_price
+            if 'effective_price' not in fields:
+                fields.append('effective_price')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+    
+    def for_list(self):
+        """
+        پروجکشن سبک برای فیدهای لیستی محصولات
+
+        فروشنده و دسته‌بندی با JOIN خوانده می‌شوند و برای تصویر شاخص فقط یک ردیف
+        (تصویر اصلی یا در نبود آن اولین تصویر) در یک کوئری واکشی می‌شود؛ بنابراین
+        تعداد کوئری‌های هر صفحه به اندازه صفحه وابسته نیست.
+        """
+        return self.select_related('seller', 'category').prefetch_related(cover_images_prefetch())
+
 
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -16,7 +99,10 @@ class Product(models.Model):
     short_description = models.CharField(_('توضیحات کوتاه'), max_length=300, blank=True)
     price = models.DecimalField(_('قیمت'), max_digits=15, decimal_places=0)
     discount_price = models.DecimalField(_('قیمت با تخفیف'), max_digits=15, decimal_places=0, blank=True, null=True)
+    effective_price = models.DecimalField(_('قیمت نهایی'), max_digits=15, decimal_places=0,
+                                          default=0, editable=False)
     stock = models.PositiveIntegerField(_('موجودی'), default=0)
+    reserved_stock = models.PositiveIntegerField(_('موجودی رزروشده'), default=0, editable=False)
     is_active = models.BooleanField(_('فعال'), default=True)
     is_featured = models.BooleanField(_('ویژه'), default=False)
     is_approved = models.BooleanField(_('تایید شده'), default=False)
@@ -35,21 +121,63 @@ class Product(models.Model):
     created_at = models.DateTimeField(_('تاریخ ایجاد'), auto_now_add=True)
     updated_at = models.DateTimeField(_('تاریخ به‌روزرسانی'), auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('محصول')
         verbose_name_plural = _('محصولات')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_active', 'is_approved', 'effective_price'],
+                         name='product_visible_price_idx'),
+            models.Index(fields=['category', 'is_active', 'is_approved', 'effective_price'],
+                         name='product_category_price_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # دسته و وضعیت نمایش هنگام خواندن؛ برای حذف از ایندکس فست و شمارنده دسته قبلی
+        instance._loaded_state = instance.visibility_state()
+        return instance
+    
+    def visibility_state(self):
+        """(دسته، فعال و تاییدشده بودن) یا None اگر این فیلدها بارگذاری نشده باشند"""
+        values = self.__dict__
+        if not all(field in values for field in ('category_id', 'is_active', 'is_approved')):
+            return None
+        return values['category_id'], values['is_active'] and values['is_approved']
+    
+    @property
+    def loaded_state(self):
+        """(دسته، قابل نمایش بودن) محصول در پایگاه داده پیش از ذخیره فعلی"""
+        return getattr(self, '_loaded_state', None)
+    
     def save(self, *args, **kwargs):
+        self.effective_price = self.final_price
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and any(field in update_fields for field in PRICE_FIELDS):
+            kwargs['update_fields'] = set(update_fields) | {'effective_price'}
+        
         if not self.slug:
             self.slug = slugify(self.name)
             # اضافه کردن شناسه یکتا برای جلوگیری از تکرار اسلاگ
             if Product.objects.filter(slug=self.slug).exists():
                 self.slug = f"{self.slug}-{str(uuid.uuid4())[:8]}"
-        super().save(*args, **kwargs)
+        tracks_state = update_fields is None or bool(set(update_fields) & set(FACET_FIELDS))
+        if self._state.adding or not tracks_state:
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic(using=kwargs.get('using')):
+                # وضعیت خوانده‌شده هنگام بارگذاری ممکن است قدیمی باشد؛ وضعیت فعلی زیر قفل ردیف
+                # خوانده می‌شود تا ذخیره‌های همزمان تفاضل شمارنده دسته‌ها را دو بار اعمال نکنند
+                self._loaded_state = product_states([self.pk], lock=True).get(self.pk)
+                super().save(*args, **kwargs)
+        if tracks_state:
+            self._loaded_state = self.visibility_state()
     
     @property
     def discount_percentage(self):
@@ -61,15 +189,21 @@ class Product(models.Model):
     def final_price(self):
         return self.discount_price if self.discount_price else self.price
     
+    @property
+    def available_stock(self):
+        """موجودی قابل فروش: موجودی منهای رزروهای فعال سفارش‌های پرداخت‌نشده"""
+        return max(self.stock - self.reserved_stock, 0)
+    
     @property
     def is_in_stock(self):
-        return self.stock > 0
+        return self.available_stock > 0
 
 
 class ProductImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(_('تصویر'), upload_to='products/')
+    derivatives = models.JSONField(_('نسخه‌های تصویر'), default=dict, blank=True, editable=False)
     alt_text = models.CharField(_('متن جایگزین'), max_length=100, blank=True)
     is_primary = models.BooleanField(_('تصویر اصلی'), default=False)
     order = models.PositiveIntegerField(_('ترتیب'), default=0)
@@ -105,7 +239,9 @@ class ProductVariant(models.Model):
     sku = models.CharField(_('کد محصول'), max_length=50, blank=True, null=True)
     price_adjustment = models.DecimalField(_('تغییر قیمت'), max_digits=15, decimal_places=0, default=0)
     stock = models.PositiveIntegerField(_('موجودی'), default=0)
+    reserved_stock = models.PositiveIntegerField(_('موجودی رزروشده'), default=0, editable=False)
     image = models.ImageField(_('تصویر'), upload_to='product_variants/', blank=True, null=True)
+    derivatives = models.JSONField(_('نسخه‌های تصویر'), default=dict, blank=True, editable=False)
     is_default = models.BooleanField(_('پیش‌فرض'), default=False)
     
     class Meta:
@@ -115,6 +251,10 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.name}"
     
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved_stock, 0)
+    
     @property
     def final_price(self):
         base_price = self.product.discount_price if self.product.discount_price else self.product.price
@@ -191,6 +331,7 @@ class ProductReviewImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     review = models.ForeignKey(ProductReview, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(_('تصویر'), upload_to='review_images/')
+    derivatives = models.JSONField(_('نسخه‌های تصویر'), default=dict, blank=True, editable=False)
     
     class Meta:
         verbose_name = _('تصویر نظر')
@@ -273,11 +414,15 @@ class ProductAnswer(models.Model):
 class RelatedProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
     related_product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_to_products')
+    # موارد دستی فروشنده سنجاق می‌شوند؛ موارد محاسبه‌شده توسط موتور خرید همزمان با هر اجرا جایگزین می‌شوند
+    is_pinned = models.BooleanField(_('سنجاق شده'), default=True)
+    score = models.FloatField(_('امتیاز شباهت'), default=0)
     
     class Meta:
         verbose_name = _('محصول مرتبط')
         verbose_name_plural = _('محصولات مرتبط')
         unique_together = ('product', 'related_product')
+        ordering = ['-is_pinned', '-score']
     
     def __str__(self):
         return f"{self.product.name} -> {self.related_product.name}"
@@ -288,6 +433,8 @@ class ProductInventoryLog(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_logs')
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, 
                               related_name='inventory_logs', blank=True, null=True)
+    warehouse = models.ForeignKey('shipping.Warehouse', on_delete=models.SET_NULL, 
+                                related_name='inventory_logs', blank=True, null=True)
     previous_stock = models.PositiveIntegerField(_('موجودی قبلی'))
     new_stock = models.PositiveIntegerField(_('موجودی جدید'))
     change_reason = models.CharField(_('دلیل تغییر'), max_length=100)
@@ -305,4 +452,18 @@ class ProductInventoryLog(models.Model):
         product_name = self.product.name
         if self.variant:
             product_name += f" - {self.variant.name}"
-        return f"{product_name} - {self.previous_stock} به {self.new_stock}"
\ No newline at end of file
+        return f"{product_name} - {self.previous_stock} به {self.new_stock}"
+
+class ProductSearchTerm(models.Model):
+    """ایندکس معکوس جستجوی محصولات (واژه نرمال‌شده -> محصول)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(_('واژه'), max_length=64)
+    weight = models.FloatField(_('وزن'), default=1)
+    
+    class Meta:
+        verbose_name = _('واژه ایندکس جستجو')
+        verbose_name_plural = _('ایندکس جستجوی محصولات')
+        unique_together = ('term', 'product')
+    
+    def __str__(self):
+        return f"{self.term} -> {self.product_id}"
@@ -0,0 +1,150 @@
+"""
+موتور «اغلب با هم خریداری می‌شوند»
+
+از اقلام سفارش‌های پرداخت‌شده و رویدادهای افزودن به سبد یک ماتریس تنک سبد×محصول
+ساخته می‌شود و ماتریس هم‌رخدادی محصول×محصول با یک ضرب ماتریسی تنک به دست می‌آید.
+شباهت دو محصول کسینوسی است: هم‌رخدادی وزن‌دار تقسیم بر ریشه حاصل‌ضرب تعداد
+سبدهای هر محصول. برای هر محصول TOP_N همسایه برتر در RelatedProduct با
+is_pinned=False نوشته می‌شوند و موارد سنجاق‌شده دستی دست نخورده باقی می‌مانند.
+"""
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from apps.analytics.models import CartEvent
+from apps.orders.models import OrderItem, OrderStatus
+from .cache import bump_detail_version
+from .models import Product, RelatedProduct
+
+PAID_ORDER_STATUSES = (
+    OrderStatus.PAID, OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.DELIVERED,
+)
+# افزودن به سبد سیگنال ضعیف‌تری از خرید است
+ORDER_WEIGHT = 1.0
+CART_ADD_WEIGHT = 0.3
+TOP_N = 12
+# حداقل هم‌رخدادی وزن‌دار برای حذف جفت‌های تصادفی
+MIN_CO_OCCURRENCE = 1.0
+BATCH_SIZE = 2000
+
+
+def _collect_baskets():
+    """
+    سبدها به صورت آرایه‌های (شماره سبد، شماره محصول) و وزن هر سبد
+
+    کلید سبدها و محصولات به اندیس‌های پیوسته نگاشت می‌شوند تا ماتریس فشرده بماند.
+    """
+    product_index, basket_index = {}, {}
+    rows, cols, basket_weights = [], [], []
+
+    sources = (
+        (
+            OrderItem.objects.filter(order__status__in=PAID_ORDER_STATUSES)
+            .values_list('order_id', 'product_id'),
+            'order', ORDER_WEIGHT,
+        ),
+        (
+            CartEvent.objects.filter(event_type='add', product__isnull=False)
+            .values_list('cart_id', 'product_id'),
+            'cart', CART_ADD_WEIGHT,
+        ),
+    )
+    for queryset, prefix, weight in sources:
+        for basket_id, product_id in queryset.iterator(chunk_size=BATCH_SIZE):
+            basket = basket_index.get((prefix, basket_id))
+            if basket is None:
+                basket = basket_index[(prefix, basket_id)] = len(basket_weights)
+                basket_weights.append(weight)
+            rows.append(basket)
+            cols.append(product_index.setdefault(product_id, len(product_index)))
+
+    return rows, cols, np.asarray(basket_weights, dtype=np.float64), product_index
+
+
+def compute_neighbours(top_n=TOP_N, min_co_occurrence=MIN_CO_OCCURRENCE, candidates=None):
+    """
+    محاسبه همسایه‌های هر محصول
+
+    candidates در صورت تعیین، مجموعه شناسه محصولاتی است که می‌توانند همسایه باشند.
+    خروجی: {شناسه محصول: [(شناسه همسایه، امتیاز), ...]} مرتب بر اساس امتیاز نزولی
+    """
+    rows, cols, basket_weights, product_index = _collect_baskets()
+    if not rows:
+        return {}
+
+    baskets = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+        shape=(len(basket_weights), len(product_index)),
+    )
+    # هر محصول در هر سبد یک بار شمرده می‌شود
+    baskets.data[:] = 1.0
+
+    weighted = sparse.diags(basket_weights) @ baskets
+    co_occurrence = (baskets.T @ weighted).tocsr()
+    item_weight = co_occurrence.diagonal()
+    co_occurrence.setdiag(0)
+    co_occurrence.eliminate_zeros()
+
+    norms = np.sqrt(item_weight)
+    norms[norms == 0] = 1.0
+    # شباهت کسینوسی روی همان ساختار تنک: C[i, j] / (|i| * |j|)
+    row_of = np.repeat(np.arange(co_occurrence.shape[0]), np.diff(co_occurrence.indptr))
+    similarity = co_occurrence.data / (norms[row_of] * norms[co_occurrence.indices])
+
+    product_ids = np.empty(len(product_index), dtype=object)
+    for product_id, index in product_index.items():
+        product_ids[index] = product_id
+    allowed = np.fromiter(
+        (candidates is None or product_id in candidates for product_id in product_ids),
+        dtype=bool, count=len(product_ids),
+    )
+
+    neighbours = {}
+    for row in range(co_occurrence.shape[0]):
+        start, end = co_occurrence.indptr[row], co_occurrence.indptr[row + 1]
+        keep = (co_occurrence.data[start:end] >= min_co_occurrence) & allowed[co_occurrence.indices[start:end]]
+        columns = co_occurrence.indices[start:end][keep]
+        scores = similarity[start:end][keep]
+        if not len(columns):
+            continue
+        if len(columns) > top_n:
+            best = np.argpartition(-scores, top_n)[:top_n]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        neighbours[product_ids[row]] = [
+            (product_ids[column], float(score)) for column, score in zip(columns[order], scores[order])
+        ]
+    return neighbours
+
+
+@transaction.atomic
+def rebuild_related_products(top_n=TOP_N, min_co_occurrence=MIN_CO_OCCURRENCE):
+    """
+    جایگزینی همه روابط محاسبه‌شده با نتیجه جدید
+
+    فقط محصولات فعال و تاییدشده به عنوان همسایه نوشته می‌شوند. خروجی: تعداد
+    روابط نوشته‌شده
+    """
+    visible = set(Product.objects.filter(
+        is_active=True, is_approved=True,
+    ).values_list('pk', flat=True))
+    neighbours = compute_neighbours(top_n=top_n, min_co_occurrence=min_co_occurrence, candidates=visible)
+    pinned = set(RelatedProduct.objects.filter(is_pinned=True).values_list('product_id', 'related_product_id'))
+
+    computed = RelatedProduct.objects.filter(is_pinned=False)
+    affected = set(computed.values_list('product_id', flat=True).distinct())
+    # هیچ مدلی به RelatedProduct ارجاع نمی‌دهد؛ حذف مستقیم بدون بارگذاری ردیف‌ها و سیگنال post_delete
+    # هر ردیف انجام می‌شود و کش جزئیات یک بار برای همه محصولات affected نامعتبر می‌شود
+    computed._raw_delete(computed.db)
+
+    rows = [
+        RelatedProduct(product_id=product_id, related_product_id=related_id, score=score, is_pinned=False)
+        for product_id, related in neighbours.items()
+        for related_id, score in related
+        if (product_id, related_id) not in pinned
+    ]
+    RelatedProduct.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+    affected.update(row.product_id for row in rows)
+    transaction.on_commit(lambda: bump_detail_version(*affected))
+    return len(rows)
@@ -0,0 +1,168 @@
+"""
+موتور جستجوی متنی محصولات
+
+متن محصولات پس از نرمال‌سازی فارسی (ی/ک عربی، نیم‌فاصله، اعراب و ارقام فارسی و عربی)
+و ریشه‌یابی با hazm به واژه‌هایی شکسته می‌شود که در جدول ProductSearchTerm نگهداری
+می‌شوند. جستجو فقط روی این ایندکس معکوس انجام می‌شود و نتایج بر اساس مجموع وزن
+واژه‌های منطبق رتبه‌بندی می‌شوند. واژه آخر عبارت به صورت پیشوندی هم جستجو می‌شود تا
+حروف اول نام محصول (مثلاً هنگام تایپ) نتیجه داشته باشد.
+"""
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from rest_framework.filters import BaseFilterBackend
+
+# وزن هر فیلد در رتبه‌بندی نتایج
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'sku': 3.0,
+    'meta_keywords': 2.0,
+    'short_description': 2.0,
+    'description': 1.0,
+}
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+# واژه آخر کوتاه‌تر از این فقط به صورت کامل جستجو می‌شود
+MIN_PREFIX_LENGTH = 2
+
+_CHARACTER_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه', 'ۀ': 'ه',
+    'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و',
+    '\u200c': '', '\u200d': '', '\u00ad': '', '\u0640': '',  # نیم‌فاصله، اتصال و کشیده
+    **{persian: str(digit) for digit, persian in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{arabic: str(digit) for digit, arabic in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize_text(text):
+    """نرمال‌سازی متن فارسی برای ایندکس و جستجو"""
+    if not text:
+        return ''
+    text = _DIACRITICS.sub('', str(text).translate(_CHARACTER_MAP))
+    return text.lower()
+
+
+@lru_cache(maxsize=1)
+def _get_stemmer():
+    try:
+        from hazm import Stemmer
+    except ImportError:
+        return None
+    return Stemmer()
+
+
+@lru_cache(maxsize=50000)
+def stem(token):
+    stemmer = _get_stemmer()
+    if stemmer is None or token.isdigit():
+        return token
+    return stemmer.stem(token) or token
+
+
+def words(text):
+    """واژه‌های نرمال‌شده متن بدون ریشه‌یابی"""
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN.findall(normalize_text(text))]
+
+
+def tokenize(text):
+    """تبدیل متن به واژه‌های نرمال‌شده و ریشه‌یابی‌شده"""
+    return [stem(token)[:MAX_TERM_LENGTH] for token in words(text)]
+
+
+def build_terms(product):
+    """محاسبه وزن هر واژه برای یک محصول"""
+    weights = defaultdict(float)
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(getattr(product, field, '')):
+            weights[term] += weight
+    return weights
+
+
+def index_products(products):
+    """بازسازی ایندکس مجموعه‌ای از محصولات با یک DELETE و یک INSERT گروهی"""
+    from .models import ProductSearchTerm
+
+    products = list(products)
+    if not products:
+        return 0
+
+    rows = [
+        ProductSearchTerm(product_id=product.pk, term=term, weight=weight)
+        for product in products
+        for term, weight in build_terms(product).items()
+    ]
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=[product.pk for product in products]).delete()
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def index_product(product):
+    return index_products([product])
+
+
+def search_products(queryset, query):
+    """
+    فیلتر و رتبه‌بندی queryset بر اساس عبارت جستجو
+
+    همه واژه‌های عبارت باید در محصول وجود داشته باشند؛ واژه آخر با ریشه خود یا به
+    عنوان پیشوند هر واژه ایندکس منطبق می‌شود. مقدار search_rank مجموع وزن واژه‌های
+    منطبق است.
+    """
+    from .models import ProductSearchTerm
+
+    query_words = list(dict.fromkeys(words(query)))[:MAX_QUERY_TERMS]
+    if not query_words:
+        return queryset
+
+    *complete, last = query_words
+    terms = list(dict.fromkeys(stem(word)[:MAX_TERM_LENGTH] for word in complete))
+    last_match = Q(term=stem(last)[:MAX_TERM_LENGTH])
+    if len(last) >= MIN_PREFIX_LENGTH:
+        last_match |= Q(term__startswith=last)
+
+    if terms:
+        queryset = queryset.filter(pk__in=ProductSearchTerm.objects.filter(term__in=terms).values(
+            'product_id'
+        ).annotate(hits=Count('term')).filter(hits=len(terms)).values('product_id'))
+    queryset = queryset.filter(pk__in=ProductSearchTerm.objects.filter(last_match).values('product_id'))
+
+    rank = ProductSearchTerm.objects.filter(
+        Q(term__in=terms) | last_match, product_id=OuterRef('pk')
+    ).values('product_id').annotate(rank=Sum('weight')).values('rank')
+
+    return queryset.annotate(search_rank=Subquery(rank)).order_by('-search_rank', '-created_at')
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    جایگزین SearchFilter برای لیست محصولات با استفاده از ایندکس معکوس
+    """
+    search_param = 'search'
+
+    def get_search_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        return search_products(queryset, query)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'عبارت جستجو',
+            'schema': {'type': 'string'},
+        }]
@@ -8,8 +8,10 @@ from .models import (
     ProductTag, ProductTagRelation, ProductReview, ProductReviewImage, ProductReviewComment,
     ProductQuestion, ProductAnswer, RelatedProduct, ProductInventoryLog
 )
-from apps.categories.serializers import CategoryListSerializer, CategoryAttributeSerializer
+from apps.categories.serializers import CategorySummarySerializer, CategoryAttributeSerializer
 from apps.sellers.serializers import SellerListSerializer
+from apps.common.images import derivative_url, srcset
+from apps.common.serializers import SparseFieldsetMixin
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
@@ -46,7 +48,7 @@ class ProductVariantSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ProductVariant
-        fields = ('id', 'name', 'sku', 'price_adjustment', 'stock', 'image', 
+        fields = ('id', 'name', 'sku', 'price_adjustment', 'stock', 'available_stock', 'image', 
                  'is_default', 'attributes', 'final_price')
 
 
@@ -127,28 +129,44 @@ class ProductQuestionSerializer(serializers.ModelSerializer):
         return obj.user.get_full_name()
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     primary_image = serializers.SerializerMethodField()
+    primary_image_srcset = serializers.SerializerMethodField()
     discount_percentage = serializers.IntegerField(read_only=True)
     final_price = serializers.DecimalField(max_digits=15, decimal_places=0, read_only=True)
     seller_name = serializers.SerializerMethodField()
     category_name = serializers.SerializerMethodField()
     
+    # حداکثر عرض تصویر شاخص در کارت‌های لیستی؛ نسخه‌های بزرگ‌تر فقط در srcset می‌آیند
+    list_image_width = 640
+    
     class Meta:
         model = Product
         fields = ('id', 'name', 'slug', 'short_description', 'price', 'discount_price',
                  'discount_percentage', 'final_price', 'rating', 'review_count',
-                 'primary_image', 'seller_name', 'category_name', 'is_in_stock')
+                 'primary_image', 'primary_image_srcset', 'seller_name', 'category_name',
+                 'is_in_stock')
+    
+    def _get_cover_image(self, obj):
+        # در صورت استفاده از Product.objects.for_list تصویر شاخص از قبل واکشی شده است
+        if hasattr(obj, 'cover_images'):
+            return obj.cover_images[0] if obj.cover_images else None
+        if not hasattr(obj, '_cover_image'):
+            # اگر تصویر اصلی وجود نداشت، اولین تصویر برگردانده می‌شود
+            obj._cover_image = obj.images.filter(is_primary=True).first() or obj.images.first()
+        return obj._cover_image
     
     def get_primary_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
-            return primary_image.image.url
-        # اگر تصویر اصلی وجود نداشت، اولین تصویر را برمی‌گرداند
-        first_image = obj.images.first()
-        if first_image:
-            return first_image.image.url
-        return None
+        image = self._get_cover_image(obj)
+        if image is None:
+            return None
+        return derivative_url(image.image, image.derivatives, self.list_image_width)
+    
+    def get_primary_image_srcset(self, obj):
+        image = self._get_cover_image(obj)
+        if image is None:
+            return None
+        return srcset(image.image, image.derivatives)
     
     def get_seller_name(self, obj):
         return obj.seller.shop_name
@@ -162,35 +180,34 @@ class RelatedProductSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = RelatedProduct
-        fields = ('id', 'related_product')
+        fields = ('id', 'related_product', 'is_pinned', 'score')
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     attributes = ProductAttributeSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
     tags = serializers.SerializerMethodField()
-    related_products = RelatedProductSerializer(many=True, read_only=True)
-    reviews = ProductReviewSerializer(many=True, read_only=True)
-    questions = ProductQuestionSerializer(many=True, read_only=True)
     seller = SellerListSerializer(read_only=True)
-    category = CategoryListSerializer(read_only=True)
+    category = CategorySummarySerializer(read_only=True)
     discount_percentage = serializers.IntegerField(read_only=True)
     final_price = serializers.DecimalField(max_digits=15, decimal_places=0, read_only=True)
+    # نظرات، پرسش‌ها و محصولات مرتبط از زیرمنابع صفحه‌بندی‌شده یا با پارامتر expand خوانده می‌شوند
+    question_count = serializers.IntegerField(read_only=True)
+    related_product_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Product
         fields = ('id', 'name', 'slug', 'description', 'short_description', 'price',
-                 'discount_price', 'discount_percentage', 'final_price', 'stock',
-                 'is_active', 'is_featured', 'rating', 'review_count', 'sales_count',
-                 'view_count', 'sku', 'weight', 'width', 'height', 'length',
-                 'meta_title', 'meta_description', 'meta_keywords', 'created_at',
-                 'updated_at', 'seller', 'category', 'images', 'attributes',
-                 'variants', 'tags', 'related_products', 'reviews', 'questions',
-                 'is_in_stock')
+                 'discount_price', 'discount_percentage', 'final_price', 'stock', 'available_stock',
+                 'is_active', 'is_featured', 'rating', 'review_count', 'question_count',
+                 'related_product_count', 'sales_count', 'view_count', 'sku', 'weight',
+                 'width', 'height', 'length', 'meta_title', 'meta_description',
+                 'meta_keywords', 'created_at', 'updated_at', 'seller', 'category',
+                 'images', 'attributes', 'variants', 'tags', 'is_in_stock')
     
     def get_tags(self, obj):
-        tags = ProductTag.objects.filter(products__product=obj)
+        tags = [relation.tag for relation in obj.tags.all()]
         return ProductTagSerializer(tags, many=True).data
 
 
@@ -282,10 +299,11 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
         variants_data = validated_data.pop('variants', [])
         tags_data = validated_data.pop('tags', [])
         
-        # به‌روزرسانی فیلدهای محصول
+        # به‌روزرسانی فیلدهای محصول؛ فقط فیلدهای ارسال‌شده نوشته می‌شوند تا reserved_stock
+        # (که فقط با UPDATE رزروها تغییر می‌کند) با مقدار قدیمی نمونه بازنویسی نشود
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        instance.save(update_fields=[*validated_data, 'updated_at'])
         
         # به‌روزرسانی تصاویر
         if primary_image:
@@ -357,7 +375,7 @@ class ProductInventoryLogSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ProductInventoryLog
-        fields = ('id', 'product', 'product_name', 'variant', 'variant_name',
+        fields = ('id', 'product', 'product_name', 'variant', 'variant_name', 'warehouse',
                  'previous_stock', 'new_stock', 'change_reason', 'reference',
                  'created_by', 'created_by_name', 'created_at')
         read_only_fields = ('id', 'created_at')
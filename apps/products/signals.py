@@ -0,0 +1,130 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.categories.counts import apply_count_deltas, state_deltas
+from apps.categories.models import CategoryAttribute
+from .cache import DETAIL_CACHE_VOLATILE_FIELDS, bump_detail_version
+from .facets import invalidate_facet_index, schedule_facet_update
+from .models import (
+    Product, ProductImage, ProductAttribute, ProductVariant, ProductVariantAttribute,
+    ProductTag, ProductTagRelation, ProductReview, ProductReviewImage, ProductReviewComment,
+    ProductQuestion, ProductAnswer, RelatedProduct, FACET_FIELDS
+)
+from .search import FIELD_WEIGHTS, index_product
+
+
+def _bump_through(instance, parent):
+    # در حذف آبشاری ممکن است والد پیش‌تر حذف شده باشد؛ در آن صورت محصول نیز خودش نامعتبر می‌شود
+    try:
+        bump_detail_version(getattr(instance, parent).product_id)
+    except ObjectDoesNotExist:
+        pass
+
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """بازسازی ایندکس جستجوی محصول در صورت احتمال تغییر یکی از فیلدهای قابل جستجو"""
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return
+    index_product(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= DETAIL_CACHE_VOLATILE_FIELDS:
+        return
+    # محصولاتی که این محصول را در بخش محصولات مرتبط نمایش می‌دهند
+    referencing = RelatedProduct.objects.filter(
+        related_product_id=instance.pk
+    ).values_list('product_id', flat=True)
+    bump_detail_version(instance.pk, *referencing)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_facet_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(FACET_FIELDS):
+        return
+    schedule_facet_update(
+        [instance.pk], [instance.category_id, (instance.loaded_state or (None,))[0]]
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(FACET_FIELDS):
+        return
+    before = instance.loaded_state
+    apply_count_deltas(state_deltas(
+        {instance.pk: before} if before and not created else {},
+        {instance.pk: instance.visibility_state()},
+    ))
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counts_on_delete(sender, instance, **kwargs):
+    before = instance.loaded_state or instance.visibility_state()
+    apply_count_deltas(state_deltas({instance.pk: before} if before else {}, {}))
+
+
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def update_facet_index_on_attribute_change(sender, instance, **kwargs):
+    schedule_facet_update([instance.product_id])
+
+
+@receiver(post_save, sender=CategoryAttribute)
+@receiver(post_delete, sender=CategoryAttribute)
+def invalidate_facet_index_on_category_attribute_change(sender, instance, **kwargs):
+    # تغییر is_filter یا نام ویژگی روی همه دسته‌هایی که محصولی با این ویژگی دارند اثر دارد
+    invalidate_facet_index(instance.category_id, *Product.objects.filter(
+        attributes__attribute_id=instance.pk
+    ).values_list('category_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductTagRelation)
+@receiver(post_delete, sender=ProductTagRelation)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+@receiver(post_save, sender=ProductQuestion)
+@receiver(post_delete, sender=ProductQuestion)
+@receiver(post_save, sender=RelatedProduct)
+@receiver(post_delete, sender=RelatedProduct)
+def invalidate_product_detail_on_child_change(sender, instance, **kwargs):
+    bump_detail_version(instance.product_id)
+
+
+@receiver(post_save, sender=ProductVariantAttribute)
+@receiver(post_delete, sender=ProductVariantAttribute)
+def invalidate_product_detail_on_variant_attribute_change(sender, instance, **kwargs):
+    _bump_through(instance, 'variant')
+
+
+@receiver(post_save, sender=ProductReviewImage)
+@receiver(post_delete, sender=ProductReviewImage)
+@receiver(post_save, sender=ProductReviewComment)
+@receiver(post_delete, sender=ProductReviewComment)
+def invalidate_product_detail_on_review_change(sender, instance, **kwargs):
+    _bump_through(instance, 'review')
+
+
+@receiver(post_save, sender=ProductAnswer)
+@receiver(post_delete, sender=ProductAnswer)
+def invalidate_product_detail_on_answer_change(sender, instance, **kwargs):
+    _bump_through(instance, 'question')
+
+
+@receiver(post_save, sender=ProductTag)
+@receiver(post_delete, sender=ProductTag)
+def invalidate_product_detail_on_tag_change(sender, instance, **kwargs):
+    bump_detail_version(*ProductTagRelation.objects.filter(
+        tag_id=instance.pk
+    ).values_list('product_id', flat=True))
@@ -0,0 +1,48 @@
+"""
+UPDATE گروهی محصولات همراه با داده‌های وابسته به آن‌ها
+
+QuerySet.update سیگنال ندارد و ProductQuerySet.update فقط effective_price را همگام
+می‌کند. مسیرهایی که با UPDATE گروهی فیلدهای نمایشی محصول را عوض می‌کنند (مثلاً
+اکشن‌های پنل مدیریت) به جای آن update_products را صدا می‌زنند تا ایندکس جستجو،
+ایندکس فست، شمارنده محصولات دسته‌ها و کش جزئیات هم به‌روز شوند. مسیرهای پرتکرار
+موجودی، رزرو، فروش و بازدید مستقیماً UPDATE می‌کنند و فقط کاری را که لازم دارند
+(مثلاً نامعتبر کردن کش جزئیات) خودشان انجام می‌دهند.
+"""
+from django.db import transaction
+
+from apps.categories.counts import apply_count_deltas, product_states, state_deltas
+from .cache import DETAIL_CACHE_VOLATILE_FIELDS, bump_detail_version
+from .facets import schedule_facet_update
+from .models import FACET_FIELDS
+from .search import FIELD_WEIGHTS, index_products
+
+
+def update_products(queryset, **changes):
+    """
+    queryset.update(**changes) به همراه به‌روزرسانی ایندکس‌ها، شمارنده‌ها و کش محصولات
+
+    خروجی: تعداد ردیف‌های به‌روزشده
+    """
+    fields = set(changes)
+    facet_change = bool(fields & set(FACET_FIELDS))
+    with transaction.atomic(using=queryset.db):
+        if facet_change:
+            # وضعیت قبلی ردیف‌ها قفل می‌شود تا تغییرات همزمان (مثلاً تایید) شمارنده دسته‌ها را به هم نریزند
+            before = {
+                pk: (category_id, is_active and is_approved)
+                for pk, category_id, is_active, is_approved in queryset.select_for_update().values_list(
+                    'pk', 'category_id', 'is_active', 'is_approved'
+                )
+            }
+            product_ids = list(before)
+        else:
+            product_ids = list(queryset.values_list('pk', flat=True))
+        rows = queryset.update(**changes)
+        if facet_change:
+            schedule_facet_update(before, {category_id for category_id, _ in before.values()})
+            apply_count_deltas(state_deltas(before, product_states(before)))
+        if product_ids and fields & set(FIELD_WEIGHTS):
+            index_products(queryset.model._base_manager.filter(pk__in=product_ids).only(*FIELD_WEIGHTS))
+        if product_ids and not fields <= DETAIL_CACHE_VOLATILE_FIELDS:
+            transaction.on_commit(lambda: bump_detail_version(*product_ids), using=queryset.db)
+    return rows
@@ -0,0 +1,15 @@
+from celery import shared_task
+
+
+@shared_task(name='apps.products.tasks.rebuild_related_products')
+def rebuild_related_products():
+    """بازسازی دوره‌ای محصولات مرتبط از داده‌های خرید همزمان"""
+    from .recommendations import rebuild_related_products as _rebuild
+    return _rebuild()
+
+
+@shared_task(name='apps.products.tasks.import_catalog_file')
+def import_catalog_file(seller_id, path, file_format):
+    """ورود فایل کاتالوگ بزرگ خارج از چرخه درخواست"""
+    from .catalog import import_stored_catalog
+    return import_stored_catalog(seller_id, path, file_format)
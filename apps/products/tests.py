@@ -1,3 +1,726 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.categories.models import Category
+from apps.common.testing import CatalogTestMixin, create_user
+from .models import (
+    Product, ProductAttribute, ProductImage, ProductQuestion, ProductAnswer, ProductReview, RelatedProduct
+)
+from .sync import update_products
+
+
+class ProductListQueryBudgetTests(CatalogTestMixin, TestCase):
+    """
+    تعداد کوئری‌های هر صفحه از فیدهای لیستی نباید به اندازه صفحه وابسته باشد
+    """
+    # COUNT صفحه‌بندی + کوئری اصلی (با JOIN فروشنده و دسته‌بندی) + واکشی تصویر شاخص
+    LIST_QUERY_BUDGET = 3
+
+    feed_urls = [
+        '/api/products/products/',
+        '/api/products/products/featured/',
+        '/api/products/products/best_selling/',
+        '/api/products/products/new_arrivals/',
+        '/api/products/products/discounted/',
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _create_products(self, count):
+        for i in range(Product.objects.count(), Product.objects.count() + count):
+            product = self.create_product(f'product-{i}', name=f'محصول {i}', discount_price=900, is_featured=True)
+            ProductImage.objects.create(product=product, image=f'products/{i}-b.jpg', order=1)
+            ProductImage.objects.create(product=product, image=f'products/{i}-a.jpg', order=2, is_primary=True)
+
+    def _count_queries(self, url, page_size):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        self._create_products(2)
+        small = {url: self._count_queries(url, 2)[0] for url in self.feed_urls}
+
+        self._create_products(18)
+        for url in self.feed_urls:
+            large, response = self._count_queries(url, 20)
+            self.assertEqual(len(response.data['results']), 20)
+            self.assertEqual(large, small[url], url)
+            self.assertLessEqual(large, self.LIST_QUERY_BUDGET, url)
+
+    def test_my_products_query_budget(self):
+        self._create_products(10)
+        self.client.force_authenticate(self.seller.user)
+        # بارگذاری فروشنده کاربر در بررسی دسترسی یک کوئری اضافه دارد
+        queries, response = self._count_queries('/api/products/products/my_products/', 10)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertLessEqual(queries, self.LIST_QUERY_BUDGET + 1)
+
+    def test_primary_image_prefers_primary_then_first(self):
+        self._create_products(1)
+        bare = self.create_product('no-primary', name='بدون اصلی')
+        ProductImage.objects.create(product=bare, image='products/second.jpg', order=2)
+        ProductImage.objects.create(product=bare, image='products/first.jpg', order=1)
+
+        response = self.client.get('/api/products/products/')
+        images = {item['slug']: item['primary_image'] for item in response.data['results']}
+        self.assertTrue(images['product-0'].endswith('products/0-a.jpg'))
+        self.assertTrue(images['no-primary'].endswith('products/first.jpg'))
+
+
+class EffectivePriceTests(CatalogTestMixin, TestCase):
+    def _product(self, slug, price, discount_price=None):
+        return self.create_product(slug, price=price, discount_price=discount_price)
+
+    def test_effective_price_follows_save_update_and_bulk_update(self):
+        product = self._product('p1', 1000, 800)
+        self.assertEqual(product.effective_price, 800)
+
+        product.discount_price = None
+        product.save(update_fields=['discount_price'])
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, 1000)
+
+        Product.objects.filter(pk=product.pk).update(discount_price=700)
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, 700)
+
+        Product.objects.filter(pk=product.pk).update(price=500, discount_price=0)
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, 500)
+
+        product.discount_price = 450
+        Product.objects.bulk_update([product], ['discount_price'])
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, 450)
+
+    def test_price_range_and_final_price_ordering(self):
+        self._product('cheap', 1000, 300)
+        self._product('middle', 600)
+        self._product('expensive', 5000, 4000)
+
+        response = APIClient().get('/api/products/products/', {
+            'min_price': 500, 'max_price': 5000, 'ordering': '-final_price'
+        })
+        self.assertEqual([item['slug'] for item in response.data['results']], ['expensive', 'middle'])
+
+
+class ProductSearchTests(CatalogTestMixin, TestCase):
+    def _product(self, slug, name, description='-'):
+        return self.create_product(slug, name=name, description=description)
+
+    def test_normalization_matches_arabic_letters_zwnj_and_digits(self):
+        from .search import tokenize
+        self.assertEqual(tokenize('كيف‌دستي ۱۲'), tokenize('کیفدستی 12'))
+
+    def test_search_ranks_and_records_results_count(self):
+        from apps.analytics.models import SearchQuery
+
+        self._product('rug', 'گلیم دستباف', description='گلیم قشقایی')
+        self._product('bag', 'کیف چرمی', description='مناسب برای گلیم')
+        self._product('cup', 'لیوان سفالی')
+
+        response = APIClient().get('/api/products/products/', {'search': 'گليم'})
+        self.assertEqual([item['slug'] for item in response.data['results']], ['rug', 'bag'])
+
+        recorded = SearchQuery.objects.get()
+        self.assertEqual(recorded.query, 'گليم')
+        self.assertEqual(recorded.results_count, 2)
+
+    def test_index_follows_product_updates(self):
+        product = self._product('vase', 'گلدان')
+        product.name = 'کوزه'
+        product.save()
+
+        response = APIClient().get('/api/products/products/', {'search': 'گلدان'})
+        self.assertEqual(response.data['count'], 0)
+        response = APIClient().get('/api/products/products/', {'search': 'کوزه'})
+        self.assertEqual(response.data['count'], 1)
+
+        update_products(Product.objects.filter(pk=product.pk), name='تنگ', description='سفالی')
+        response = APIClient().get('/api/products/products/', {'search': 'کوزه'})
+        self.assertEqual(response.data['count'], 0)
+        response = APIClient().get('/api/products/products/', {'search': 'تنگ سفالی'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_last_word_matches_as_prefix(self):
+        self._product('rug', 'گلیم دستباف')
+        self._product('vase', 'گلدان سفالی')
+
+        def slugs(query):
+            response = APIClient().get('/api/products/products/', {'search': query})
+            return sorted(item['slug'] for item in response.data['results'])
+
+        self.assertEqual(slugs('گل'), ['rug', 'vase'])
+        self.assertEqual(slugs('گلی'), ['rug'])
+        self.assertEqual(slugs('گلدان سفا'), ['vase'])
+        # فقط واژه آخر پیشوندی است
+        self.assertEqual(slugs('گل سفالی'), [])
+        self.assertEqual(slugs('گ'), [])
+
+
+class KeysetPaginationTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(7):
+            cls.create_product(f'product-{i}', name=f'محصول {i}')
+        # زمان ایجاد یکسان برای بررسی پایداری ترتیب با کلید اصلی
+        Product.objects.filter(slug__in=['product-2', 'product-3', 'product-4']).update(
+            created_at=Product.objects.get(slug='product-2').created_at
+        )
+
+    def test_cursor_walks_forward_and_backward_without_gaps(self):
+        client = APIClient()
+        url = '/api/products/products/new_arrivals/'
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('slug', flat=True))
+
+        pages, response = [], client.get(url, {'page_size': 3})
+        while True:
+            pages.append([item['slug'] for item in response.data['results']])
+            if not response.data['next']:
+                break
+            response = client.get(response.data['next'])
+
+        self.assertEqual(sum(pages, []), expected)
+        self.assertNotIn('count', response.data)
+
+        previous = client.get(response.data['previous'])
+        self.assertEqual([item['slug'] for item in previous.data['results']], pages[-2])
+
+    def test_invalid_cursor_returns_404(self):
+        response = APIClient().get('/api/products/products/new_arrivals/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductDetailCacheTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = cls.create_product('jar', name='کوزه')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = '/api/products/products/jar/'
+
+    def test_detail_is_served_from_cache(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        # فقط شمارنده بازدید از پایگاه داده خوانده می‌شود
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_child_and_product_changes_invalidate_cache(self):
+        self.client.get(self.url)
+        ProductQuestion.objects.create(product=self.product, user=self.user, question='جنس؟')
+        self.assertEqual(self.client.get(self.url).data['question_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_products(Product.objects.filter(pk=self.product.pk), price=2000)
+        self.assertEqual(self.client.get(self.url).data['price'], '2000')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_products(Product.objects.filter(pk=self.product.pk), is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_counter_updates_skip_catalog_side_effects(self):
+        # UPDATE موجودی رزروشده و فروش در مسیرهای پرتکرار فقط همان یک کوئری است
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as ctx:
+            Product.objects.filter(pk=self.product.pk).update(reserved_stock=1, sales_count=2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(callbacks, [])
+
+    def test_view_count_does_not_invalidate_cache(self):
+        from apps.analytics.view_buffer import flush_view_buffer
+
+        self.client.get(self.url)
+        self.client.post(f'{self.url}increment_view/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data['view_count'], 1)
+
+        flush_view_buffer()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data['view_count'], 1)
+
+
+class ProductSubResourceTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product, other = [cls.create_product(slug) for slug in ('rug', 'kilim')]
+        RelatedProduct.objects.create(product=cls.product, related_product=other)
+        for i in range(5):
+            ProductReview.objects.create(product=cls.product, user=create_user(), rating=5, comment=f'نظر {i}')
+        cls.question = ProductQuestion.objects.create(product=cls.product, user=cls.user, question='ابعاد؟')
+        ProductAnswer.objects.create(question=cls.question, user=cls.user, answer='۲ در ۳')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_detail_returns_counts_without_embedded_children(self):
+        data = self.client.get('/api/products/products/rug/').data
+        self.assertNotIn('reviews', data)
+        self.assertNotIn('questions', data)
+        self.assertEqual(data['question_count'], 1)
+        self.assertEqual(data['related_product_count'], 1)
+
+    def test_expand_inlines_bounded_previews(self):
+        data = self.client.get('/api/products/products/rug/', {'expand': 'reviews,related_products,unknown'}).data
+        self.assertEqual(len(data['reviews']), 3)
+        self.assertEqual(data['related_products'][0]['related_product']['slug'], 'kilim')
+        self.assertNotIn('questions', data)
+        self.assertNotIn('unknown', data)
+
+    def test_paginated_sub_resources(self):
+        response = self.client.get('/api/products/products/rug/reviews/', {'page_size': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get('/api/products/products/rug/questions/')
+        self.assertEqual(response.data['results'][0]['answers'][0]['answer'], '۲ در ۳')
+
+        response = self.client.get(f'/api/products/products/rug/questions/{self.question.id}/answers/')
+        self.assertEqual(response.data['count'], 1)
+
+        response = self.client.get('/api/products/products/rug/related/')
+        self.assertEqual(response.data['results'][0]['related_product']['slug'], 'kilim')
+
+
+class SparseFieldsetTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        product = cls.create_product('tray', name='سینی')
+        ProductImage.objects.create(product=product, image='products/tray.jpg', order=1)
+
+    def test_fields_and_omit_limit_output_and_queries(self):
+        client = APIClient()
+        url = '/api/products/products/tray/'
+        with CaptureQueriesContext(connection) as full:
+            client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, {'fields': 'slug,price,tags'})
+        self.assertEqual(set(response.data), {'slug', 'price', 'tags'})
+        self.assertLess(len(ctx.captured_queries), len(full.captured_queries))
+
+        response = client.get(url, {'omit': 'images,variants,seller'})
+        self.assertNotIn('images', response.data)
+        self.assertIn('attributes', response.data)
+
+        response = client.get('/api/products/products/', {'fields': 'slug'})
+        self.assertEqual(list(response.data['results'][0]), ['slug'])
+
+
+class CatalogImportExportTests(CatalogTestMixin, TestCase):
+    category_slug = 'pottery'
+
+    @classmethod
+    def setUpTestData(cls):
+        from apps.categories.models import CategoryAttribute
+
+        super().setUpTestData()
+        CategoryAttribute.objects.create(category=cls.category, name='جنس', slug='material')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller.user)
+
+    def _upload(self, name, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post('/api/products/products/bulk_import/', {'file': upload}, format='multipart')
+
+    def test_csv_import_upserts_by_sku_and_reports_row_errors(self):
+        csv_content = (
+            'sku,category,name,description,price,discount_price,attributes,tags,variants\n'
+            'A1,pottery,کاسه,-,1000,800,"{""جنس"": ""سفال""}","دستساز,سفالی",'
+            '"[{""name"": ""کوچک"", ""sku"": ""A1-S"", ""stock"": 3}]"\n'
+            'A2,unknown,بشقاب,-,500,,,,\n'
+            'A3,pottery,لیوان,-,abc,,,,\n'
+        )
+        report = self._upload('catalog.csv', csv_content).data
+        self.assertEqual((report['created'], report['updated'], report['error_count']), (1, 0, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+
+        product = Product.objects.get(sku='A1')
+        self.assertEqual(product.effective_price, 800)
+        self.assertEqual(product.attributes.get().value, 'سفال')
+        self.assertEqual(product.variants.get().stock, 3)
+        self.assertEqual(sorted(product.tags.values_list('tag__name', flat=True)), ['دستساز', 'سفالی'])
+
+        jsonl_content = '{"sku": "A1", "category": "pottery", "name": "کاسه بزرگ", "description": "-", ' \
+                        '"price": 1200, "tags": ["سفالی"], "variants": [{"name": "کوچک", "sku": "A1-S", "stock": 7}]}\n'
+        report = self._upload('catalog.jsonl', jsonl_content).data
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        product.refresh_from_db()
+        # ستون تخفیف در فایل دوم نیست و تخفیف قبلی حفظ می‌شود
+        self.assertEqual((product.name, product.price, product.effective_price), ('کاسه بزرگ', 1200, 800))
+        self.assertEqual(product.variants.get().stock, 7)
+        self.assertEqual(list(product.tags.values_list('tag__name', flat=True)), ['سفالی'])
+
+    def test_reimport_keeps_missing_columns_and_logs_stock_changes(self):
+        from .models import ProductInventoryLog
+
+        row = '{"sku": "C1", "category": "pottery", "name": "تنگ", "description": "-", "price": 1000%s}\n'
+        self._upload('catalog.jsonl', row % ', "discount_price": 800, "stock": 5, "is_active": false')
+        product = Product.objects.get(sku='C1')
+        self.assertEqual(list(product.inventory_logs.values_list('previous_stock', 'new_stock')), [(0, 5)])
+
+        report = self._upload('catalog.jsonl', row % '').data
+        self.assertEqual((report['updated'], report['error_count']), (1, 0))
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.discount_price, product.is_active), (5, 800, False))
+
+        Product.objects.filter(pk=product.pk).update(reserved_stock=4)
+        report = self._upload('catalog.jsonl', row % ', "stock": 3').data
+        self.assertEqual((report['updated'], report['error_count']), (0, 1))
+        self.assertIn('stock', report['errors'][0]['errors'])
+
+        self._upload('catalog.jsonl', row % ', "stock": 9')
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 9)
+        self.assertEqual(ProductInventoryLog.objects.filter(product=product).count(), 2)
+
+    def test_rows_for_existing_skus_are_partial(self):
+        self._upload('catalog.jsonl', '{"sku": "D1", "category": "pottery", "name": "سینی", '
+                                      '"description": "-", "price": 1000, "discount_price": 900}\n')
+        report = self._upload('prices.csv', 'sku,price\nD1,1500\nD2,700\n').data
+        self.assertEqual((report['updated'], report['error_count']), (1, 1))
+        self.assertEqual(set(report['errors'][0]['errors']), {'category', 'name', 'description'})
+
+        report = self._upload('stock.jsonl', '{"sku": "D1", "stock": 4}\n{"sku": "D1x", "stock": 4}\n').data
+        self.assertEqual((report['created'], report['updated'], report['error_count']), (0, 1, 1))
+        report = self._upload('discounts.jsonl', '{"sku": "D1", "discount_price": 1500}\n').data
+        self.assertIn('discount_price', report['errors'][0]['errors'])
+
+        product = Product.objects.get(sku='D1')
+        self.assertEqual((product.name, product.price, product.effective_price, product.stock), ('سینی', 1500, 900, 4))
+
+    def test_export_streams_reimportable_catalog(self):
+        self._upload('catalog.jsonl', '{"sku": "B1", "category": "pottery", "name": "گلدان", '
+                                      '"description": "-", "price": 900, "attributes": {"material": "گل"}}\n')
+        response = self.client.get('/api/products/products/export/', {'file_format': 'csv'})
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+
+        report = self._upload('export.csv', content).data
+        self.assertEqual((report['created'], report['updated'], report['error_count']), (0, 1, 0))
+        self.assertEqual(Product.objects.get(sku='B1').attributes.get().value, 'گل')
+
+
+class RelatedProductRecommendationTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.common.testing import create_address, create_shipping_method
+        from apps.orders.models import Order, OrderItem, OrderStatus
+
+        super().setUpTestData()
+        user, seller = cls.user, cls.seller
+        cls.products = {
+            slug: cls.create_product(slug, is_active=slug != 'hidden')
+            for slug in ('teapot', 'cup', 'saucer', 'rug', 'hidden')
+        }
+        address = create_address(user)
+        method = create_shipping_method(cost=0)
+        baskets = [
+            ('teapot', 'cup', 'hidden'), ('teapot', 'cup'), ('teapot', 'cup', 'saucer'), ('teapot', 'saucer', 'rug'),
+        ]
+        for number, basket in enumerate(baskets):
+            order = Order.objects.create(
+                user=user, order_number=f'ORD{number}', status=OrderStatus.PAID, total_price=0,
+                final_price=0, shipping_address=address, shipping_method=method, payment_method='online'
+            )
+            for slug in basket:
+                OrderItem.objects.create(
+                    order=order, product=cls.products[slug], seller=seller, product_name=slug,
+                    quantity=1, unit_price=1000, final_price=1000, total_price=1000
+                )
+        RelatedProduct.objects.create(product=cls.products['teapot'], related_product=cls.products['rug'])
+
+    def test_rebuild_ranks_co_purchased_products_and_keeps_pins(self):
+        from .recommendations import rebuild_related_products
+
+        rebuild_related_products()
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as ctx:
+            rebuild_related_products()
+        # روابط قدیمی بدون بارگذاری ردیف‌ها حذف و کش جزئیات یک بار نامعتبر می‌شود
+        selects = [
+            query for query in ctx.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "products_relatedproduct"' in query['sql']
+        ]
+        self.assertEqual(len(selects), 2)
+        self.assertEqual(len(callbacks), 1)
+        related = list(RelatedProduct.objects.filter(product=self.products['teapot']).values_list(
+            'related_product__slug', 'is_pinned'
+        ))
+        # سنجاق دستی اول، سپس همسایه‌ها به ترتیب شباهت؛ محصول غیرفعال حذف می‌شود
+        self.assertEqual(related, [('rug', True), ('cup', False), ('saucer', False)])
+        self.assertFalse(RelatedProduct.objects.filter(related_product=self.products['hidden']).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductFacetTests(CatalogTestMixin, TestCase):
+    category_slug = 'pottery'
+
+    @classmethod
+    def setUpTestData(cls):
+        from apps.categories.models import CategoryAttribute
+
+        super().setUpTestData()
+        cls.material = CategoryAttribute.objects.create(
+            category=cls.category, name='جنس', slug='material', is_filter=True
+        )
+        cls.color = CategoryAttribute.objects.create(
+            category=cls.category, name='رنگ', slug='color', is_filter=True, order=1
+        )
+        rows = [
+            ('bowl', 'سفال', 'آبی'), ('plate', 'سفال', 'قرمز'), ('vase', 'سرامیک', 'آبی'), ('jar', 'سرامیک', 'سبز'),
+        ]
+        for slug, material, color in rows:
+            product = cls.create_product(slug)
+            ProductAttribute.objects.create(product=product, attribute=cls.material, value=material)
+            ProductAttribute.objects.create(product=product, attribute=cls.color, value=color)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def _list(self, **params):
+        return self.client.get('/api/products/products/', {'category': self.category.id, 'facets': 'true', **params}).data
+
+    def _counts(self, data):
+        return {
+            facet['attribute']: {value['value']: value['count'] for value in facet['values']}
+            for facet in data['facets']
+        }
+
+    def test_filters_and_counts_from_index(self):
+        data = self._list()
+        self.assertEqual(self._counts(data), {
+            'material': {'سفال': 2, 'سرامیک': 2},
+            'color': {'آبی': 2, 'قرمز': 1, 'سبز': 1},
+        })
+
+        data = self._list(attr_material='سفال', attr_color='آبی,سبز')
+        self.assertEqual([product['slug'] for product in data['results']], ['bowl'])
+        # هر ویژگی با فیلتر سایر ویژگی‌ها شمرده می‌شود و مقادیر انتخاب‌شده حذف نمی‌شوند
+        self.assertEqual(self._counts(data), {
+            'material': {'سفال': 1, 'سرامیک': 2},
+            'color': {'آبی': 1, 'قرمز': 1, 'سبز': 0},
+        })
+
+        data = self._list(attr_color='آبی', search='vase')
+        self.assertEqual(self._counts(data)['material'], {'سرامیک': 1})
+
+    def test_index_is_updated_incrementally(self):
+        self._list()
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductAttribute.objects.filter(product__slug='jar', attribute=self.color).update(value='آبی')
+            ProductAttribute.objects.get(product__slug='jar', attribute=self.color).save()
+            update_products(Product.objects.filter(slug='plate'), is_active=False)
+            other = Category.objects.create(name='دیگر', slug='other')
+            vase = Product.objects.get(slug='vase')
+            vase.category = other
+            vase.save()
+
+        with self.assertNumQueries(4):
+            # اعتبارسنجی دسته‌بندی، COUNT، صفحه و تصویر شاخص؛ ایندکس از کش خوانده می‌شود
+            data = self._list(attr_color='آبی')
+        self.assertEqual(sorted(product['slug'] for product in data['results']), ['bowl', 'jar'])
+        self.assertEqual(self._counts(data), {
+            'material': {'سفال': 1, 'سرامیک': 1},
+            'color': {'آبی': 2},
+        })
+
+    def test_updates_rewrite_changed_values_only(self):
+        from .facets import FacetIndex, _index_key, get_facet_index
+
+        get_facet_index(self.category.id)
+        meta = cache.get(_index_key(self.category.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            vase = Product.objects.get(slug='vase')
+            vase.category = Category.objects.create(name='دیگر', slug='other')
+            vase.save()
+
+        # همان نسخه به‌روز شده است؛ بیت محصول منتقل‌شده تا ساخت دوباره می‌ماند
+        self.assertEqual(cache.get(_index_key(self.category.id))['generation'], meta['generation'])
+        index = get_facet_index(self.category.id)
+        self.assertEqual((index.all.bit_count(), index.dead_bits), (3, 1))
+        self.assertEqual(index.counts(index.all, {})[0]['values'], [
+            {'value': 'سفال', 'count': 2, 'selected': False}, {'value': 'سرامیک', 'count': 1, 'selected': False},
+        ])
+        self.assertEqual(FacetIndex.build(self.category.id).dead_bits, 0)
+
+    def test_large_matches_filter_in_sql_and_rollbacks_drop_updates(self):
+        from django.db import transaction
+        from .facets import ProductFacetFilter, get_facet_index
+
+        index = get_facet_index(self.category.id)
+        selected = {'material': ['سفال', 'سرامیک'], 'color': ['آبی']}
+        keys = {slug: index.selected_keys(slug, values) for slug, values in selected.items()}
+        filtered = ProductFacetFilter().filter_by_values(Product.objects.all(), self.category.id, keys)
+        expected = Product.objects.filter(pk__in=index.product_ids(index.match(selected)))
+        self.assertEqual(sorted(filtered.values_list('slug', flat=True)), sorted(expected.values_list('slug', flat=True)))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    update_products(Product.objects.filter(slug='plate'), is_active=False)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+
+
+class ImageDerivativeTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = cls.create_product('rug')
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        storage_settings = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=media_root
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+    def _upload(self, size):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, format='PNG')
+        return SimpleUploadedFile('rug.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_queues_pipeline_and_list_returns_srcset(self):
+        from apps.common.images import process_image
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            image = ProductImage.objects.create(product=self.product, image=self._upload((800, 400)), is_primary=True)
+        self.assertEqual(len(callbacks), 1)
+
+        self.assertTrue(process_image('products.ProductImage', image.pk))
+        image.refresh_from_db()
+        self.assertEqual((image.derivatives['width'], image.derivatives['height']), (800, 400))
+        self.assertEqual(
+            sorted((variant['format'], variant['width'], variant['height']) for variant in image.derivatives['variants']),
+            [('jpg', 160, 80), ('jpg', 320, 160), ('jpg', 640, 320),
+             ('webp', 160, 80), ('webp', 320, 160), ('webp', 640, 320)],
+        )
+        # پردازش دوباره همان فایل کاری انجام نمی‌دهد
+        self.assertFalse(process_image('products.ProductImage', image.pk))
+
+        product = APIClient().get('/api/products/products/').data['results'][0]
+        self.assertTrue(product['primary_image'].endswith('rug_640w.jpg'))
+        self.assertEqual(
+            [entry.split()[-1] for entry in product['primary_image_srcset'].split(', ')], ['160w', '320w', '640w']
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InventoryLedgerTests(CatalogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from apps.shipping.models import Warehouse
+        from .models import ProductVariant
+
+        super().setUpTestData()
+        cls.product = cls.create_product('bowl', name='کاسه', price=100, stock=5)
+        cls.variant = ProductVariant.objects.create(product=cls.product, name='سبز', stock=2)
+        cls.warehouses = [
+            Warehouse.objects.create(
+                name=name, address='-', province='تهران', city='تهران', postal_code='1234567890', phone='021'
+            ) for name in ('مرکزی', 'شرق')
+        ]
+
+    def test_batch_is_applied_and_logged(self):
+        from .inventory import StockMovement, apply_movements
+        from .models import ProductInventoryLog
+
+        central, east = self.warehouses
+        levels = apply_movements([
+            StockMovement(self.product.pk, delta=-3, reason='فروش'),
+            StockMovement(self.variant.product_id, self.variant.pk, delta=4, reason='ورود'),
+            StockMovement(self.product.pk, None, str(central.pk), 6, 'ورود', 'R-1'),
+            StockMovement(self.product.pk, None, central.pk, -2, 'انتقال', 'T-1'),
+            StockMovement(self.product.pk, None, east.pk, 2, 'دریافت', 'T-1'),
+        ])
+
+        self.assertEqual(levels, {
+            (self.product.pk, None, None): 2,
+            (self.product.pk, self.variant.pk, None): 6,
+            (self.product.pk, None, central.pk): 4,
+            (self.product.pk, None, east.pk): 2,
+        })
+        self.assertEqual(
+            list(ProductInventoryLog.objects.filter(warehouse=central).order_by('new_stock').values_list(
+                'previous_stock', 'new_stock'
+            )), [(6, 4), (0, 6)]
+        )
+        self.assertEqual(ProductInventoryLog.objects.count(), 5)
+
+    def test_negative_stock_rejects_whole_batch(self):
+        from .inventory import NegativeStock, StockMovement, apply_movements
+        from .models import ProductInventoryLog
+
+        with self.assertRaises(NegativeStock) as raised:
+            apply_movements([
+                StockMovement(self.product.pk, delta=-1, reason='فروش'),
+                StockMovement(self.product.pk, self.variant.pk, delta=-3, reason='فروش'),
+            ])
+        self.assertEqual(raised.exception.keys, [(self.product.pk, self.variant.pk, None)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(ProductInventoryLog.objects.exists())
+
+    def test_query_count_is_constant_in_batch_size(self):
+        from .inventory import StockMovement, apply_movements
+
+        counts = set()
+        for size in (1, 10):
+            movements = [StockMovement(self.product.pk, delta=-1, reason='فروش')] + [
+                StockMovement(self.product.pk, None, self.warehouses[number % 2].pk, 1, 'ورود')
+                for number in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                apply_movements(movements)
+            counts.add(len(queries))
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_inventory_endpoint_requires_product_seller(self):
+        from .models import ProductInventoryLog
+
+        url = '/api/products/products/bowl/update_inventory/'
+        self.assertIn(APIClient().post(url, {'stock': 50}).status_code, (401, 403))
+
+        client = APIClient()
+        client.force_authenticate(create_user())
+        self.assertEqual(client.post(url, {'stock': 50}).status_code, 403)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(ProductInventoryLog.objects.exists())
+
+        client.force_authenticate(self.product.seller.user)
+        self.assertEqual(client.post(url, {'stock': 7}).status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
@@ -1,22 +1,39 @@
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from django.db.models import Q, F, Avg, Count, Sum
 from django.db.transaction import atomic
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 import uuid
 
 from .models import (
     Product, ProductImage, ProductAttribute, ProductVariant, ProductVariantAttribute,
     ProductTag, ProductTagRelation, ProductReview, ProductReviewImage, ProductReviewComment,
-    ProductQuestion, ProductAnswer, RelatedProduct, ProductInventoryLog
+    ProductQuestion, ProductAnswer, RelatedProduct, ProductInventoryLog, cover_images_prefetch
 )
 from .serializers import (
     ProductListSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer,
     ProductReviewSerializer, ProductReviewCommentSerializer, ProductQuestionSerializer,
-    ProductAnswerSerializer, ProductInventoryLogSerializer, ProductTagSerializer
+    ProductAnswerSerializer, ProductInventoryLogSerializer, ProductTagSerializer,
+    RelatedProductSerializer
 )
+from .catalog import (
+    SYNC_IMPORT_MAX_SIZE, CatalogError, detect_format, export_catalog, import_catalog, queue_catalog_import
+)
+from .cache import (
+    bump_detail_version, get_cached_detail, get_detail_version, live_detail_fields, set_cached_detail
+)
+from .search import ProductSearchFilter
+from .facets import ATTRIBUTE_PARAM_PREFIX, ProductFacetFilter, get_facet_index, get_selected_attributes
+from .inventory import StockMovement, apply_movements
+from apps.analytics.view_buffer import increment_view_count, pending_view_count
+from apps.categories.models import Category
+from apps.common.pagination import KeysetPagination
+from apps.common.serializers import get_sparse_fieldset, is_field_requested, prefetch_requested
 from apps.sellers.permissions import IsSellerOwner, IsAdminUser
 
 
@@ -47,20 +64,37 @@ class IsProductSellerOrAdmin(permissions.BasePermission):
         return False
 
 
+class ProductOrderingFilter(filters.OrderingFilter):
+    """
+    مرتب‌سازی بر اساس final_price روی ستون ذخیره‌شده effective_price انجام می‌شود
+    """
+    aliases = {'final_price': 'effective_price'}
+    
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = [
+            ('-' if term.startswith('-') else '') + self.aliases.get(term.lstrip('-'), term.lstrip('-'))
+            for term in fields
+        ]
+        return super().remove_invalid_fields(queryset, fields, view, request)
+
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductListSerializer
     lookup_field = 'slug'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductFacetFilter, ProductOrderingFilter]
     filterset_fields = ['category', 'seller', 'is_featured', 'is_active']
-    search_fields = ['name', 'description', 'short_description', 'sku', 'meta_keywords']
-    ordering_fields = ['created_at', 'price', 'rating', 'sales_count', 'view_count']
+    ordering_fields = ['created_at', 'price', 'effective_price', 'rating', 'sales_count', 'view_count']
     
     def get_permissions(self):
         if self.action in ['create']:
             return [permissions.IsAuthenticated(), IsSellerOwner()]
         elif self.action in ['update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsProductSellerOrReadOnly()]
+        elif self.action in ['related_products', 'update_inventory']:
+            return [permissions.IsAuthenticated(), IsProductSellerOrAdmin()]
+        elif self.action in ['bulk_import', 'export']:
+            return [permissions.IsAuthenticated(), IsSellerOwner()]
         elif self.action in ['admin_approve', 'admin_feature']:
             return [permissions.IsAuthenticated(), IsAdminUser()]
         return [permissions.AllowAny()]
@@ -72,25 +106,71 @@ class ProductViewSet(viewsets.ModelViewSet):
             return ProductCreateUpdateSerializer
         return ProductListSerializer
     
+    # اکشن‌هایی که خروجی آن‌ها با ProductListSerializer ساخته می‌شود
+    list_actions = ['list', 'featured', 'best_selling', 'new_arrivals', 'discounted', 'my_products']
+    
+    # زیرمنابع جزئیات محصول؛ به صورت صفحه‌بندی‌شده زیر /products/{slug}/ و با پارامتر
+    # expand به صورت پیش‌نمایش محدود در خود جزئیات ارائه می‌شوند
+    expandable = {
+        'reviews': ProductReviewSerializer,
+        'questions': ProductQuestionSerializer,
+        'related_products': RelatedProductSerializer,
+    }
+    expand_query_param = 'expand'
+    expand_preview_size = 3
+    sub_resource_actions = ['reviews', 'questions', 'question_answers', 'related']
+    
+    # prefetchهای جزئیات محصول به تفکیک فیلد؛ فقط برای فیلدهای درخواستی (?fields=/?omit=) اعمال می‌شوند
+    detail_prefetches = {
+        'seller': ['select:seller__user'],
+        'category': ['select:category'],
+        'images': ['images'],
+        'attributes': ['attributes__attribute'],
+        'variants': ['variants__attributes__attribute'],
+        'tags': ['tags__tag'],
+    }
+    
     def get_queryset(self):
         queryset = Product.objects.all()
         
-        if self.action in ['list', 'retrieve']:
+        if self.action in self.list_actions:
+            queryset = queryset.for_list()
+        
+        if self.action == 'retrieve':
+            queryset = prefetch_requested(queryset, self.request, self.detail_prefetches)
+            if is_field_requested(self.request, 'question_count'):
+                queryset = queryset.annotate(question_count=Count('questions', distinct=True))
+            if is_field_requested(self.request, 'related_product_count'):
+                queryset = queryset.annotate(
+                    related_product_count=Count('related_products', distinct=True)
+                )
+        
+        if self.action in ['list', 'retrieve', *self.sub_resource_actions]:
             # فقط محصولات فعال و تایید شده را به کاربران عادی نمایش می‌دهیم
             if not self.request.user.is_staff and not hasattr(self.request.user, 'seller'):
                 queryset = queryset.filter(is_active=True, is_approved=True)
         
-        # فیلتر بر اساس قیمت
+        # فیلتر بر اساس قیمت نهایی (ستون ایندکس‌شده effective_price)
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         
         if min_price:
-            queryset = queryset.filter(Q(discount_price__gte=min_price) | 
-                                      (Q(discount_price__isnull=True) & Q(price__gte=min_price)))
+            queryset = queryset.filter(effective_price__gte=min_price)
         
         if max_price:
-            queryset = queryset.filter(Q(discount_price__lte=max_price) | 
-                                      (Q(discount_price__isnull=True) & Q(price__lte=max_price)))
+            queryset = queryset.filter(effective_price__lte=max_price)
+        
+        # محصولات کل زیردرخت یک دسته با بازه MPTT (lft/rght)
+        category_slug = self.request.query_params.get('category_slug')
+        if category_slug:
+            node = Category.objects.filter(slug=category_slug).values('tree_id', 'lft', 'rght').first()
+            if node is None:
+                return queryset.none()
+            queryset = queryset.filter(
+                category__tree_id=node['tree_id'],
+                category__lft__gte=node['lft'],
+                category__rght__lte=node['rght'],
+            )
         
         # فیلتر بر اساس برچسب
         tag = self.request.query_params.get('tag')
@@ -104,14 +184,155 @@ class ProductViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    # پارامترهایی که مجموعه محصولات پایه شمارش فست‌ها را تغییر نمی‌دهند
+    facet_neutral_params = {'category', 'facets', 'page', 'page_size', 'ordering', 'fields', 'omit'}
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        
+        query = ProductSearchFilter().get_search_query(request)
+        if query and self.paginator is not None and getattr(self.paginator, 'page', None) is not None:
+            # تعداد نتایج از همان COUNT صفحه‌بندی خوانده می‌شود
+            self._record_search_query(request, query, self.paginator.page.paginator.count)
+        
+        category_id = request.query_params.get('category')
+        if category_id and request.query_params.get('facets') == 'true':
+            response.data['facets'] = self.get_facets(category_id)
+        
+        return response
+    
+    def get_facets(self, category_id):
+        """
+        تعداد محصولات هر مقدار ویژگی‌های قابل فیلتر دسته‌بندی از ایندکس فست
+        
+        فیلترهای دیگر (جستجو، قیمت، برچسب و ...) فقط در صورت وجود با یک کوئری شناسه
+        محصولات در مجموعه پایه اعمال می‌شوند.
+        """
+        index = get_facet_index(category_id)
+        user = self.request.user
+        base = index.all if user.is_staff or hasattr(user, 'seller') else index.visible
+        if any(
+            param not in self.facet_neutral_params and not param.startswith(ATTRIBUTE_PARAM_PREFIX)
+            for param in self.request.query_params
+        ):
+            queryset = self.get_queryset()
+            for backend in self.filter_backends:
+                if backend is not ProductFacetFilter:
+                    queryset = backend().filter_queryset(self.request, queryset, self)
+            base &= index.mask_for(queryset.order_by().values_list('pk', flat=True))
+        return index.counts(base, get_selected_attributes(self.request))
+    
+    def retrieve(self, request, *args, **kwargs):
+        # خروجی جزئیات برای کاربران عادی یکسان است و از کش نسخه‌دار خوانده می‌شود؛
+        # کارمندان و فروشندگان محصولات منتشرنشده را هم می‌بینند و از کش استفاده نمی‌کنند
+        cacheable = not request.user.is_staff and not hasattr(request.user, 'seller')
+        slug = kwargs[self.lookup_field]
+        expand = self.get_expand()
+        fields, omit = get_sparse_fieldset(request)
+        variant = '|'.join(
+            ','.join(sorted(names or ())) for names in (expand, fields, omit)
+        )
+        if cacheable:
+            cached = get_cached_detail(slug, variant)
+            if cached is not None:
+                product_id, data = cached
+                data.update(live_detail_fields(product_id, data))
+                return Response(self._with_pending_views(product_id, data))
+        
+        instance = self.get_object()
+        version = get_detail_version(instance.pk)
+        data = self.get_serializer(instance).data
+        for name in expand:
+            preview = self.get_sub_resource_queryset(instance, name)[:self.expand_preview_size]
+            data[name] = self.expandable[name](
+                preview, many=True, context=self.get_serializer_context()
+            ).data
+        if cacheable:
+            set_cached_detail(slug, instance.pk, version, data, variant)
+        return Response(self._with_pending_views(instance.pk, data))
+    
+    def _with_pending_views(self, product_id, data):
+        # بازدیدهای بافرشده که هنوز در view_count اعمال نشده‌اند
+        if 'view_count' in data:
+            data['view_count'] += pending_view_count(product_id)
+        return data
+    
+    def get_expand(self):
+        requested = self.request.query_params.get(self.expand_query_param, '')
+        return sorted({name.strip() for name in requested.split(',')} & set(self.expandable))
+    
+    def get_sub_resource_queryset(self, product, name):
+        if name == 'reviews':
+            return product.reviews.select_related('user').prefetch_related(
+                'images', 'comments__user'
+            ).order_by('-created_at')
+        if name == 'questions':
+            return product.questions.select_related('user').prefetch_related(
+                'answers__user'
+            ).order_by('-created_at')
+        return product.related_products.select_related(
+            'related_product__seller', 'related_product__category'
+        ).prefetch_related(cover_images_prefetch('related_product__images')).order_by('-is_pinned', '-score', 'id')
+    
+    def _paginated_response(self, queryset, serializer_class):
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = serializer_class(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = serializer_class(queryset, many=True, context=context)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def reviews(self, request, slug=None):
+        product = self.get_object()
+        return self._paginated_response(
+            self.get_sub_resource_queryset(product, 'reviews'), ProductReviewSerializer
+        )
+    
+    @action(detail=True, methods=['get'])
+    def questions(self, request, slug=None):
+        product = self.get_object()
+        return self._paginated_response(
+            self.get_sub_resource_queryset(product, 'questions'), ProductQuestionSerializer
+        )
+    
+    @action(detail=True, methods=['get'], url_path=r'questions/(?P<question_id>[^/.]+)/answers')
+    def question_answers(self, request, slug=None, question_id=None):
+        product = self.get_object()
+        question = get_object_or_404(ProductQuestion, id=question_id, product=product)
+        return self._paginated_response(
+            question.answers.select_related('user').order_by('created_at'), ProductAnswerSerializer
+        )
+    
+    @action(detail=True, methods=['get'])
+    def related(self, request, slug=None):
+        product = self.get_object()
+        return self._paginated_response(
+            self.get_sub_resource_queryset(product, 'related_products'), RelatedProductSerializer
+        )
+    
+    def _record_search_query(self, request, query, results_count):
+        from apps.analytics.models import SearchQuery
+        SearchQuery.objects.create(
+            query=query[:255],
+            user=request.user if request.user.is_authenticated else None,
+            session_id=request.session.session_key or 'anonymous',
+            results_count=results_count,
+            category_id=request.query_params.get('category') or None
+        )
+    
     def perform_create(self, serializer):
         serializer.save(seller=self.request.user.seller, is_approved=False)
     
     @action(detail=True, methods=['post'])
     def increment_view(self, request, slug=None):
-        product = self.get_object()
-        product.view_count = F('view_count') + 1
-        product.save(update_fields=['view_count'])
+        # بدون قفل ردیف محصول؛ افزایش در بافر جمع و به صورت دوره‌ای اعمال می‌شود
+        product_id = self.get_queryset().filter(slug=slug).values_list('pk', flat=True).first()
+        if product_id is None:
+            raise Http404
+        increment_view_count(product_id)
         return Response({'status': 'view count incremented'})
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
@@ -202,68 +423,60 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsProductSellerOrAdmin])
     def update_inventory(self, request, slug=None):
         product = self.get_object()
-        new_stock = request.data.get('stock')
         variant_id = request.data.get('variant_id')
         change_reason = request.data.get('change_reason', 'بروزرسانی دستی')
+        try:
+            new_stock = int(request.data.get('stock'))
+        except (TypeError, ValueError):
+            new_stock = -1
+        if new_stock < 0:
+            return Response(
+                {'error': 'موجودی باید عدد نامنفی باشد'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         with atomic():
+            # موجودی فعلی قفل می‌شود تا تفاضل ثبت‌شده در دفتر موجودی دقیق باشد
             if variant_id:
-                try:
-                    variant = ProductVariant.objects.get(id=variant_id, product=product)
-                    previous_stock = variant.stock
-                    variant.stock = new_stock
-                    variant.save()
-                    
-                    # ثبت لاگ تغییر موجودی
-                    ProductInventoryLog.objects.create(
-                        product=product,
-                        variant=variant,
-                        previous_stock=previous_stock,
-                        new_stock=new_stock,
-                        change_reason=change_reason,
-                        created_by=request.user
-                    )
-                    
-                    return Response({'status': 'موجودی تنوع به‌روزرسانی شد'})
-                except ProductVariant.DoesNotExist:
+                previous_stock = ProductVariant.objects.select_for_update().filter(
+                    id=variant_id, product=product
+                ).values_list('stock', flat=True).first()
+                if previous_stock is None:
                     return Response(
                         {'error': 'تنوع مورد نظر یافت نشد'},
                         status=status.HTTP_404_NOT_FOUND
                     )
             else:
-                previous_stock = product.stock
-                product.stock = new_stock
-                product.save()
-                
-                # ثبت لاگ تغییر موجودی
-                ProductInventoryLog.objects.create(
-                    product=product,
-                    previous_stock=previous_stock,
-                    new_stock=new_stock,
-                    change_reason=change_reason,
-                    created_by=request.user
-                )
-                
-                return Response({'status': 'موجودی محصول به‌روزرسانی شد'})
+                previous_stock = Product.objects.select_for_update().filter(
+                    pk=product.pk
+                ).values_list('stock', flat=True).get()
+            
+            apply_movements([StockMovement(
+                product.pk, variant_id or None, delta=new_stock - previous_stock, reason=change_reason
+            )], user=request.user)
+        
+        if variant_id:
+            return Response({'status': 'موجودی تنوع به‌روزرسانی شد'})
+        return Response({'status': 'موجودی محصول به‌روزرسانی شد'})
     
     @action(detail=True, methods=['post'], permission_classes=[IsProductSellerOrAdmin])
     def related_products(self, request, slug=None):
         product = self.get_object()
         related_product_ids = request.data.get('related_product_ids', [])
+        related_ids = list(
+            Product.objects.filter(id__in=related_product_ids).exclude(pk=product.pk).values_list('pk', flat=True)
+        )
         
-        # حذف روابط قبلی
-        RelatedProduct.objects.filter(product=product).delete()
-        
-        # ایجاد روابط جدید
-        for related_id in related_product_ids:
-            try:
-                related_product = Product.objects.get(id=related_id)
-                RelatedProduct.objects.create(
-                    product=product,
-                    related_product=related_product
-                )
-            except Product.DoesNotExist:
-                pass
+        # موارد دستی به عنوان سنجاق ذخیره می‌شوند و روابط محاسبه‌شده دیگر دست نمی‌خورند
+        with atomic():
+            RelatedProduct.objects.filter(product=product).filter(
+                Q(is_pinned=True) | Q(related_product_id__in=related_ids)
+            ).delete()
+            RelatedProduct.objects.bulk_create([
+                RelatedProduct(product=product, related_product_id=related_id, is_pinned=True)
+                for related_id in related_ids
+            ])
+        bump_detail_version(product.pk)
         
         return Response({'status': 'محصولات مرتبط به‌روزرسانی شدند'})
     
@@ -283,7 +496,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def featured(self, request):
-        featured_products = Product.objects.filter(is_featured=True, is_active=True, is_approved=True)
+        featured_products = Product.objects.for_list().filter(is_featured=True, is_active=True, is_approved=True)
         page = self.paginate_queryset(featured_products)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -292,9 +505,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(featured_products, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def best_selling(self, request):
-        best_selling = Product.objects.filter(is_active=True, is_approved=True).order_by('-sales_count')
+        best_selling = Product.objects.for_list().filter(is_active=True, is_approved=True).order_by('-sales_count')
         page = self.paginate_queryset(best_selling)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -303,9 +516,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(best_selling, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=KeysetPagination)
     def new_arrivals(self, request):
-        new_arrivals = Product.objects.filter(is_active=True, is_approved=True).order_by('-created_at')
+        new_arrivals = Product.objects.for_list().filter(is_active=True, is_approved=True).order_by('-created_at')
         page = self.paginate_queryset(new_arrivals)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -316,7 +529,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def discounted(self, request):
-        discounted = Product.objects.filter(
+        discounted = Product.objects.for_list().filter(
             is_active=True, is_approved=True, discount_price__isnull=False
         ).exclude(discount_price=0)
         
@@ -328,9 +541,43 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(discounted, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """ورود گروهی کاتالوگ از فایل csv، jsonl یا xlsx با کلید sku"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'فایل کاتالوگ ارسال نشده است'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            file_format = detect_format(upload.name)
+            if upload.size > SYNC_IMPORT_MAX_SIZE and queue_catalog_import(request.user.seller, upload, file_format):
+                return Response(
+                    {'status': 'فایل در صف ورود قرار گرفت؛ نتیجه به صورت اعلان ارسال می‌شود'},
+                    status=status.HTTP_202_ACCEPTED
+                )
+            report = import_catalog(request.user.seller, upload, file_format)
+        except CatalogError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """خروجی جریانی کاتالوگ فروشنده در قالب csv یا jsonl"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in ('csv', 'jsonl'):
+            return Response({'error': 'قالب خروجی باید csv یا jsonl باشد'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        products = Product.objects.filter(seller=request.user.seller)
+        response = StreamingHttpResponse(
+            export_catalog(products, file_format),
+            content_type='text/csv; charset=utf-8' if file_format == 'csv' else 'application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
+    
     @action(detail=False, methods=['get'], permission_classes=[IsSellerOwner])
     def my_products(self, request):
-        products = Product.objects.filter(seller=request.user.seller)
+        products = Product.objects.for_list().filter(seller=request.user.seller)
         page = self.paginate_queryset(products)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -5,9 +5,10 @@ from .models import (
     Seller, SellerCategory, SellerReview, TieredCommission, SellerWithdrawal
 )
 from apps.categories.serializers import CategoryListSerializer
+from apps.common.serializers import SparseFieldsetMixin
 
 
-class SellerListSerializer(serializers.ModelSerializer):
+class SellerListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_full_name = serializers.SerializerMethodField()
     
     class Meta:
@@ -47,7 +48,7 @@ class SellerReviewSerializer(serializers.ModelSerializer):
         return obj.user.get_full_name()
 
 
-class SellerDetailSerializer(serializers.ModelSerializer):
+class SellerDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     categories = SellerCategorySerializer(many=True, read_only=True)
     tiered_commissions = TieredCommissionSerializer(many=True, read_only=True)
     reviews = serializers.SerializerMethodField()
@@ -13,6 +13,7 @@ from .serializers import (
     SellerWithdrawalSerializer, AdminSellerUpdateSerializer, AdminSellerWithdrawalUpdateSerializer
 )
 from .permissions import IsSellerOwner, IsAdminUser
+from apps.common.serializers import is_field_requested, prefetch_requested
 
 
 class IsSellerOrReadOnly(permissions.BasePermission):
@@ -49,10 +50,20 @@ class SellerViewSet(viewsets.ModelViewSet):
             return AdminSellerUpdateSerializer
         return SellerListSerializer
     
+    # prefetchهای جزئیات فروشنده به تفکیک فیلد؛ فقط برای فیلدهای درخواستی اعمال می‌شوند
+    detail_prefetches = {
+        'categories': ['categories__category'],
+        'tiered_commissions': ['tiered_commissions'],
+    }
+    
     def get_queryset(self):
         queryset = Seller.objects.all()
         if self.action in ['list', 'retrieve']:
             queryset = queryset.filter(status='approved')
+        if self.action == 'list' and is_field_requested(self.request, 'user_full_name'):
+            queryset = queryset.select_related('user')
+        elif self.action == 'retrieve':
+            queryset = prefetch_requested(queryset, self.request, self.detail_prefetches)
         return queryset
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
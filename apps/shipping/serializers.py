@@ -138,12 +138,11 @@ class ShippingCalculatorSerializer(serializers.Serializer):
         cart_id = data.get('cart_id')
         
         # بررسی سبد خرید
-        from apps.orders.models import Cart, CartStatus
-        try:
-            cart = Cart.objects.get(id=cart_id, status=CartStatus.OPEN)
-            data['cart'] = cart
-        except Cart.DoesNotExist:
+        from apps.orders.cart_store import get_cart_store
+        cart = get_cart_store().get(cart_id)
+        if cart is None:
             raise serializers.ValidationError('سبد خرید نامعتبر است')
+        data['cart'] = cart
         
         # بررسی منطقه ارسال
         try:
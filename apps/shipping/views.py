@@ -2,7 +2,7 @@ from rest_framework import viewsets, permissions, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import transaction
-from django.db.models import Sum, F
+from django.db.models import F
 import uuid
 
 from .models import (
@@ -15,6 +15,8 @@ from .serializers import (
     WarehouseTransferSerializer, WarehouseTransferItemSerializer,
     ShippingCalculatorSerializer
 )
+from apps.orders.pricing import shipping_cost
+from apps.products.inventory import NegativeStock, StockMovement, apply_movements, sync_catalog_stock
 from apps.sellers.permissions import IsAdminUser
 
 
@@ -35,30 +37,19 @@ class ShippingCalculatorView(generics.GenericAPIView):
         zone = serializer.validated_data['zone']
         cart = serializer.validated_data['cart']
         
-        # محاسبه مجموع وزن محصولات
-        total_weight = sum(item.product.weight * item.quantity for item in cart.items.all() if item.product.weight)
+        # جمع قیمت و وزن سبد از موتور قیمت‌گذاری
+        pricing = cart.pricing
         
-        # محاسبه مجموع قیمت محصولات
-        cart_total = sum(item.total_price for item in cart.items.all())
+        # نرخ‌های این منطقه برای همه روش‌های ارسال با یک کوئری
+        zone_rates = {rate.shipping_method_id: rate for rate in ShippingRate.objects.filter(zone=zone)}
         
         # دریافت روش‌های ارسال مناسب برای این منطقه
         shipping_methods = []
         
         for method in ShippingMethod.objects.filter(is_active=True):
-            # بررسی وجود نرخ خاص برای این منطقه
-            zone_rate = ShippingRate.objects.filter(shipping_method=method, zone=zone).first()
-            
-            if zone_rate:
-                cost = zone_rate.cost
-                delivery_days = zone_rate.estimated_delivery_days
-            else:
-                cost = method.cost
-                delivery_days = method.estimated_delivery_days
-            
-            # بررسی ارسال رایگان برای خریدهای بالای مبلغ خاص
-            if hasattr(method, 'free_shipping_threshold') and method.free_shipping_threshold:
-                if cart_total >= method.free_shipping_threshold:
-                    cost = 0
+            zone_rate = zone_rates.get(method.id)
+            cost = shipping_cost(pricing, method, zone_rate)
+            delivery_days = zone_rate.estimated_delivery_days if zone_rate else method.estimated_delivery_days
             
             shipping_methods.append({
                 'id': method.id,
@@ -71,8 +62,8 @@ class ShippingCalculatorView(generics.GenericAPIView):
         
         return Response({
             'shipping_methods': shipping_methods,
-            'cart_total': cart_total,
-            'total_weight': total_weight
+            'cart_total': pricing['subtotal'],
+            'total_weight': pricing['total_weight']
         })
 
 
@@ -173,67 +164,28 @@ class WarehouseProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        with transaction.atomic():
-            # دریافت یا ایجاد رکورد موجودی انبار
-            warehouse_product, created = WarehouseProduct.objects.get_or_create(
-                warehouse_id=warehouse_id,
-                product_id=product_id,
-                variant_id=variant_id,
-                defaults={'stock': 0}
-            )
-            
-            previous_stock = warehouse_product.stock
-            warehouse_product.stock += quantity
-            
-            if warehouse_product.stock < 0:
-                return Response(
-                    {'error': 'موجودی نمی‌تواند منفی باشد'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            warehouse_product.save()
-            
-            # ثبت لاگ تغییر موجودی
-            from apps.products.models import ProductInventoryLog
-            ProductInventoryLog.objects.create(
-                product_id=product_id,
-                variant_id=variant_id,
-                previous_stock=previous_stock,
-                new_stock=warehouse_product.stock,
-                warehouse_id=warehouse_id,
-                change_reason=reason,
-                reference=f"MANUAL-{uuid.uuid4().hex[:8]}"
-            )
-            
-            # به‌روزرسانی موجودی کلی محصول
-            if variant_id:
-                from apps.products.models import ProductVariant
-                variant = ProductVariant.objects.get(id=variant_id)
-                total_stock = WarehouseProduct.objects.filter(
-                    product_id=product_id,
-                    variant_id=variant_id
-                ).aggregate(total=Sum('stock'))['total'] or 0
-                
-                variant.stock = total_stock
-                variant.save()
-            else:
-                from apps.products.models import Product
-                product = Product.objects.get(id=product_id)
-                total_stock = WarehouseProduct.objects.filter(
-                    product_id=product_id,
-                    variant_id__isnull=True
-                ).aggregate(total=Sum('stock'))['total'] or 0
+        try:
+            with transaction.atomic():
+                levels = apply_movements([StockMovement(
+                    product_id, variant_id, warehouse_id, delta=quantity, reason=reason, reference=f"MANUAL-{uuid.uuid4().hex[:8]}"
+                )], user=request.user)
                 
-                product.stock = total_stock
-                product.save()
+                # موجودی فروش محصول برابر جمع موجودی انبارهای آن است
+                sync_catalog_stock(product_id, variant_id or None)
+        except NegativeStock:
+            return Response(
+                {'error': 'موجودی نمی‌تواند منفی باشد'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        (new_stock,) = levels.values()
         return Response({
             'status': 'موجودی با موفقیت به‌روزرسانی شد',
             'product_id': product_id,
             'variant_id': variant_id,
             'warehouse_id': warehouse_id,
-            'previous_stock': previous_stock,
-            'new_stock': warehouse_product.stock,
+            'previous_stock': new_stock - quantity,
+            'new_stock': new_stock,
             'change': quantity
         })
 
@@ -272,63 +224,38 @@ class WarehouseTransferViewSet(viewsets.ModelViewSet):
         if new_status not in ['pending', 'in_transit', 'completed', 'cancelled']:
             return Response({'error': 'وضعیت نامعتبر است'}, status=status.HTTP_400_BAD_REQUEST)
         
-        with transaction.atomic():
-            # به‌روزرسانی وضعیت انتقال
-            transfer.status = new_status
-            
-            if notes:
-                transfer.notes = (transfer.notes + "\n\n" + notes).strip()
-            
-            transfer.save()
-            
-            # اگر انتقال تکمیل شده، موجودی انبارها را به‌روزرسانی کنیم
-            if new_status == 'completed':
-                for item in transfer.items.all():
-                    # کاهش موجودی انبار مبدأ
-                    source_product, created = WarehouseProduct.objects.get_or_create(
-                        warehouse=transfer.source_warehouse,
-                        product=item.product,
-                        variant=item.variant,
-                        defaults={'stock': 0}
-                    )
-                    
-                    source_product.stock -= item.quantity
-                    source_product.save()
-                    
-                    # افزایش موجودی انبار مقصد
-                    dest_product, created = WarehouseProduct.objects.get_or_create(
-                        warehouse=transfer.destination_warehouse,
-                        product=item.product,
-                        variant=item.variant,
-                        defaults={'stock': 0}
-                    )
-                    
-                    dest_product.stock += item.quantity
-                    dest_product.save()
-                    
-                    # ثبت لاگ تغییر موجودی برای انبار مبدأ
-                    from apps.products.models import ProductInventoryLog
-                    ProductInventoryLog.objects.create(
-                        product=item.product,
-                        variant=item.variant,
-                        previous_stock=source_product.stock + item.quantity,
-                        new_stock=source_product.stock,
-                        warehouse=transfer.source_warehouse,
-                        change_reason=f'انتقال به انبار {transfer.destination_warehouse.name}',
-                        reference=str(transfer.id)
-                    )
-                    
-                    # ثبت لاگ تغییر موجودی برای انبار مقصد
-                    ProductInventoryLog.objects.create(
-                        product=item.product,
-                        variant=item.variant,
-                        previous_stock=dest_product.stock - item.quantity,
-                        new_stock=dest_product.stock,
-                        warehouse=transfer.destination_warehouse,
-                        change_reason=f'دریافت از انبار {transfer.source_warehouse.name}',
-                        reference=str(transfer.id)
-                    )
-            
-            # اگر انتقال لغو شده، هیچ تغییری در موجودی ایجاد نمی‌کنیم
+        try:
+            with transaction.atomic():
+                # به‌روزرسانی وضعیت انتقال
+                transfer.status = new_status
+                
+                if notes:
+                    transfer.notes = (transfer.notes + "\n\n" + notes).strip()
+                
+                transfer.save()
+                
+                # اگر انتقال تکمیل شده، موجودی انبارها با یک دسته حرکت به‌روزرسانی می‌شود
+                if new_status == 'completed':
+                    source, destination = transfer.source_warehouse, transfer.destination_warehouse
+                    movements = []
+                    for item in transfer.items.all():
+                        movements += [
+                            StockMovement(
+                                item.product_id, item.variant_id, source.pk, -item.quantity,
+                                f'انتقال به انبار {destination.name}', str(transfer.id)
+                            ),
+                            StockMovement(
+                                item.product_id, item.variant_id, destination.pk, item.quantity,
+                                f'دریافت از انبار {source.name}', str(transfer.id)
+                            ),
+                        ]
+                    apply_movements(movements, user=request.user)
+                
+                # اگر انتقال لغو شده، هیچ تغییری در موجودی ایجاد نمی‌کنیم
+        except NegativeStock:
+            return Response(
+                {'error': 'موجودی انبار مبدأ کافی نیست'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         return Response({'status': 'وضعیت انتقال با موفقیت به‌روزرسانی شد'})
\ No newline at end of file
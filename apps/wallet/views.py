@@ -12,11 +12,13 @@ from .serializers import (
     TransferRequestSerializer, WithdrawalRequestSerializer
 )
 from apps.sellers.permissions import IsAdminUser
+from apps.common.pagination import CursorOptInPagination
 
 
 class WalletViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = WalletSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CursorOptInPagination
     
     def get_queryset(self):
         return Wallet.objects.filter(user=self.request.user)
@@ -249,6 +251,7 @@ class AdminWalletTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = WalletTransaction.objects.all().order_by('-created_at')
     serializer_class = WalletTransactionSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = CursorOptInPagination
     
     def get_queryset(self):
         queryset = super().get_queryset()
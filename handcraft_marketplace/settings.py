@@ -1,5 +1,6 @@
 import os
 from datetime import timedelta
+from celery.schedules import crontab
 from decouple import config, Csv
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -113,6 +114,60 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Tehran'
+CELERY_BEAT_SCHEDULE = {
+    'flush-view-buffer': {
+        'task': 'apps.analytics.tasks.flush_view_buffer',
+        'schedule': 60.0,
+    },
+    'rebuild-related-products': {
+        'task': 'apps.products.tasks.rebuild_related_products',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'generate-sitemaps': {
+        'task': 'apps.common.tasks.generate_sitemaps',
+        'schedule': crontab(minute=15),
+    },
+    'persist-idle-carts': {
+        'task': 'apps.orders.tasks.persist_idle_carts',
+        'schedule': crontab(minute='*/10'),
+    },
+    'release-expired-reservations': {
+        'task': 'apps.orders.tasks.release_expired_reservations',
+        'schedule': 60.0,
+    },
+    'sweep-abandoned-carts': {
+        'task': 'apps.orders.tasks.sweep_abandoned_carts',
+        'schedule': crontab(minute=45),
+    },
+}
+
+# نقشه سایت (apps.common.sitemaps)؛ آدرس‌ها با دامنه سایت فروشگاه ساخته می‌شوند
+SITE_URL = config('SITE_URL', default='http://localhost:3000')
+SITEMAP_STORAGE_PATH = 'sitemaps'
+
+# فایل‌های کاتالوگ بزرگ‌تر از این اندازه (بایت) در Celery وارد می‌شوند (apps.products.catalog)
+CATALOG_SYNC_IMPORT_MAX_SIZE = 2 * 1024 * 1024
+
+# قیمت‌گذاری سبد خرید (apps.orders.pricing)
+CART_TAX_RATE = '0.09'
+CART_PRICING_CACHE_TTL = 60 * 15
+
+# محل نگهداری سبدهای باز (apps.orders.cart_store): 'database' یا 'redis'
+CART_BACKEND = config('CART_BACKEND', default='database')
+CART_STORE_TTL = 60 * 60 * 24 * 7
+
+# مهلت پرداخت سفارش پیش از آزاد شدن موجودی رزروشده (apps.orders.reservations)
+STOCK_RESERVATION_TTL = 60 * 30
+
+# رها شدن خودکار سبدهای باز (apps.orders.sweeper)؛ None حذف سبدهای مهمان را غیرفعال می‌کند
+ABANDONED_CART_AFTER = 60 * 60 * 24 * 3
+GUEST_CART_PURGE_AFTER = 60 * 60 * 24 * 30
+CART_SWEEP_BATCH_SIZE = 500
+CART_SWEEP_MAX_BATCHES = 20
+
+# بافر شمارنده بازدید محصولات (apps.analytics.view_buffer)
+VIEW_BUFFER_FLUSH_INTERVAL = 60
+VIEW_BUFFER_MAX_PENDING = 1000
 
 # AWS S3 Configuration
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')